@@ -0,0 +1,172 @@
+"""Answer cache for /ask with exact and near-duplicate question matching"""
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+from retrieval import embed_text, tokenize
+
+# Function words ignored by the lexical guard of the similarity tier
+STOPWORDS = {
+    # English
+    'a', 'an', 'the', 'is', 'are', 'was', 'were', 'be', 'what', 'which', 'when', 'how', 'why',
+    'do', 'does', 'i', 'my', 'me', 'we', 'our', 'of', 'in', 'on', 'for', 'to', 'and', 'or',
+    'with', 'this', 'that', 'it', 'can', 'should', 'about', 'please', 'tell', 'sugarcane', 'crop',
+    # Hindi
+    'क्या', 'है', 'हैं', 'के', 'की', 'का', 'में', 'से', 'को', 'और', 'कैसे', 'कब', 'कौन', 'गन्ने', 'गन्ना',
+    # Marathi
+    'काय', 'आहे', 'आहेत', 'चा', 'ची', 'चे', 'मध्ये', 'कसे', 'कधी', 'ऊस', 'उसाच्या',
+}
+
+
+def normalize_question(question):
+    """Canonical form of a question: NFC, lowercase, punctuation and extra spaces removed"""
+    return " ".join(tokenize(unicodedata.normalize('NFC', question)))
+
+
+def _content_terms(normalized):
+    return {t for t in normalized.split() if t not in STOPWORDS}
+
+
+class AnswerCache:
+    """LRU + TTL answer cache keyed by (language, normalized question)
+
+    A miss on the exact key falls back to a similarity tier: the closest cached question in
+    the same language is served when its embedding cosine is above the threshold and the
+    content words mostly agree (so "ratoon crop" never answers for "plant crop"). Entries
+    remember the knowledge base version they were built from and expire when it changes.
+
+    With a SharedState, exact entries are also written to its `namespace`, so an answer
+    stored by one worker is an exact hit in every other one (and after a restart); the
+    similarity tier covers what this process has seen or fetched from there.
+    """
+
+    def __init__(self, max_entries=1000, ttl_seconds=86400, similarity_threshold=0.8, min_term_overlap=0.75,
+                 shared=None, namespace='answers'):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.min_term_overlap = min_term_overlap
+        self.shared = shared
+        self.namespace = namespace
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {'exact_hits': 0, 'shared_hits': 0, 'similar_hits': 0, 'misses': 0, 'stores': 0,
+                         'invalidations': 0}
+
+    def _expired(self, entry, version, now):
+        return entry['version'] != version or now - entry['created_at'] > self.ttl_seconds
+
+    def get(self, language, question, version):
+        """Return (entry, tier) where tier is "exact" or "similar", or (None, None)"""
+        normalized = normalize_question(question)
+        now = time.time()
+        with self._lock:
+            key = (language, normalized)
+            entry = self._entries.get(key)
+            if entry is not None:
+                if self._expired(entry, version, now):
+                    del self._entries[key]
+                else:
+                    self._entries.move_to_end(key)
+                    self.counters['exact_hits'] += 1
+                    return entry, 'exact'
+
+        entry = self._shared_entry(language, normalized, version, now)
+        with self._lock:
+            if entry is not None:
+                self._remember(language, entry)
+                self.counters['shared_hits'] += 1
+                return entry, 'exact'
+
+            entry = self._closest(language, normalized, version, now)
+            if entry is not None:
+                self._entries.move_to_end((language, entry['question']))
+                self.counters['similar_hits'] += 1
+                return entry, 'similar'
+
+            self.counters['misses'] += 1
+            return None, None
+
+    def _shared_key(self, language, normalized):
+        return f"{language}:{normalized}"
+
+    def _shared_entry(self, language, normalized, version, now):
+        if self.shared is None:
+            return None
+        entry = self.shared.get(self.namespace, self._shared_key(language, normalized))
+        if entry is None:
+            return None
+        if isinstance(entry['version'], list):
+            # Versions may be tuples; JSON brings them back as lists
+            entry['version'] = tuple(entry['version'])
+        if self._expired(entry, version, now):
+            return None
+        return dict(entry, vector=embed_text(normalized))
+
+    def _remember(self, language, entry):
+        key = (language, entry['question'])
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _closest(self, language, normalized, version, now):
+        candidates = [e for (lang, _), e in self._entries.items()
+                      if lang == language and not self._expired(e, version, now)]
+        if not candidates or self.similarity_threshold >= 1:
+            return None
+        sims = np.stack([e['vector'] for e in candidates]) @ embed_text(normalized)
+        best = int(np.argmax(sims))
+        if sims[best] < self.similarity_threshold:
+            return None
+        entry = candidates[best]
+        terms, cached_terms = _content_terms(normalized), _content_terms(entry['question'])
+        union = terms | cached_terms
+        if union and len(terms & cached_terms) / len(union) < self.min_term_overlap:
+            return None
+        return entry
+
+    def put(self, language, question, answer, sources, version, **extra):
+        """Store an answer for a question; extra fields are kept on the entry"""
+        normalized = normalize_question(question)
+        entry = dict(extra)
+        entry.update({
+            'question': normalized,
+            'answer': answer,
+            'sources': sources,
+            'version': version,
+            'created_at': time.time(),
+            'vector': embed_text(normalized),
+        })
+        with self._lock:
+            self._remember(language, entry)
+            self.counters['stores'] += 1
+        self.publish(language, entry)
+
+    def publish(self, language, entry):
+        """Write an entry (again, e.g. after changing it) to the shared exact tier"""
+        if self.shared is None:
+            return
+        remaining = self.ttl_seconds - (time.time() - entry['created_at'])
+        if remaining > 0:
+            self.shared.set(self.namespace, self._shared_key(language, entry['question']),
+                            {k: v for k, v in entry.items() if k != 'vector'}, ttl=remaining)
+
+    def invalidate(self):
+        """Drop every cached answer (knowledge base changed)"""
+        with self._lock:
+            self._entries.clear()
+            self.counters['invalidations'] += 1
+        if self.shared is not None:
+            self.shared.clear(self.namespace)
+
+    def stats(self):
+        """Hit/miss counters and current size"""
+        with self._lock:
+            lookups = sum(self.counters[c] for c in ('exact_hits', 'shared_hits', 'similar_hits', 'misses'))
+            hits = lookups - self.counters['misses']
+            return dict(self.counters, entries=len(self._entries),
+                        hit_rate=round(hits / lookups, 4) if lookups else 0.0)
@@ -1,18 +1,47 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, render_template, request, jsonify, Response, g, has_request_context
 from flask_cors import CORS
-from google import genai
-from google.genai import types
+import asyncio
+import contextvars
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 import os
+import json
 from dotenv import load_dotenv
 from werkzeug.utils import secure_filename
 import logging
-from PIL import Image
-import io
+from lazy_imports import LazyModule
+from retrieval import LocalIndex
+from ingest import ChunkStore, ingest_in_subprocess
+from store_registry import StoreRegistry, file_sha256
+from ingestion_jobs import IngestionQueue
+from blob_store import BlobStore, QuotaExceeded
+from answer_cache import AnswerCache, normalize_question
+from canonical_answers import CanonicalAnswers
+from singleflight import SingleFlight, LeaderGone
+from image_pipeline import normalize_image, InvalidImageError
+from image_cache import PerceptualHashIndex, dhash
+from image_quality import ImageQualityGate
+from model_router import ModelRouter, TIER_FAST, TIER_PRO
+from upstream import UpstreamExecutor, UpstreamBusy
+from resilience import ResilientCaller, CircuitOpen, DeadlineExceeded, deadline, is_transient
+from sessions import SessionStore, estimate_tokens, turn_content
+from metrics import MetricsRegistry, POLL_BUCKETS
+from token_usage import TokenLedger
+from health_probe import ReadinessProber
+from shared_state import SharedState
+from chunked_upload import ChunkedUploads, UploadNotFound, UploadBusy, OffsetMismatch
 
 # Load environment variables
 load_dotenv()
 
+# google.genai is most of the import time and nothing needs it before the first model call;
+# the gunicorn master loads it up front when the app is preloaded (see load_heavy_modules)
+genai = LazyModule("google.genai")
+types = LazyModule("google.genai.types")
+genai_errors = LazyModule("google.genai.errors")
+
 app = Flask(__name__)
 CORS(app)
 
@@ -21,11 +50,144 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Configuration
-app.config['UPLOAD_FOLDER'] = "uploads"
+app.config['UPLOAD_FOLDER'] = os.getenv("UPLOAD_FOLDER", "uploads")
 app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024  # 50MB max file size
-ALLOWED_EXTENSIONS = {'pdf', 'txt', 'doc', 'docx', 'jpg', 'jpeg', 'png'}
+app.config['UPLOAD_QUOTA_BYTES'] = int(os.getenv("UPLOAD_QUOTA_MB", "1024")) * 1024 * 1024  # 0 disables eviction
+# Legacy .doc is refused: the local index has no extractor for it
+ALLOWED_EXTENSIONS = {'pdf', 'txt', 'docx', 'jpg', 'jpeg', 'png'}
 IMAGE_EXTENSIONS = {'jpg', 'jpeg', 'png'}
 
+# Chunked, resumable uploads for files too large to send in one request
+CHUNKED_UPLOAD_MAX_BYTES = int(os.getenv("CHUNKED_UPLOAD_MAX_MB", "200")) * 1024 * 1024
+CHUNKED_UPLOAD_CHUNK_BYTES = int(os.getenv("CHUNKED_UPLOAD_CHUNK_MB", "4")) * 1024 * 1024
+CHUNKED_UPLOAD_TTL = int(os.getenv("CHUNKED_UPLOAD_TTL", str(24 * 3600)))
+
+# Retrieval configuration: "local" answers from the on-disk hybrid index,
+# "remote" attaches the Gemini file search tool to every model call
+KNOWLEDGE_BASE_FOLDER = "knowledge_base"
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "local").lower()
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "4"))
+RETRIEVAL_INDEX_DIR = os.getenv("RETRIEVAL_INDEX_DIR", ".retrieval_index")
+# Extracted, chunked text of knowledge_base/ and uploads/ (see ingest.py)
+CHUNK_STORE_DIR = os.getenv("CHUNK_STORE_DIR", ".chunk_store")
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", "2"))
+
+# File search store identity, shared by all workers through an on-disk registry
+FILE_SEARCH_STORE_NAME = os.getenv("FILE_SEARCH_STORE_NAME", "sugarcane-knowledge-base")
+FILE_SEARCH_REGISTRY_PATH = os.getenv("FILE_SEARCH_REGISTRY_PATH", ".file_search_registry.json")
+
+# State every worker must agree on (store identity, cached answers and analyses, ingestion
+# jobs, rate limits): one SQLite file in WAL mode, see shared_state.py
+SHARED_STATE_PATH = os.getenv("SHARED_STATE_PATH", ".shared_state.db")
+# Model-backed requests per client address and minute, counted across workers (0 disables)
+RATE_LIMIT_PER_MINUTE = int(os.getenv("RATE_LIMIT_PER_MINUTE", "0"))
+RATE_LIMITED_ENDPOINTS = {"ask", "ask_batch", "ask_stream", "analyze_crop_image", "analyze_batch"}
+
+# Background ingestion: uploads return immediately and a bounded pool pushes files to the store
+INGESTION_WORKERS = int(os.getenv("INGESTION_WORKERS", "3"))
+OPERATION_POLL_INITIAL = float(os.getenv("OPERATION_POLL_INITIAL", "0.5"))
+OPERATION_POLL_MAX = float(os.getenv("OPERATION_POLL_MAX", "10"))
+OPERATION_TIMEOUT = float(os.getenv("OPERATION_TIMEOUT", "900"))
+
+# Answer cache for /ask (exact + near-duplicate questions)
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "2000"))
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", str(24 * 3600)))
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.8"))
+
+# Identical questions/photos already in flight wait for that call instead of making their own
+SINGLEFLIGHT_TIMEOUT = float(os.getenv("SINGLEFLIGHT_TIMEOUT", "60"))
+
+# Cross-language reuse: a question already answered in another language is translated, not regenerated
+CANONICAL_ANSWERS = os.getenv("CANONICAL_ANSWERS", "1").lower() in ("1", "true", "yes")
+CANONICAL_SIMILARITY = float(os.getenv("CANONICAL_SIMILARITY", "0.85"))
+
+# Crop photo normalization before the vision model call
+IMAGE_MAX_EDGE = int(os.getenv("IMAGE_MAX_EDGE", "1600"))
+IMAGE_OUTPUT_FORMAT = os.getenv("IMAGE_OUTPUT_FORMAT", "jpeg")
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", "82"))
+
+# Local photo quality gate before the vision model: "enforce" rejects, "report" only measures, "off"
+QUALITY_GATE = os.getenv("QUALITY_GATE", "enforce").lower()
+QUALITY_MIN_EDGE = int(os.getenv("QUALITY_MIN_EDGE", "320"))
+QUALITY_MIN_BRIGHTNESS = float(os.getenv("QUALITY_MIN_BRIGHTNESS", "40"))
+QUALITY_MAX_BRIGHTNESS = float(os.getenv("QUALITY_MAX_BRIGHTNESS", "225"))
+QUALITY_MAX_CLIPPED = float(os.getenv("QUALITY_MAX_CLIPPED", "0.5"))
+QUALITY_MIN_SHARPNESS = float(os.getenv("QUALITY_MIN_SHARPNESS", "30"))
+QUALITY_MIN_VEGETATION = float(os.getenv("QUALITY_MIN_VEGETATION", "0.05"))
+
+# Perceptual-hash cache of previous image analyses (Hamming distance threshold in bits)
+IMAGE_CACHE_THRESHOLD = int(os.getenv("IMAGE_CACHE_THRESHOLD", "6"))
+IMAGE_CACHE_SIZE = int(os.getenv("IMAGE_CACHE_SIZE", "5000"))
+
+# Model tiers and per-endpoint latency budgets (seconds) for routing
+MODEL_FAST = os.getenv("MODEL_FAST", "gemini-2.5-flash")
+MODEL_PRO = os.getenv("MODEL_PRO", "gemini-3-pro-preview")
+LATENCY_BUDGET_ASK = float(os.getenv("LATENCY_BUDGET_ASK", "20"))
+LATENCY_BUDGET_ANALYZE = float(os.getenv("LATENCY_BUDGET_ANALYZE", "45"))
+
+# Upstream concurrency: calls in flight per worker, how many may queue, and for how long
+UPSTREAM_MAX_CONCURRENT = int(os.getenv("UPSTREAM_MAX_CONCURRENT", "32"))
+UPSTREAM_MAX_WAITING = int(os.getenv("UPSTREAM_MAX_WAITING", "256"))
+UPSTREAM_QUEUE_TIMEOUT = float(os.getenv("UPSTREAM_QUEUE_TIMEOUT", "10"))
+
+# Upstream resilience: per-endpoint deadlines (seconds, all calls of a request share one),
+# retries with jittered backoff, hedging after the model's p95 latency and per-model circuit breakers
+UPSTREAM_DEADLINE_ASK = float(os.getenv("UPSTREAM_DEADLINE_ASK", "40"))
+UPSTREAM_DEADLINE_ANALYZE = float(os.getenv("UPSTREAM_DEADLINE_ANALYZE", "75"))
+UPSTREAM_RETRIES = int(os.getenv("UPSTREAM_RETRIES", "2"))
+UPSTREAM_BACKOFF_BASE = float(os.getenv("UPSTREAM_BACKOFF_BASE", "0.5"))
+UPSTREAM_BACKOFF_MAX = float(os.getenv("UPSTREAM_BACKOFF_MAX", "4"))
+UPSTREAM_HEDGE = os.getenv("UPSTREAM_HEDGE", "1").lower() in ("1", "true", "yes")
+UPSTREAM_HEDGE_MIN_DELAY = float(os.getenv("UPSTREAM_HEDGE_MIN_DELAY", "2"))
+BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", "10"))
+BREAKER_FAILURE_RATIO = float(os.getenv("BREAKER_FAILURE_RATIO", "0.5"))
+BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", "30"))
+
+# Output token caps per endpoint (0 leaves the model's default); thinking tokens count against them
+ASK_MAX_OUTPUT_TOKENS = int(os.getenv("ASK_MAX_OUTPUT_TOKENS", "4096"))
+ANALYZE_MAX_OUTPUT_TOKENS = int(os.getenv("ANALYZE_MAX_OUTPUT_TOKENS", "4096"))
+
+# /ask/batch: items per request and how many distinct questions run at once
+ASK_BATCH_MAX_ITEMS = int(os.getenv("ASK_BATCH_MAX_ITEMS", "100"))
+ASK_BATCH_CONCURRENCY = int(os.getenv("ASK_BATCH_CONCURRENCY", "8"))
+
+# /analyze/batch field surveys: photos per request, per model call (count and size) and calls at once
+ANALYZE_BATCH_MAX_IMAGES = int(os.getenv("ANALYZE_BATCH_MAX_IMAGES", "30"))
+ANALYZE_BATCH_GROUP_SIZE = int(os.getenv("ANALYZE_BATCH_GROUP_SIZE", "6"))
+ANALYZE_BATCH_GROUP_BYTES = int(float(os.getenv("ANALYZE_BATCH_GROUP_MB", "12")) * 1024 * 1024)
+ANALYZE_BATCH_CONCURRENCY = int(os.getenv("ANALYZE_BATCH_CONCURRENCY", "3"))
+IMAGE_NORMALIZE_WORKERS = int(os.getenv("IMAGE_NORMALIZE_WORKERS", "4"))
+
+# Metrics: per-worker histogram snapshots merged by /metrics
+METRICS_DIR = os.getenv("METRICS_DIR", ".metrics")
+
+# Readiness prober: provider and store checks run in the background, probes read the cache
+READINESS_INTERVAL = float(os.getenv("READINESS_INTERVAL", "30"))
+READINESS_TIMEOUT = float(os.getenv("READINESS_TIMEOUT", "5"))
+
+# Worker start: with WORKER_START_DEFERRED set (gunicorn preload) background threads and pending
+# ingestion jobs start in each worker's post_fork hook instead of at import
+WORKER_START_DEFERRED = os.getenv("WORKER_START_DEFERRED", "").lower() in ("1", "true", "yes")
+# Open the provider connections in the background as soon as a worker starts
+WARMUP = os.getenv("WARMUP", "1").lower() in ("1", "true", "yes")
+WARMUP_TIMEOUT = float(os.getenv("WARMUP_TIMEOUT", "15"))
+
+# Offline Gemini stand-in for benchmarks (see fake_genai.py); never enable in production
+GENAI_FAKE = os.getenv("GENAI_FAKE", "").lower() in ("1", "true", "yes")
+
+# Multi-turn sessions: history window, summarization and provider context caching of the prefix
+SESSION_DIR = os.getenv("SESSION_DIR", ".sessions")
+SESSION_TTL = int(os.getenv("SESSION_TTL", str(24 * 3600)))
+SESSION_WINDOW_TOKENS = int(os.getenv("SESSION_WINDOW_TOKENS", "6000"))
+SESSION_KEEP_TURNS = int(os.getenv("SESSION_KEEP_TURNS", "4"))
+SESSION_CACHE_TTL = int(os.getenv("SESSION_CACHE_TTL", "900"))
+SESSION_CACHE_REBUILD_TOKENS = int(os.getenv("SESSION_CACHE_REBUILD_TOKENS", "1024"))
+# Providers refuse to cache prefixes below a per-model minimum
+SESSION_CACHE_MIN_TOKENS = {
+    MODEL_FAST: int(os.getenv("SESSION_CACHE_MIN_TOKENS_FAST", "1024")),
+    MODEL_PRO: int(os.getenv("SESSION_CACHE_MIN_TOKENS_PRO", "4096")),
+}
+
 # Language-specific agricultural system instructions
 AGRICULTURAL_INSTRUCTIONS = {
     'english': """You are an expert agricultural advisor specializing in sugarcane cultivation.
@@ -62,60 +224,422 @@ AGRICULTURAL_INSTRUCTIONS = {
     ಮಾರುಕಟ್ಟೆ ಬೆಲೆಗಳು, ಮತ್ತು ಸರ್ಕಾರಿ ಯೋಜನೆಗಳು. ಯಾವಾಗಲೂ ಗೌರವಾನ್ವಿತ ಮತ್ತು ಸಹಾಯಕರಾಗಿರಿ."""
 }
 
-# Initialize Gemini client
-api_key = os.getenv("GOOGLE_API_KEY")
-if not api_key:
-    logger.error("GOOGLE_API_KEY environment variable is not set")
-    raise ValueError("GOOGLE_API_KEY environment variable is not set")
-
-try:
-    client = genai.Client(api_key=api_key)
-    FILE_SEARCH_STORE = client.file_search_stores.create()
-    logger.info(f"Successfully initialized Gemini client and file store: {FILE_SEARCH_STORE.name}")
-except Exception as e:
-    logger.error(f"Failed to initialize Gemini client or file store: {str(e)}")
-    # Set to None - we'll create on first use if needed
-    FILE_SEARCH_STORE = None
-    logger.warning("Application starting without file search store. Will attempt to create on first use.")
+# Task of the crop photo analysis, appended to the language's instructions
+ANALYSIS_TASK = """Analyze this crop image and provide:
+1. Identify the crop (if visible)
+2. Identify any diseases, pests, or health issues
+3. Assess the severity (mild, moderate, severe)
+4. Recommend immediate treatment steps
+5. Suggest preventive measures for the future
+
+If the farmer asked a question about the photo, answer it as part of this.
+Please provide practical, actionable advice in {language} language."""
+
+# Field survey: findings for every photo of one plot (JSON, see SURVEY_FINDINGS_SCHEMA), then a plot summary
+SURVEY_TASK = """You are reviewing numbered photos of sugarcane plants from one surveyed plot.
+For every photo report the crop (if visible), the main disease, pest or health issue ("none" if healthy),
+its severity and the immediate treatment. Use the photo numbers given. Write the text fields in {language} language."""
+SURVEY_SUMMARY_TASK = """Summarize a field survey of one sugarcane plot for an agricultural extension officer:
+the main problems across the plot, how widespread and severe they are, what to do first and what to watch.
+Use at most 200 words, in {language} language."""
+
+# Static instructions travel in the system instruction channel, built once per language
+# (indentation stripped - it is prompt tokens on every call)
+INSTRUCTION_TEXTS = {
+    language: "\n".join(line.strip() for line in text.strip().splitlines())
+    for language, text in AGRICULTURAL_INSTRUCTIONS.items()
+}
+# Plain Content/Schema dicts (validated into types by the call's config), so building them
+# does not import google.genai
+ANSWER_INSTRUCTIONS = {
+    language: {'parts': [{'text': text}]} for language, text in INSTRUCTION_TEXTS.items()
+}
+ANALYSIS_INSTRUCTIONS = {
+    language: {'parts': [{'text': f"{text}\n\n{ANALYSIS_TASK.format(language=language)}"}]}
+    for language, text in INSTRUCTION_TEXTS.items()
+}
+SURVEY_INSTRUCTIONS = {
+    language: {'parts': [{'text': f"{text}\n\n{SURVEY_TASK.format(language=language)}"}]}
+    for language, text in INSTRUCTION_TEXTS.items()
+}
+SURVEY_SUMMARY_INSTRUCTIONS = {
+    language: {'parts': [{'text': f"{text}\n\n{SURVEY_SUMMARY_TASK.format(language=language)}"}]}
+    for language, text in INSTRUCTION_TEXTS.items()
+}
+SURVEY_FINDINGS_SCHEMA = {
+    'type': 'OBJECT',
+    'properties': {'findings': {
+        'type': 'ARRAY',
+        'items': {
+            'type': 'OBJECT',
+            'properties': {
+                'photo': {'type': 'INTEGER'},
+                'crop': {'type': 'STRING'},
+                'issue': {'type': 'STRING'},
+                'severity': {'type': 'STRING', 'enum': ['none', 'mild', 'moderate', 'severe']},
+                'treatment': {'type': 'STRING'},
+            },
+            'required': ['photo', 'issue', 'severity']
+        }
+    }},
+    'required': ['findings']
+}
+
+# Lead-in of a degraded answer (knowledge base excerpts only) while the model is unavailable
+DEGRADED_NOTICES = {
+    'english': "Our advisor is busy right now. Here is what our knowledge base says about your question. "
+               "Please ask again in a few minutes for a full answer.",
+    'hindi': "हमारे सलाहकार अभी व्यस्त हैं। आपके प्रश्न के बारे में हमारी जानकारी में यह मिला है। "
+             "पूरे उत्तर के लिए कुछ मिनट बाद फिर से पूछें।",
+    'marathi': "आमचे सल्लागार सध्या व्यस्त आहेत. तुमच्या प्रश्नाबद्दल आमच्या माहितीत हे सापडले. "
+               "पूर्ण उत्तरासाठी काही मिनिटांनी पुन्हा विचारा.",
+    'tamil': "எங்கள் ஆலோசகர் இப்போது பிஸியாக உள்ளார். உங்கள் கேள்வி பற்றி எங்கள் தகவல் தொகுப்பில் உள்ளது இது. "
+             "முழு பதிலுக்கு சில நிமிடங்களில் மீண்டும் கேளுங்கள்.",
+    'telugu': "మా సలహాదారు ఇప్పుడు బిజీగా ఉన్నారు. మీ ప్రశ్న గురించి మా సమాచారంలో ఉన్నది ఇది. "
+              "పూర్తి సమాధానం కోసం కొన్ని నిమిషాల తర్వాత మళ్ళీ అడగండి.",
+    'kannada': "ನಮ್ಮ ಸಲಹೆಗಾರರು ಈಗ ಕಾರ್ಯನಿರತರಾಗಿದ್ದಾರೆ. ನಿಮ್ಮ ಪ್ರಶ್ನೆಯ ಬಗ್ಗೆ ನಮ್ಮ ಮಾಹಿತಿಯಲ್ಲಿ ಇದು ಇದೆ. "
+               "ಪೂರ್ಣ ಉತ್ತರಕ್ಕಾಗಿ ಕೆಲವು ನಿಮಿಷಗಳ ನಂತರ ಮತ್ತೆ ಕೇಳಿ.",
+}
+DEGRADED_EXCERPTS = 3
+
+# Retake advice for a photo rejected by the quality gate, by the first check it failed
+RETAKE_MESSAGES = {
+    'english': {
+        'resolution': "This photo is too small to see the problem clearly. Please move closer to the leaf and take it again.",
+        'exposure_dark': "This photo is too dark. Please take it again in daylight, without your shadow on the leaf.",
+        'exposure_bright': "This photo is too bright. Please take it again away from direct sun glare.",
+        'sharpness': "This photo is blurry. Please hold the phone steady, tap the leaf on the screen to focus, and take it again.",
+        'vegetation': "We could not find a plant in this photo. Please take a photo of the affected sugarcane leaf, stem or plant.",
+    },
+    'hindi': {
+        'resolution': "यह फोटो बहुत छोटी है, समस्या साफ नहीं दिखती। कृपया पत्ती के पास जाकर फिर से फोटो लें।",
+        'exposure_dark': "यह फोटो बहुत अंधेरी है। कृपया दिन की रोशनी में, पत्ती पर छाया डाले बिना, फिर से फोटो लें।",
+        'exposure_bright': "यह फोटो बहुत ज्यादा चमकीली है। कृपया तेज धूप की चमक से बचकर फिर से फोटो लें।",
+        'sharpness': "यह फोटो धुंधली है। कृपया फोन स्थिर रखें, स्क्रीन पर पत्ती को छूकर फोकस करें और फिर से फोटो लें।",
+        'vegetation': "इस फोटो में पौधा नहीं दिखा। कृपया गन्ने की प्रभावित पत्ती, तने या पौधे की फोटो लें।",
+    },
+    'marathi': {
+        'resolution': "हा फोटो खूप लहान आहे, समस्या स्पष्ट दिसत नाही. कृपया पानाजवळ जाऊन पुन्हा फोटो काढा.",
+        'exposure_dark': "हा फोटो खूप अंधारा आहे. कृपया दिवसाच्या उजेडात, पानावर सावली न पाडता पुन्हा फोटो काढा.",
+        'exposure_bright': "हा फोटो खूप उजळ आहे. कृपया थेट उन्हाची चमक टाळून पुन्हा फोटो काढा.",
+        'sharpness': "हा फोटो अस्पष्ट आहे. कृपया फोन स्थिर धरा, स्क्रीनवर पानाला स्पर्श करून फोकस करा आणि पुन्हा फोटो काढा.",
+        'vegetation': "या फोटोमध्ये झाड दिसले नाही. कृपया उसाच्या बाधित पानाचा, खोडाचा किंवा रोपाचा फोटो काढा.",
+    },
+    'tamil': {
+        'resolution': "இந்த புகைப்படம் மிகவும் சிறியது, பிரச்சனை தெளிவாகத் தெரியவில்லை. இலைக்கு அருகில் சென்று மீண்டும் எடுக்கவும்.",
+        'exposure_dark': "இந்த புகைப்படம் மிகவும் இருட்டாக உள்ளது. பகல் வெளிச்சத்தில், இலை மீது நிழல் விழாமல் மீண்டும் எடுக்கவும்.",
+        'exposure_bright': "இந்த புகைப்படம் மிகவும் பிரகாசமாக உள்ளது. நேரடி சூரிய ஒளியைத் தவிர்த்து மீண்டும் எடுக்கவும்.",
+        'sharpness': "இந்த புகைப்படம் மங்கலாக உள்ளது. தொலைபேசியை அசையாமல் பிடித்து, திரையில் இலையைத் தொட்டு ஃபோகஸ் செய்து மீண்டும் எடுக்கவும்.",
+        'vegetation': "இந்த புகைப்படத்தில் செடி தெரியவில்லை. பாதிக்கப்பட்ட கரும்பு இலை, தண்டு அல்லது செடியை புகைப்படம் எடுக்கவும்.",
+    },
+    'telugu': {
+        'resolution': "ఈ ఫోటో చాలా చిన్నది, సమస్య స్పష్టంగా కనిపించడం లేదు. ఆకుకు దగ్గరగా వెళ్లి మళ్ళీ ఫోటో తీయండి.",
+        'exposure_dark': "ఈ ఫోటో చాలా చీకటిగా ఉంది. పగటి వెలుతురులో, ఆకుపై నీడ పడకుండా మళ్ళీ ఫోటో తీయండి.",
+        'exposure_bright': "ఈ ఫోటో చాలా ప్రకాశవంతంగా ఉంది. నేరుగా ఎండ మెరుపు పడకుండా మళ్ళీ ఫోటో తీయండి.",
+        'sharpness': "ఈ ఫోటో మసకగా ఉంది. ఫోన్‌ను కదలకుండా పట్టుకుని, స్క్రీన్‌పై ఆకును తాకి ఫోకస్ చేసి మళ్ళీ తీయండి.",
+        'vegetation': "ఈ ఫోటోలో మొక్క కనిపించలేదు. ప్రభావిత చెరకు ఆకు, కాండం లేదా మొక్క ఫోటో తీయండి.",
+    },
+    'kannada': {
+        'resolution': "ಈ ಫೋಟೋ ತುಂಬಾ ಚಿಕ್ಕದಾಗಿದೆ, ಸಮಸ್ಯೆ ಸ್ಪಷ್ಟವಾಗಿ ಕಾಣುತ್ತಿಲ್ಲ. ಎಲೆಯ ಹತ್ತಿರ ಹೋಗಿ ಮತ್ತೆ ಫೋಟೋ ತೆಗೆಯಿರಿ.",
+        'exposure_dark': "ಈ ಫೋಟೋ ತುಂಬಾ ಕತ್ತಲಾಗಿದೆ. ಹಗಲಿನ ಬೆಳಕಿನಲ್ಲಿ, ಎಲೆಯ ಮೇಲೆ ನೆರಳು ಬೀಳದಂತೆ ಮತ್ತೆ ಫೋಟೋ ತೆಗೆಯಿರಿ.",
+        'exposure_bright': "ಈ ಫೋಟೋ ತುಂಬಾ ಪ್ರಕಾಶಮಾನವಾಗಿದೆ. ನೇರ ಬಿಸಿಲಿನ ಹೊಳಪನ್ನು ತಪ್ಪಿಸಿ ಮತ್ತೆ ಫೋಟೋ ತೆಗೆಯಿರಿ.",
+        'sharpness': "ಈ ಫೋಟೋ ಮಸುಕಾಗಿದೆ. ಫೋನ್ ಅನ್ನು ಸ್ಥಿರವಾಗಿ ಹಿಡಿದು, ಪರದೆಯ ಮೇಲೆ ಎಲೆಯನ್ನು ಸ್ಪರ್ಶಿಸಿ ಫೋಕಸ್ ಮಾಡಿ ಮತ್ತೆ ತೆಗೆಯಿರಿ.",
+        'vegetation': "ಈ ಫೋಟೋದಲ್ಲಿ ಗಿಡ ಕಾಣಲಿಲ್ಲ. ಬಾಧಿತ ಕಬ್ಬಿನ ಎಲೆ, ಕಾಂಡ ಅಥವಾ ಗಿಡದ ಫೋಟೋ ತೆಗೆಯಿರಿ.",
+    },
+}
+DEGRADED_EXCERPT_CHARS = 600
+
+# Gemini client, created on first use in each process (GENAI_FAKE=1 swaps in the offline
+# stand-in used by benchmark.py). Its HTTP connection pools must not cross a fork.
+if GENAI_FAKE:
+    logger.warning("GENAI_FAKE is set: Gemini calls are answered by the offline stand-in")
+else:
+    api_key = os.getenv("GOOGLE_API_KEY")
+    if not api_key:
+        logger.error("GOOGLE_API_KEY environment variable is not set")
+        raise ValueError("GOOGLE_API_KEY environment variable is not set")
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+def get_client():
+    """This process's Gemini client"""
+    global _client, _client_pid
+    if _client is not None and _client_pid == os.getpid():
+        return _client
+    with _client_lock:
+        if _client is None or _client_pid != os.getpid():
+            if GENAI_FAKE:
+                # Through the deferred-import lock first: fake_genai imports google.genai directly
+                genai.load()
+                from fake_genai import FakeClient
+                _client = FakeClient(
+                    latency_median=float(os.getenv("GENAI_FAKE_LATENCY", "0.8")),
+                    latency_sigma=float(os.getenv("GENAI_FAKE_LATENCY_SIGMA", "0.5")),
+                    failure_rate=float(os.getenv("GENAI_FAKE_FAILURE_RATE", "0")),
+                    upload_seconds=float(os.getenv("GENAI_FAKE_UPLOAD_SECONDS", "2")),
+                    seed=int(os.environ["GENAI_FAKE_SEED"]) if os.getenv("GENAI_FAKE_SEED") else None
+                )
+            else:
+                _client = genai.Client(api_key=api_key)
+            _client_pid = os.getpid()
+        return _client
+
+shared_state = SharedState(SHARED_STATE_PATH)
+
+# The store is reattached through the registry (no remote call) or created on first use;
+# its identity is then kept in shared state so every worker uses the same one
+store_registry = StoreRegistry(FILE_SEARCH_REGISTRY_PATH)
+
+# Content-addressed upload storage (uploads/blobs/ + uploads/manifest.json);
+# files that pending ingestion jobs still have to read are never evicted
+blob_store = BlobStore(
+    app.config['UPLOAD_FOLDER'],
+    quota_bytes=app.config['UPLOAD_QUOTA_BYTES'],
+    in_use=lambda: ingestion_queue.pending_digests()
+)
+# Partial chunked uploads live next to the blobs so finalizing is a rename
+chunked_uploads = ChunkedUploads(
+    os.path.join(app.config['UPLOAD_FOLDER'], '.partial'),
+    max_bytes=CHUNKED_UPLOAD_MAX_BYTES,
+    chunk_bytes=CHUNKED_UPLOAD_CHUNK_BYTES,
+    ttl_seconds=CHUNKED_UPLOAD_TTL
+)
+
+# Local retrieval index over the chunk store built from knowledge_base/<category>/ and uploads/
+retrieval_index = LocalIndex(
+    RETRIEVAL_INDEX_DIR,
+    chunk_store=ChunkStore(CHUNK_STORE_DIR),
+    title_for=blob_store.title_for_path
+)
+
+answer_cache = AnswerCache(
+    max_entries=ANSWER_CACHE_SIZE,
+    ttl_seconds=ANSWER_CACHE_TTL,
+    similarity_threshold=ANSWER_CACHE_SIMILARITY,
+    shared=shared_state
+)
+canonical_answers = CanonicalAnswers(
+    max_entries=ANSWER_CACHE_SIZE,
+    ttl_seconds=ANSWER_CACHE_TTL,
+    similarity_threshold=CANONICAL_SIMILARITY,
+    shared=shared_state
+)
+ask_flights = SingleFlight("ask", timeout=SINGLEFLIGHT_TIMEOUT)
+analyze_flights = SingleFlight("analyze", timeout=SINGLEFLIGHT_TIMEOUT)
+image_cache = PerceptualHashIndex(shared_state, threshold=IMAGE_CACHE_THRESHOLD, max_entries=IMAGE_CACHE_SIZE)
+# Decoding and resizing release the GIL, so survey photos are normalized side by side
+image_workers = ThreadPoolExecutor(max_workers=IMAGE_NORMALIZE_WORKERS, thread_name_prefix='normalize')
+metrics = MetricsRegistry(METRICS_DIR)
+metrics.histogram('upload_operation_polls', 'Operation polls until a file search upload finished', POLL_BUCKETS)
+token_ledger = TokenLedger(metrics)
+quality_gate = None if QUALITY_GATE == "off" else ImageQualityGate(
+    metrics,
+    enforce=QUALITY_GATE == "enforce",
+    min_edge=QUALITY_MIN_EDGE,
+    min_brightness=QUALITY_MIN_BRIGHTNESS,
+    max_brightness=QUALITY_MAX_BRIGHTNESS,
+    max_clipped=QUALITY_MAX_CLIPPED,
+    min_sharpness=QUALITY_MIN_SHARPNESS,
+    min_vegetation=QUALITY_MIN_VEGETATION
+)
+session_store = SessionStore(
+    SESSION_DIR,
+    ttl_seconds=SESSION_TTL,
+    window_tokens=SESSION_WINDOW_TOKENS,
+    keep_turns=SESSION_KEEP_TURNS
+)
+upstream = UpstreamExecutor(
+    max_concurrent=UPSTREAM_MAX_CONCURRENT,
+    max_waiting=UPSTREAM_MAX_WAITING,
+    queue_timeout=UPSTREAM_QUEUE_TIMEOUT
+)
+resilient = ResilientCaller(
+    default_deadline=UPSTREAM_DEADLINE_ASK,
+    retries=UPSTREAM_RETRIES,
+    backoff_base=UPSTREAM_BACKOFF_BASE,
+    backoff_max=UPSTREAM_BACKOFF_MAX,
+    hedge=UPSTREAM_HEDGE,
+    hedge_min_delay=UPSTREAM_HEDGE_MIN_DELAY,
+    breaker_min_calls=BREAKER_MIN_CALLS,
+    breaker_failure_ratio=BREAKER_FAILURE_RATIO,
+    breaker_open_seconds=BREAKER_OPEN_SECONDS
+)
+model_router = ModelRouter(
+    models={'fast': MODEL_FAST, 'pro': MODEL_PRO},
+    budgets={'ask': LATENCY_BUDGET_ASK, 'analyze': LATENCY_BUDGET_ANALYZE}
+)
 
 def allowed_file(filename):
     """Check if file extension is allowed"""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def stage(name):
+    """Timing span for the current request (no-op outside a request)"""
+    timer = g.get("timer") if has_request_context() else None
+    return timer.span(name) if timer else nullcontext()
+
+def label_request(language=None, model=None):
+    """Attach language/model labels to the current request's metrics"""
+    timer = g.get("timer") if has_request_context() else None
+    if timer:
+        # Unknown languages share one label so user input cannot add series
+        if language is not None and language not in AGRICULTURAL_INSTRUCTIONS:
+            language = "other"
+        timer.label(language=language, model=model)
+
+# Metrics timer for tasks of streamed responses, whose generators run without a request context
+stream_timer = contextvars.ContextVar('stream_timer', default=None)
+
+def timer_context(timer):
+    """A fresh context for one task of a streamed response, carrying its request's timer"""
+    context = contextvars.copy_context()
+    context.run(stream_timer.set, timer)
+    return context
+
+def record_usage(model, usage_metadata, timer=None):
+    """Count one model call's tokens under the request's endpoint and language, and log them"""
+    timer = timer or (g.get("timer") if has_request_context() else stream_timer.get())
+    endpoint = timer.endpoint if timer else "background"
+    language = timer.labels['language'] if timer else ""
+    counts = token_ledger.record(endpoint, language, model, usage_metadata)
+    if counts is None:
+        return
+    if timer:
+        timer.add_tokens(counts)
+    logger.info(f"Tokens endpoint={endpoint} language={language or '-'} model={model} "
+                f"prompt={counts['prompt']} cached={counts['cached']} output={counts['output']} "
+                f"thoughts={counts['thoughts']}")
+
+def current_file_search_store():
+    """The store every worker uses now, from shared state, or None before first use"""
+    store = shared_state.get("file_search_store", FILE_SEARCH_STORE_NAME)
+    if store is None:
+        return None
+    return types.FileSearchStore(name=store['name'], display_name=FILE_SEARCH_STORE_NAME)
+
+def forget_file_search_store():
+    """Drop the store identity everywhere (it was deleted remotely); the next use recreates it"""
+    store_registry.forget(FILE_SEARCH_STORE_NAME)
+    shared_state.delete("file_search_store", FILE_SEARCH_STORE_NAME)
+
 def ensure_file_search_store():
-    """Ensure file search store exists, create if needed"""
-    global FILE_SEARCH_STORE
-    if FILE_SEARCH_STORE is None:
-        try:
-            FILE_SEARCH_STORE = client.file_search_stores.create()
-            logger.info(f"Created new file search store: {FILE_SEARCH_STORE.name}")
-        except Exception as e:
-            logger.error(f"Failed to create file search store: {str(e)}")
-            raise
-    return FILE_SEARCH_STORE
+    """Ensure file search store exists, reattaching through the registry or creating it"""
+    store = current_file_search_store()
+    if store is not None:
+        return store
+    try:
+        with stage("file_store"):
+            store = store_registry.get_or_create(get_client(), FILE_SEARCH_STORE_NAME)
+    except Exception as e:
+        logger.error(f"Failed to create file search store: {str(e)}")
+        raise
+    shared_state.set("file_search_store", FILE_SEARCH_STORE_NAME, {"name": store.name})
+    return store
 
-def upload_file_to_store(file_path):
-    """Upload file to Gemini file search store with error handling"""
+def retrieve_context(query, categories=None):
+    """Return (prompt context block, source titles) from the local retrieval index"""
     try:
-        store = ensure_file_search_store()
-        logger.info(f"Uploading file to store: {file_path}")
-        
-        upload_op = client.file_search_stores.upload_to_file_search_store(
-            file_search_store_name=store.name,
-            file=file_path
+        with stage("retrieval"):
+            hits = retrieval_index.search(query, k=RETRIEVAL_TOP_K, categories=categories)
+    except Exception as e:
+        logger.error(f"Local retrieval failed: {str(e)}")
+        return "", []
+
+    if not hits:
+        return "", []
+
+    excerpts = "\n\n".join(f"[{i}] ({hit['category']}) {hit['title']}:\n{hit['text']}" for i, hit in enumerate(hits, 1))
+    context = f"Reference material from the knowledge base (use it when relevant):\n{excerpts}"
+    sources = list(dict.fromkeys(hit['title'] for hit in hits))
+    return context, sources
+
+def knowledge_base_version():
+    """Version stamp of the documents answers are grounded on (cached answers expire when it changes)"""
+    version = retrieval_index.stats()['generation']
+    if RETRIEVAL_MODE == "remote":
+        return (version, store_registry.indexed_count(FILE_SEARCH_STORE_NAME))
+    return version
+
+def file_search_tools():
+    """Tools for the model call - only the remote retrieval mode attaches file search"""
+    if RETRIEVAL_MODE != "remote":
+        return None
+    store = ensure_file_search_store()
+    return [types.Tool(
+        file_search=types.FileSearch(
+            file_search_store_names=[store.name]
         )
-        
+    )]
+
+def wait_for_operation(operation, progress=None):
+    """Poll a long-running operation with exponential backoff until done or OPERATION_TIMEOUT"""
+    delay = OPERATION_POLL_INITIAL
+    deadline = time.monotonic() + OPERATION_TIMEOUT
+    polls = 0
+    while not operation.done:
+        if time.monotonic() + delay > deadline:
+            raise TimeoutError(f"Operation {operation.name} did not finish within {OPERATION_TIMEOUT:.0f}s")
+        time.sleep(delay)
+        delay = min(delay * 1.6, OPERATION_POLL_MAX)
+        operation = get_client().operations.get(operation)
+        polls += 1
+        if progress:
+            progress(stage='indexing', polls=polls)
+    metrics.observe('upload_operation_polls', polls)
+    return operation
+
+def upload_file_to_store(file_path, progress=None, digest=None, display_name=None):
+    """Upload file to Gemini file search store with error handling, skipping already indexed content"""
+    timer = metrics.timer("ingestion")
+    outcome = "failed"
+    try:
+        with timer.span("hash"):
+            digest = digest or file_sha256(file_path)
+        display_name = display_name or os.path.basename(file_path)
+        if store_registry.is_indexed(FILE_SEARCH_STORE_NAME, digest):
+            logger.info(f"Skipping {file_path}: identical content already indexed")
+            outcome = "skipped"
+            return True
+
+        with timer.span("file_store"):
+            store = ensure_file_search_store()
+        logger.info(f"Uploading file to store: {file_path}")
+        if progress:
+            progress(stage='uploading')
+
+        with timer.span("upload"):
+            try:
+                upload_op = get_client().file_search_stores.upload_to_file_search_store(
+                    file_search_store_name=store.name,
+                    file=file_path,
+                    config={'display_name': display_name}
+                )
+            except genai_errors.ClientError as e:
+                if e.code != 404:
+                    raise
+                # Registered store was deleted remotely - recreate it and retry once
+                forget_file_search_store()
+                store = ensure_file_search_store()
+                upload_op = get_client().file_search_stores.upload_to_file_search_store(
+                    file_search_store_name=store.name,
+                    file=file_path,
+                    config={'display_name': display_name}
+                )
+
         # Wait for upload to complete - handle different operation object structures
         try:
-            while not upload_op.done:
-                time.sleep(2)
-                upload_op = client.operations.get(upload_op.name)
+            with timer.span("indexing"):
+                wait_for_operation(upload_op, progress)
         except AttributeError:
             # If operation doesn't have expected attributes, assume it completed
             logger.warning(f"Could not track upload completion for {file_path}, assuming success")
             time.sleep(3)  # Give it a moment to complete
-        
+
+        store_registry.mark_indexed(FILE_SEARCH_STORE_NAME, digest, display_name)
         logger.info(f"Successfully uploaded file: {file_path}")
+        outcome = "succeeded"
         return True
     except Exception as e:
         logger.error(f"Error uploading file {file_path}: {str(e)}")
@@ -123,37 +647,213 @@ def upload_file_to_store(file_path):
         traceback.print_exc()
         # Don't raise - allow upload to continue even if file search fails
         return False
+    finally:
+        timer.finish(outcome)
+
+def refresh_local_index():
+    """Extract and re-index changed documents so new text is searchable; False when it failed
+
+    Runs off the request path: at worker start and in each upload's ingestion job.
+    """
+    try:
+        summary = ingest_in_subprocess(KNOWLEDGE_BASE_FOLDER, app.config['UPLOAD_FOLDER'], CHUNK_STORE_DIR,
+                                       workers=EXTRACTION_WORKERS)
+        changes = retrieval_index.refresh()
+        if any(changes[k] for k in ('added', 'changed', 'removed')):
+            answer_cache.invalidate()
+            canonical_answers.invalidate()
+        logger.info(f"Local index up to date: {summary['files']} documents, {changes['chunks']} chunks "
+                    f"({summary['seconds']}s extraction)")
+        return True
+    except Exception as e:
+        logger.error(f"Failed to refresh local retrieval index: {str(e)}")
+        return False
+
+def run_ingestion_job(job, report):
+    """Ingestion queue handler: index one saved upload locally, then push it to the file search store"""
+    if not os.path.exists(job['path']):
+        raise FileNotFoundError(f"Uploaded file is missing: {job['filename']}")
+    if job.get('digest'):
+        blob_store.touch(job['digest'])
+    report(stage='extracting')
+    report(local_index='ready' if refresh_local_index() else 'failed')
+    if not upload_file_to_store(job['path'], progress=report, digest=job.get('digest'),
+                                display_name=job['filename']):
+        raise RuntimeError("Upload to file search store failed")
+
+ingestion_queue = IngestionQueue(shared_state, run_ingestion_job, max_workers=INGESTION_WORKERS)
+
+def check_gemini():
+    """Provider reachability: fetch the fast model's metadata"""
+    return get_client().models.get(model=MODEL_FAST).name
+
+def check_file_store():
+    """File search store state - never creates a store"""
+    store = current_file_search_store() or store_registry.lookup(FILE_SEARCH_STORE_NAME)
+    if store is None:
+        return "not created yet (created on first use)"
+    if RETRIEVAL_MODE == "remote":
+        get_client().file_search_stores.get(name=store.name)
+    return f"{store.name}, {store_registry.indexed_count(FILE_SEARCH_STORE_NAME)} documents"
+
+def check_retrieval_index():
+    """Local index is loaded"""
+    stats = retrieval_index.stats()
+    return f"{stats['chunks']} chunks from {stats['files']} files"
+
+readiness = ReadinessProber(
+    {"gemini": check_gemini, "file_store": check_file_store, "retrieval_index": check_retrieval_index},
+    interval=READINESS_INTERVAL,
+    timeout=READINESS_TIMEOUT
+)
+
+def load_heavy_modules():
+    """Import what the first model call would (google.genai and its types)
+
+    Called in the gunicorn master when the app is preloaded, so every forked worker
+    shares the imported modules instead of importing them on its first request.
+    """
+    start = time.monotonic()
+    for module in (genai, types, genai_errors):
+        module.load()
+    logger.info(f"Loaded google.genai in {time.monotonic() - start:.2f}s")
+
+def warm_up():
+    """Create this process's client and open its async connection pool with one cheap call"""
+    start = time.monotonic()
+    try:
+        # The aio client's pool lives on the upstream event loop, where model calls run
+        upstream.submit(lambda: get_client().aio.models.get(model=MODEL_FAST)).result(WARMUP_TIMEOUT)
+        logger.info(f"Worker {os.getpid()} warmed up in {time.monotonic() - start:.2f}s")
+    except Exception as e:
+        logger.warning(f"Warm-up call failed after {time.monotonic() - start:.2f}s: {str(e)}")
+
+_worker_pid = None
+
+def start_worker():
+    """Start this process's background work: readiness probes, local index refresh, pending jobs, warm-up
+
+    Runs at import, or from gunicorn's post_fork hook when the app is preloaded in the
+    master - threads, event loops and sockets do not survive fork(). Once per process.
+    """
+    global _worker_pid
+    if _worker_pid == os.getpid():
+        return
+    _worker_pid = os.getpid()
+    readiness.ensure_started()
+    # Requests are served from the persisted index until the refresh has caught up
+    threading.Thread(target=refresh_local_index, name='index-refresh', daemon=True).start()
+    try:
+        ingestion_queue.resume()
+    except Exception as e:
+        logger.error(f"Failed to resume pending ingestion jobs: {str(e)}")
+    if WARMUP:
+        threading.Thread(target=warm_up, name='warm-up', daemon=True).start()
+
+if not WORKER_START_DEFERRED:
+    start_worker()
+
+@app.before_request
+def start_request_timer():
+    """Start collecting stage timings for this request"""
+    if request.endpoint not in (None, "static", "metrics_endpoint", "livez", "readyz"):
+        g.timer = metrics.timer(request.endpoint)
+
+def client_address():
+    """The caller's address: the X-Forwarded-For hop added by the platform's proxy, else the peer"""
+    route = request.access_route
+    return route[-1] if route else (request.remote_addr or "unknown")
+
+@app.before_request
+def enforce_rate_limit():
+    """Fixed one-minute window per client on the model-backed endpoints, counted across workers"""
+    if not RATE_LIMIT_PER_MINUTE or request.endpoint not in RATE_LIMITED_ENDPOINTS:
+        return None
+    client = client_address()
+    count = shared_state.incr("rate_limits", client, ttl=60)
+    if count <= RATE_LIMIT_PER_MINUTE:
+        return None
+    retry_after = max(1, int(shared_state.expires_in("rate_limits", client) or 60) + 1)
+    logger.warning(f"Rate limited {client}: request {count} this minute (limit {RATE_LIMIT_PER_MINUTE})")
+    response = jsonify({"error": "Too many requests, please retry shortly", "retry_after": retry_after})
+    response.status_code = 429
+    response.headers["Retry-After"] = str(retry_after)
+    return response
+
+@app.after_request
+def finish_request_timer(response):
+    """Record stage histograms and expose them in a Server-Timing header"""
+    timer = g.pop("timer", None)
+    if timer is None:
+        return response
+    if response.is_streamed:
+        # Stages of a stream happen after this hook; record once the body is sent
+        response.headers["Server-Timing"] = timer.server_timing()
+        response.call_on_close(lambda: timer.finish(response.status_code))
+    else:
+        response.headers["Server-Timing"] = timer.server_timing(timer.finish(response.status_code))
+        if timer.tokens:
+            response.headers["X-Token-Usage"] = ", ".join(f"{kind}={count}" for kind, count in timer.tokens.items())
+    return response
+
+@app.route("/metrics")
+def metrics_endpoint():
+    """Prometheus metrics: request and stage duration histograms from all workers"""
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
 
 @app.route("/")
 def index():
     return render_template("index.html")
 
-@app.route("/health")
-def health():
-    """Health check endpoint for monitoring"""
-    try:
-        # Check if API key is set
-        if not os.getenv("GOOGLE_API_KEY"):
-            return jsonify({
-                "status": "unhealthy",
-                "error": "GOOGLE_API_KEY not configured"
-            }), 500
+@app.route("/livez")
+def livez():
+    """Liveness: the worker can serve requests (no I/O at all)"""
+    return jsonify({"status": "alive"}), 200
 
-        # Check if file store is initialized
-        store = ensure_file_search_store()
+@app.route("/readyz")
+def readyz():
+    """Readiness from the background prober's last result (no provider call here)"""
+    readiness.ensure_started()
+    status = readiness.status()
+    return jsonify(dict(status, status="ready" if status['ready'] else "not ready")), \
+        200 if status['ready'] else 503
 
-        return jsonify({
-            "status": "healthy",
-            "gemini_api": "connected",
-            "file_store": "initialized"
-        }), 200
-    except Exception as e:
-        logger.error(f"Health check failed: {str(e)}")
+@app.route("/health")
+def health():
+    """Health check endpoint for monitoring, answered from the cached readiness probe"""
+    # Check if API key is set
+    if not GENAI_FAKE and not os.getenv("GOOGLE_API_KEY"):
         return jsonify({
             "status": "unhealthy",
-            "error": str(e)
+            "error": "GOOGLE_API_KEY not configured"
         }), 500
 
+    readiness.ensure_started()
+    status = readiness.status()
+    if status['checked_at'] is None:
+        return jsonify({"status": "starting"}), 503
+
+    checks = status['checks']
+    gemini_ok = checks.get("gemini", {}).get("ok")
+    store_ok = checks.get("file_store", {}).get("ok")
+    return jsonify({
+        "status": "healthy" if status['ready'] else "unhealthy",
+        "gemini_api": "connected" if gemini_ok else "unreachable",
+        "file_store": checks.get("file_store", {}).get("detail") if store_ok else "unavailable",
+        "checked_at": status['checked_at'],
+        "age_seconds": status['age_seconds']
+    }), 200 if status['ready'] else 500
+
+def enqueue_stored_upload(filename, digest, file_path, is_new):
+    """Queue ingestion for a stored upload unless identical content is already indexed"""
+    if not is_new and store_registry.is_indexed(FILE_SEARCH_STORE_NAME, digest):
+        logger.info(f"Duplicate upload skipped: {filename} ({digest[:12]})")
+        return {"id": None, "filename": filename, "status": "duplicate"}
+    with stage("enqueue"):
+        job = ingestion_queue.submit(filename, file_path, digest=digest)
+    logger.info(f"File uploaded successfully: {filename} (job {job['id']})")
+    return {"id": job["id"], "filename": filename, "status": job["status"]}
+
 @app.route("/upload", methods=["POST"])
 def upload_files():
     """Handle file uploads with validation and error handling"""
@@ -167,7 +867,9 @@ def upload_files():
 
         os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
         uploaded_files = []
+        jobs = []
         errors = []
+        quota_full = False
 
         for file in files:
             try:
@@ -178,93 +880,985 @@ def upload_files():
 
                 # Secure the filename
                 filename = secure_filename(file.filename)
-                file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
 
-                # Save and upload file
-                file.save(file_path)
-                upload_file_to_store(file_path)
+                # Store by content hash; identical content is neither rewritten nor re-uploaded
+                with stage("store"):
+                    digest, file_path, is_new = blob_store.put(filename, file.stream)
                 uploaded_files.append(filename)
-                logger.info(f"File uploaded successfully: {filename}")
+                jobs.append(enqueue_stored_upload(filename, digest, file_path, is_new))
 
+            except QuotaExceeded as e:
+                quota_full = True
+                errors.append(f"{file.filename}: {str(e)}")
+                logger.warning(f"Upload refused for {file.filename}: {str(e)}")
             except Exception as e:
                 errors.append(f"{file.filename}: {str(e)}")
                 logger.error(f"Error processing file {file.filename}: {str(e)}")
 
         if not uploaded_files and errors:
-            return jsonify({"error": "No files were uploaded. " + " ".join(errors)}), 400
+            return jsonify({"error": "No files were uploaded. " + " ".join(errors)}), 507 if quota_full else 400
 
-        message = f"Successfully uploaded {len(uploaded_files)} file(s)"
+        message = f"Successfully uploaded {len(uploaded_files)} file(s), indexing in background"
         if errors:
             message += f". {len(errors)} file(s) failed: " + " ".join(errors)
 
-        return jsonify({"message": message, "uploaded": uploaded_files}), 200
+        return jsonify({"message": message, "uploaded": uploaded_files, "jobs": jobs}), 202
 
     except Exception as e:
         logger.error(f"Unexpected error in /upload: {str(e)}")
         return jsonify({"error": "Server error during upload"}), 500
 
-@app.route("/ask", methods=["POST"])
-def ask():
-    """Handle question queries with language support and error handling"""
+@app.route("/uploads", methods=["POST"])
+def start_chunked_upload():
+    """Start a resumable upload: {"filename", "size", "sha256"?} -> upload id and chunk size"""
+    payload = request.get_json(silent=True) or {}
+    filename = secure_filename(str(payload.get("filename") or ""))
+    if not filename or not allowed_file(filename):
+        return jsonify({"error": f"File type not allowed. Allowed: {', '.join(ALLOWED_EXTENSIONS)}"}), 400
     try:
-        # Validate request
-        if not request.json:
-            return jsonify({"error": "Request must be JSON"}), 400
+        size = int(payload.get("size"))
+    except (TypeError, ValueError):
+        return jsonify({"error": "size must be the file size in bytes"}), 400
+    sha256 = payload.get("sha256")
+    if sha256 is not None and not (isinstance(sha256, str) and len(sha256) == 64):
+        return jsonify({"error": "sha256 must be a hex digest"}), 400
+    try:
+        upload = chunked_uploads.create(filename, size, sha256=sha256)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Could not start chunked upload for {filename}: {str(e)}")
+        return jsonify({"error": "Server error during upload"}), 500
+    return jsonify(upload), 201
 
-        user_question = request.json.get("question", "").strip()
-        language = request.json.get("language", "english").lower()
+@app.route("/uploads/<upload_id>", methods=["GET"])
+def chunked_upload_status(upload_id):
+    """Where a resumable upload continues (the client's resume point after a dropped connection)"""
+    try:
+        return jsonify(chunked_uploads.status(upload_id)), 200
+    except UploadNotFound:
+        return jsonify({"error": "Upload not found or expired"}), 404
 
-        if not user_question:
-            return jsonify({"error": "Question cannot be empty"}), 400
+@app.route("/uploads/<upload_id>", methods=["PUT"])
+def put_upload_chunk(upload_id):
+    """Append the request body at the Upload-Offset header; the body streams to disk"""
+    try:
+        offset = int(request.headers.get("Upload-Offset", ""))
+    except ValueError:
+        return jsonify({"error": "Upload-Offset header is required"}), 400
+    if request.content_length is not None and request.content_length > CHUNKED_UPLOAD_CHUNK_BYTES:
+        return jsonify({"error": f"Chunks are limited to {CHUNKED_UPLOAD_CHUNK_BYTES} bytes"}), 413
+    try:
+        with stage("write"):
+            upload = chunked_uploads.write(upload_id, offset, request.stream)
+        return jsonify(upload), 200
+    except UploadNotFound:
+        return jsonify({"error": "Upload not found or expired"}), 404
+    except OffsetMismatch as e:
+        return jsonify({"error": str(e), "offset": e.offset}), 409
+    except UploadBusy:
+        response = jsonify({"error": "Another chunk of this upload is still being written"})
+        response.headers["Retry-After"] = "2"
+        return response, 409
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error writing chunk of upload {upload_id}: {str(e)}")
+        return jsonify({"error": "Server error during upload"}), 500
 
-        if len(user_question) > 5000:
-            return jsonify({"error": "Question too long (max 5000 characters)"}), 400
+@app.route("/uploads/<upload_id>/finalize", methods=["POST"])
+def finalize_chunked_upload(upload_id):
+    """Store a complete resumable upload like /upload and queue its ingestion"""
+    try:
+        with chunked_uploads.finalize(upload_id) as (upload, part_path, digest):
+            with stage("store"):
+                digest, file_path, is_new = blob_store.adopt(upload['filename'], part_path, digest, upload['size'])
+        job = enqueue_stored_upload(upload['filename'], digest, file_path, is_new)
+        return jsonify({
+            "message": f"Successfully uploaded {upload['filename']}, indexing in background",
+            "uploaded": [upload['filename']],
+            "jobs": [job]
+        }), 202
+    except UploadNotFound:
+        return jsonify({"error": "Upload not found or expired"}), 404
+    except OffsetMismatch as e:
+        return jsonify({"error": "Upload is not complete yet", "offset": e.offset}), 409
+    except QuotaExceeded as e:
+        # The upload is kept, so finalize can be retried once space frees up
+        return jsonify({"error": str(e)}), 507
+    except UploadBusy:
+        return jsonify({"error": "A chunk of this upload is still being written"}), 409
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error finalizing upload {upload_id}: {str(e)}")
+        return jsonify({"error": "Server error during upload"}), 500
 
-        # Get language-specific system instruction
-        system_instruction = AGRICULTURAL_INSTRUCTIONS.get(language, AGRICULTURAL_INSTRUCTIONS['english'])
+@app.route("/uploads/<upload_id>", methods=["DELETE"])
+def abort_chunked_upload(upload_id):
+    """Discard an unfinished resumable upload"""
+    try:
+        chunked_uploads.abort(upload_id)
+        return jsonify({"deleted": True}), 200
+    except UploadNotFound:
+        return jsonify({"error": "Upload not found or expired"}), 404
+    except UploadBusy:
+        return jsonify({"error": "A chunk of this upload is still being written"}), 409
+
+def public_job(job):
+    """Job record without server-side paths"""
+    return {k: v for k, v in job.items() if k not in ("path", "owner", "owner_pid", "lease_until")}
+
+@app.route("/jobs", methods=["GET"])
+def list_jobs():
+    """List recent ingestion jobs, optionally filtered by ?status="""
+    status = request.args.get("status")
+    try:
+        limit = min(int(request.args.get("limit", 100)), 500)
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    return jsonify({"jobs": [public_job(j) for j in ingestion_queue.list(status=status, limit=limit)]}), 200
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    """Report the status and progress of one ingestion job"""
+    job = ingestion_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(public_job(job)), 200
+
+def validate_question(payload):
+    """Validate an ask payload; returns (question, language, error message)"""
+    if not payload:
+        return None, None, "Request must be JSON"
+    if not isinstance(payload, dict):
+        return None, None, "Request must be a JSON object"
+
+    user_question = payload.get("question") or ""
+    language = payload.get("language") or "english"
+    if not isinstance(user_question, str):
+        return None, None, "Question must be a string"
+    if not isinstance(language, str):
+        return None, None, "Language must be a string"
+    user_question = user_question.strip()
+    language = language.lower()
+
+    if not user_question:
+        return None, None, "Question cannot be empty"
+
+    if len(user_question) > 5000:
+        return None, None, "Question too long (max 5000 characters)"
+
+    return user_question, language, None
+
+def build_question_prompt(user_question, language):
+    """Build (prompt, local sources) for a question, with local knowledge base excerpts
+
+    The language's instructions are not part of the prompt; answer_config() carries them.
+    """
+    # Retrieve knowledge base excerpts locally (no remote file search round trip)
+    context, local_sources = ("", []) if RETRIEVAL_MODE == "remote" else retrieve_context(user_question)
+    prompt = f"{context}\n\nUser Question: {user_question}" if context else f"User Question: {user_question}"
+    return prompt, local_sources
+
+def answer_config(language):
+    """Config of a stateless answer: the language's prebuilt instructions, tools and output cap"""
+    return types.GenerateContentConfig(
+        system_instruction=ANSWER_INSTRUCTIONS.get(language, ANSWER_INSTRUCTIONS['english']),
+        tools=file_search_tools(),
+        max_output_tokens=ASK_MAX_OUTPUT_TOKENS or None
+    )
+
+def extract_sources(response, default=None):
+    """Grounding source titles from a response, or default when it has none"""
+    sources = default or []
+    with stage("grounding"):
+        try:
+            grounding = response.candidates[0].grounding_metadata
+            if grounding and getattr(grounding, 'grounding_chunks', None):
+                sources = list({c.retrieved_context.title for c in grounding.grounding_chunks if c.retrieved_context})
+        except (AttributeError, IndexError, TypeError):
+            logger.warning("Could not extract grounding metadata")
+    return sources
+
+async def generate_content(model, contents, config):
+    """Await one generate_content call on the shared upstream loop, under the request deadline
+
+    Transient failures are retried, slow calls hedged, and a model whose circuit is open
+    fails fast with CircuitOpen (see resilience.py).
+    """
+    response = await resilient.call(model, lambda: upstream.run(
+        lambda: get_client().aio.models.generate_content(model=model, contents=contents, config=config)
+    ))
+    record_usage(model, response.usage_metadata)
+    return response
+
+def stream_content(model, contents, config):
+    """Synchronous chunk iterator of one streamed call, bounded by the deadline and the model's breaker"""
+    return resilient.stream(model, lambda timeout: upstream.iterate(
+        lambda: get_client().aio.models.generate_content_stream(model=model, contents=contents, config=config),
+        timeout=timeout
+    ))
+
+def available_route(decision, config):
+    """Route a pro decision to the fast model while the pro model's circuit is open"""
+    if decision.tier == TIER_PRO and not config.cached_content \
+            and not resilient.available(MODEL_PRO) and resilient.available(MODEL_FAST):
+        return decision._replace(tier=TIER_FAST, model=MODEL_FAST, reasons=decision.reasons + ['pro_unavailable'])
+    return decision
+
+def degraded_answer(user_question, language, error):
+    """Knowledge base excerpts instead of a model answer when the model is unavailable, or None
+
+    Only for failures on the model's side (open circuit, deadline, transient errors after
+    retries); nothing is cached, so the next request tries the model again.
+    """
+    if not isinstance(error, (CircuitOpen, DeadlineExceeded)) and \
+            (isinstance(error, UpstreamBusy) or not is_transient(error)):
+        return None
+    try:
+        hits = retrieval_index.search(user_question, k=DEGRADED_EXCERPTS)
+    except Exception as e:
+        logger.error(f"Local retrieval for a degraded answer failed: {str(e)}")
+        return None
+    if not hits:
+        return None
+    logger.warning(f"Serving degraded answer from {len(hits)} excerpts: {str(error)}")
+    notice = DEGRADED_NOTICES.get(language, DEGRADED_NOTICES['english'])
+    excerpts = "\n\n".join(
+        f"{hit['title']}: {hit['text'][:DEGRADED_EXCERPT_CHARS].rstrip()}"
+        f"{'...' if len(hit['text']) > DEGRADED_EXCERPT_CHARS else ''}" for hit in hits
+    )
+    return {"response": f"{notice}\n\n{excerpts}",
+            "sources": list(dict.fromkeys(hit['title'] for hit in hits)), "degraded": True}
+
+async def generate_routed(decision, contents, config, escalation=None):
+    """Call the routed model tier, escalating to the pro model when the cheap answer is weak
+
+    `escalation` is an optional (contents, config) for the pro call, for requests that
+    cannot be replayed as-is on another model (e.g. ones using a model-specific cache).
+    Returns (response, the decision whose model produced it).
+    """
+    decision = answered = available_route(decision, config)
+    label_request(model=decision.model)
+    start = time.monotonic()
+    with stage("model"):
+        response = await generate_content(decision.model, contents, config)
+    model_router.observe(decision.tier, time.monotonic() - start)
+
+    escalate, reason = model_router.needs_escalation(decision, response, time.monotonic() - start)
+    if escalate and not resilient.available(MODEL_PRO):
+        escalate, reason = False, f"{reason}, pro circuit open"
+    if escalate:
+        label_request(model=MODEL_PRO)
+        pro_start = time.monotonic()
+        pro_contents, pro_config = escalation or (contents, config)
+        try:
+            with stage("model_escalation"):
+                pro_response = await generate_content(MODEL_PRO, pro_contents, pro_config)
+        except Exception as e:
+            # A weak answer in time beats none: keep the cheap one when it has text
+            if not (response.candidates and response.text):
+                raise
+            logger.warning(f"Escalation to {MODEL_PRO} failed, keeping the {decision.tier} answer: {str(e)}")
+            reason = f"{reason}, escalation failed"
+        else:
+            response = pro_response
+            model_router.observe(TIER_PRO, time.monotonic() - pro_start)
+            answered = decision._replace(tier=TIER_PRO, model=MODEL_PRO, reasons=decision.reasons + ['escalated'])
+
+    model_router.record(decision, time.monotonic() - start, escalated=escalate, reason=reason)
+    return response, answered
+
+async def canonicalize_question(user_question, language):
+    """Short English rendering of a question, the key shared by every language"""
+    if language == "english":
+        return user_question
+    response = await generate_content(
+        MODEL_FAST,
+        contents=f"Rewrite this farmer's question ({language}) as one short, plain English question. "
+                 f"Keep crop, pest, disease, product names and numbers. Reply with the question only.\n\n"
+                 f"{user_question}",
+        config=types.GenerateContentConfig(temperature=0)
+    )
+    return (response.text or "").strip()
+
+async def translate_answer(answer, source_language, target_language):
+    """Translate a stored answer for another language (cheap model, no retrieval)"""
+    response = await generate_content(
+        MODEL_FAST,
+        contents=f"Translate this agricultural advice for a sugarcane farmer from {source_language} to "
+                 f"{target_language}. Keep numbers, doses, units and product names exactly. Use simple "
+                 f"words a farmer uses. Reply with the translation only.\n\n{answer}",
+        config=types.GenerateContentConfig(temperature=0, max_output_tokens=ASK_MAX_OUTPUT_TOKENS or None)
+    )
+    return (response.text or "").strip()
+
+async def reuse_canonical_answer(user_question, language, kb_version):
+    """Answer from a question already answered in another language; returns (result or None, canonical)
+
+    The canonical question is returned on a miss too, so storing the new answer does not
+    canonicalize it again.
+    """
+    if not CANONICAL_ANSWERS or language not in AGRICULTURAL_INSTRUCTIONS \
+            or not canonical_answers.worth_checking(language):
+        return None, None
+    try:
+        with stage("canonicalize"):
+            canonical = await canonicalize_question(user_question, language)
+        entry = canonical_answers.lookup(canonical, kb_version) if canonical else None
+        if entry is None:
+            return None, canonical
+        answer = canonical_answers.answer_in(entry, language)
+        tier = "canonical"
+        if answer is None:
+            label_request(model=MODEL_FAST)
+            with stage("translate"):
+                answer = await translate_answer(entry['answer'], entry['answer_language'], language)
+            if not answer:
+                return None, canonical
+            canonical_answers.add_translation(entry, language, answer)
+            tier = "translated"
+    except (CircuitOpen, DeadlineExceeded) as e:
+        logger.warning(f"Canonical answer lookup unavailable, answering in full: {str(e)}")
+        return None, None
+    except UpstreamBusy:
+        raise
+    except Exception as e:
+        logger.warning(f"Canonical answer lookup failed, answering in full: {str(e)}")
+        return None, None
+    logger.info(f"Canonical {tier} hit for question in {language} (answered in {entry['answer_language']})")
+    answer_cache.put(language, user_question, answer, entry['sources'], kb_version)
+    return {"response": answer, "sources": entry['sources'], "cached": tier}, canonical
+
+def remember_canonical_answer(user_question, language, canonical, answer, sources, kb_version):
+    """Store a new answer under its canonical question, in the background (off the response path)"""
+    if not CANONICAL_ANSWERS or language not in AGRICULTURAL_INSTRUCTIONS:
+        return
+
+    async def store():
+        try:
+            question = canonical or await canonicalize_question(user_question, language)
+            if question:
+                canonical_answers.put(question, language, answer, sources, kb_version)
+        except Exception as e:
+            logger.warning(f"Could not store canonical answer: {str(e)}")
 
-        logger.info(f"Processing question in {language}: {user_question[:100]}...")
+    upstream.submit(store)
 
-        # Ensure file search store is available
-        store = ensure_file_search_store()
+def question_flight_key(user_question, language, kb_version):
+    """Single-flight key: requests with equal keys share one answer"""
+    return (language, normalize_question(user_question), kb_version)
 
-        # Generate content with Gemini with system instruction
-        response = client.models.generate_content(
-            model='gemini-3-pro-preview',
-            contents=f"{system_instruction}\n\nUser Question: {user_question}",
-            config=types.GenerateContentConfig(
-                tools=[types.Tool(
-                    file_search=types.FileSearch(
-                        file_search_store_names=[store.name]
-                    )
-                )]
+async def answer_question(user_question, language):
+    """Answer one stateless question; concurrent identical questions share one upstream call"""
+    key = question_flight_key(user_question, language, knowledge_base_version())
+    return await ask_flights.run(key, lambda: generate_answer(user_question, language))
+
+async def generate_answer(user_question, language):
+    """Answer one stateless question; returns a response dict (or one with an "error" key)"""
+    # Serve repeated and near-duplicate questions from the answer cache
+    kb_version = knowledge_base_version()
+    with stage("answer_cache"):
+        cached, tier = answer_cache.get(language, user_question, kb_version)
+    if cached:
+        logger.info(f"Answer cache {tier} hit for question in {language}")
+        return {"response": cached['answer'], "sources": cached['sources'], "cached": tier}
+
+    reused, canonical = await reuse_canonical_answer(user_question, language, kb_version)
+    if reused:
+        return reused
+
+    prompt, local_sources = build_question_prompt(user_question, language)
+
+    # Generate content with Gemini with system instruction on the routed model tier
+    decision = model_router.route("ask", user_question, language)
+    try:
+        response, _ = await generate_routed(decision, contents=prompt, config=answer_config(language))
+    except Exception as e:
+        # Model down or too slow: answer from the knowledge base rather than fail
+        degraded = degraded_answer(user_question, language, e)
+        if degraded is None:
+            raise
+        return degraded
+
+    # Extract answer
+    if not response.candidates:
+        return {"error": "No response generated"}
+
+    answer = response.text or "No answer generated"
+
+    # Extract sources safely
+    sources = extract_sources(response, local_sources)
+    if response.text:
+        answer_cache.put(language, user_question, answer, sources, kb_version)
+        remember_canonical_answer(user_question, language, canonical, answer, sources, kb_version)
+    return {"response": answer, "sources": sources}
+
+def plan_batch(payload):
+    """Validate batch items; returns (per-index errors, deduplicated groups, request error)
+
+    Each group is (question, language, item indexes) for one distinct question.
+    """
+    items = payload.get("items") if isinstance(payload, dict) else payload
+    if not isinstance(items, list) or not items:
+        return None, None, 'Request must contain a non-empty "items" array'
+    if len(items) > ASK_BATCH_MAX_ITEMS:
+        return None, None, f"Too many items (max {ASK_BATCH_MAX_ITEMS})"
+
+    errors = {}
+    groups = {}
+    for index, item in enumerate(items):
+        if not isinstance(item, dict) or not item:
+            errors[index] = "Item must be an object with a question"
+            continue
+        user_question, language, error = validate_question(item)
+        if error:
+            errors[index] = error
+            continue
+        key = (language, normalize_question(user_question))
+        groups.setdefault(key, (user_question, language, []))[2].append(index)
+    return errors, list(groups.values()), None
+
+async def answer_batch_group(semaphore, user_question, language):
+    """Answer one distinct batch question, turning failures into an item error"""
+    async with semaphore:
+        try:
+            with deadline(UPSTREAM_DEADLINE_ASK):
+                return await answer_question(user_question, language)
+        except UpstreamBusy as e:
+            return {"error": "Server busy, please retry", "retry_after": e.retry_after}
+        except Exception as e:
+            logger.error(f"Error in /ask/batch item: {str(e)}")
+            return {"error": "Failed to process question"}
+
+def batch_item(items, index, result):
+    """One item result, echoing the caller's id when it sent one"""
+    item = items[index] if isinstance(items[index], dict) else {}
+    return dict(result, index=index, **({"id": item["id"]} if "id" in item else {}))
+
+def stream_batch(items, errors, groups, timer=None):
+    """NDJSON generator: one line per item as soon as its group finishes, then a done line"""
+    for index, error in sorted(errors.items()):
+        yield json.dumps(batch_item(items, index, {"error": error}), ensure_ascii=False) + "\n"
+
+    # Streaming responses run outside the view's event loop, so drive a private one here
+    loop = asyncio.new_event_loop()
+    semaphore = asyncio.Semaphore(ASK_BATCH_CONCURRENCY)
+    pending = {
+        loop.create_task(answer_batch_group(semaphore, user_question, language), context=timer_context(timer)): indexes
+        for user_question, language, indexes in groups
+    }
+    try:
+        while pending:
+            done, _ = loop.run_until_complete(asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED))
+            for task in done:
+                for index in pending.pop(task):
+                    yield json.dumps(batch_item(items, index, task.result()), ensure_ascii=False) + "\n"
+        yield json.dumps({"done": True, "items": len(items), "unique": len(groups)}) + "\n"
+    finally:
+        # Client went away: cancel what is still waiting for the model
+        for task in pending:
+            task.cancel()
+        if pending:
+            loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+        loop.close()
+
+def session_instruction(session):
+    """System instruction for a session: language instructions plus the running summary"""
+    instruction = INSTRUCTION_TEXTS.get(session['language'], INSTRUCTION_TEXTS['english'])
+    if session['summary']:
+        instruction += f"\n\nSummary of the conversation so far:\n{session['summary']}"
+    return instruction
+
+def session_message(user_question):
+    """The new user turn with local knowledge base excerpts; returns (content, local sources)"""
+    context, local_sources = ("", []) if RETRIEVAL_MODE == "remote" else retrieve_context(user_question)
+    text = f"{context}\n\nUser Question: {user_question}" if context else user_question
+    return types.Content(role="user", parts=[types.Part(text=text)]), local_sources
+
+def full_session_request(session, message):
+    """(contents, config) resending the whole window, for turns without a usable cache"""
+    contents = [turn_content(turn) for turn in session['turns']] + [message]
+    return contents, types.GenerateContentConfig(
+        system_instruction=session_instruction(session),
+        tools=file_search_tools(),
+        max_output_tokens=ASK_MAX_OUTPUT_TOKENS or None
+    )
+
+def prepare_session_turn(session, user_question, language):
+    """Route one session turn; returns (decision, message, local sources, contents, config)"""
+    if session['language'] != language:
+        # The cached prefix carries the old language's instructions
+        session['language'] = language
+        drop_session_cache_later(session)
+
+    # A session never drops back to the fast tier once a turn needed the pro model
+    decision = model_router.route("ask", user_question, language)
+    if session['tier'] == TIER_PRO and decision.tier != TIER_PRO:
+        decision = decision._replace(tier=TIER_PRO, model=MODEL_PRO, reasons=decision.reasons + ['session'])
+    session['tier'] = decision.tier
+
+    message, local_sources = session_message(user_question)
+    cache = session_store.live_cache(session, decision.model)
+    if cache:
+        # Only the turns after the cached prefix and the new question are sent
+        contents = [turn_content(turn) for turn in session['turns'][cache['turns']:]] + [message]
+        config = types.GenerateContentConfig(cached_content=cache['name'],
+                                             max_output_tokens=ASK_MAX_OUTPUT_TOKENS or None)
+    else:
+        contents, config = full_session_request(session, message)
+    return decision, message, local_sources, contents, config
+
+def drop_session_cache_later(session):
+    """Detach the session's cache; it is deleted remotely when the turn finishes"""
+    if session.get('cache'):
+        session.setdefault('stale_caches', []).append(session['cache'])
+        session['cache'] = None
+
+async def delete_cached_content(cache):
+    """Best-effort delete of a provider context cache"""
+    try:
+        await upstream.run(lambda: get_client().aio.caches.delete(name=cache['name']))
+    except Exception as e:
+        logger.warning(f"Could not delete context cache {cache['name']}: {str(e)}")
+
+async def summarize_turns(session, turns):
+    """Fold older turns into the session summary with the fast model"""
+    transcript = "\n".join(
+        f"{'Farmer' if turn['role'] == 'user' else 'Advisor'}: {turn['text']}" for turn in turns
+    )
+    prompt = (
+        "Summarize this conversation between a sugarcane farmer and an agricultural advisor "
+        f"in {session['language']}, in at most 150 words. Keep every fact about the farm "
+        "(location, crop age, variety, soil, irrigation, symptoms) and the advice already given.\n\n"
+        f"Earlier summary:\n{session['summary'] or '(none)'}\n\nConversation:\n{transcript}"
+    )
+    try:
+        response = await generate_content(MODEL_FAST, prompt, types.GenerateContentConfig())
+        if response.text:
+            return response.text.strip()
+    except Exception as e:
+        logger.warning(f"Session {session['id']} summarization failed: {str(e)}")
+    # Keep the window bounded even without a fresh summary
+    return session['summary']
+
+async def refresh_session_cache(session, model):
+    """Cache the session prefix once it is long enough, and rebuild it when the tail grows"""
+    prefix_tokens = estimate_tokens(session_instruction(session)) + sum(t['tokens'] for t in session['turns'])
+    if prefix_tokens < SESSION_CACHE_MIN_TOKENS.get(model, SESSION_CACHE_MIN_TOKENS[MODEL_FAST]):
+        return
+    cache = session_store.live_cache(session, model)
+    if cache and sum(t['tokens'] for t in session['turns'][cache['turns']:]) < SESSION_CACHE_REBUILD_TOKENS:
+        return
+
+    try:
+        created = await upstream.run(lambda: get_client().aio.caches.create(
+            model=model,
+            config=types.CreateCachedContentConfig(
+                display_name=f"session-{session['id']}",
+                system_instruction=session_instruction(session),
+                contents=[turn_content(turn) for turn in session['turns']],
+                ttl=f"{SESSION_CACHE_TTL}s"
             )
-        )
+        ))
+    except Exception as e:
+        logger.warning(f"Could not cache prefix of session {session['id']}: {str(e)}")
+        return
+
+    drop_session_cache_later(session)
+    session['cache'] = {
+        'name': created.name,
+        'model': model,
+        'turns': len(session['turns']),
+        'expires_at': time.time() + SESSION_CACHE_TTL,
+    }
+    logger.info(f"Cached {prefix_tokens} token prefix of session {session['id']} as {created.name}")
+
+async def finish_session_turn(session, user_question, answer, model):
+    """Append the turn, summarize what fell out of the window, refresh the cache and save"""
+    session_store.append(session, user_question, answer)
+    folded = session_store.overflow(session)
+    if folded:
+        summary = await summarize_turns(session, folded)
+        stale = session_store.fold(session, len(folded), summary)
+        if stale:
+            session.setdefault('stale_caches', []).append(stale)
+        logger.info(f"Session {session['id']}: summarized {len(folded)} older turns")
+
+    # The file search tool cannot be combined with cached content, so remote mode never caches
+    if RETRIEVAL_MODE != "remote":
+        await refresh_session_cache(session, model)
+
+    for stale in session.pop('stale_caches', []):
+        await delete_cached_content(stale)
+    session_store.save(session)
+
+def open_session(session_id, language):
+    """Existing session by id, or a new one (unknown or expired ids start over)"""
+    session = session_store.get(session_id) if session_id else None
+    if session is None:
+        if session_id:
+            logger.info(f"Session {session_id} not found, starting a new one")
+        session = session_store.create(language)
+    return session
+
+async def ask_in_session(session_id, user_question, language):
+    """Answer one turn of a multi-turn advisory session"""
+    session = open_session(session_id, language)
+    with session_store.locked(session['id']):
+        session = session_store.get(session['id']) or session
+
+        # Only a session's first question is independent enough for the answer cache
+        kb_version = knowledge_base_version()
+        first_turn = not session['turns'] and not session['summary']
+        if first_turn:
+            cached, tier = answer_cache.get(language, user_question, kb_version)
+            if cached:
+                logger.info(f"Answer cache {tier} hit for first turn of session {session['id']}")
+                session_store.append(session, user_question, cached['answer'])
+                session_store.save(session)
+                return jsonify({"response": cached['answer'], "sources": cached['sources'],
+                                "cached": tier, "session_id": session['id']}), 200
+
+        decision, message, local_sources, contents, config = prepare_session_turn(session, user_question, language)
+        escalation = full_session_request(session, message) if config.cached_content else None
+        try:
+            response, answered = await generate_routed(decision, contents, config, escalation)
+        except genai_errors.APIError as e:
+            if not config.cached_content:
+                raise
+            # Cache expired or was evicted early - resend the whole window once
+            logger.warning(f"Context cache of session {session['id']} unusable, resending history: {str(e)}")
+            session['cache'] = None
+            contents, config = full_session_request(session, message)
+            response, answered = await generate_routed(decision, contents, config)
 
-        # Extract answer
         if not response.candidates:
+            session_store.save(session)
             return jsonify({"error": "No response generated"}), 500
 
         answer = response.text or "No answer generated"
-
-        # Extract sources safely
-        sources = []
+        sources = extract_sources(response, local_sources)
+        session_store.record_usage(session, response.usage_metadata)
+        if response.text:
+            if first_turn:
+                answer_cache.put(language, user_question, answer, sources, kb_version)
+            # An escalated turn keeps the session on the pro tier, where its cache is created
+            if answered.tier == TIER_PRO:
+                session['tier'] = TIER_PRO
+            await finish_session_turn(session, user_question, answer, answered.model)
+        else:
+            session_store.save(session)
+
+    logger.info(f"Session {session['id']} turn processed with {len(sources)} sources")
+    return jsonify({"response": answer, "sources": sources, "session_id": session['id']}), 200
+
+def sse_event(event, data):
+    """Format one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def stream_session_turn(session_id, user_question, language, timer=None):
+    """SSE generator for one session turn; the done event carries the session id"""
+    with session_store.locked(session_id):
+        session = session_store.get(session_id)
+        if session is None:
+            yield sse_event("error", {"error": "Session expired, please ask again"})
+            return
+        start = time.monotonic()
         try:
-            grounding = response.candidates[0].grounding_metadata
-            if grounding and hasattr(grounding, 'grounding_chunks'):
-                sources = list({c.retrieved_context.title for c in grounding.grounding_chunks if c.retrieved_context})
-        except (AttributeError, IndexError, TypeError):
-            logger.warning("Could not extract grounding metadata")
+            decision, message, sources, contents, config = prepare_session_turn(session, user_question, language)
+            parts = []
+            usage = None
+            for attempt in range(2):
+                try:
+                    for chunk in stream_content(decision.model, contents, config):
+                        if chunk.text:
+                            parts.append(chunk.text)
+                            yield sse_event("token", {"text": chunk.text})
+                        if chunk.candidates:
+                            sources = extract_sources(chunk, sources)
+                        if chunk.usage_metadata:
+                            usage = chunk.usage_metadata
+                    break
+                except genai_errors.APIError as e:
+                    if parts or not config.cached_content or attempt:
+                        raise
+                    logger.warning(f"Context cache of session {session_id} unusable, resending history: {str(e)}")
+                    session['cache'] = None
+                    contents, config = full_session_request(session, message)
+
+            session_store.record_usage(session, usage)
+            record_usage(decision.model, usage, timer)
+            if parts:
+                asyncio.run(finish_session_turn(session, user_question, "".join(parts), decision.model))
+            else:
+                session_store.save(session)
+                yield sse_event("token", {"text": "No answer generated"})
+            model_router.record(decision, time.monotonic() - start)
+            yield sse_event("done", {"sources": sources, "session_id": session_id})
+        except UpstreamBusy as e:
+            yield sse_event("error", {"error": "Server busy, please retry", "retry_after": e.retry_after})
+        except Exception as e:
+            logger.error(f"Error in session stream {session_id}: {str(e)}")
+            yield sse_event("error", {"error": "Failed to process question"})
+
+@app.route("/cache/stats", methods=["GET"])
+def cache_stats():
+    """Answer and image cache hit/miss counters for this worker, and what the shared state holds"""
+    return jsonify({"answers": answer_cache.stats(), "canonical": canonical_answers.stats(),
+                    "images": image_cache.stats(), "shared_state": shared_state.stats()}), 200
+
+@app.route("/routing/stats", methods=["GET"])
+def routing_stats():
+    """Requests, escalations and average latency per endpoint and model tier, plus upstream call health"""
+    return jsonify({"routes": model_router.stats(), "upstream": upstream.stats(), "resilience": resilient.stats(),
+                    "coalescing": {"ask": ask_flights.stats(), "analyze": analyze_flights.stats()}}), 200
+
+@app.route("/usage", methods=["GET"])
+def usage_report():
+    """Model calls and prompt/cached/output/thinking tokens per endpoint, language and model (all workers)"""
+    return jsonify(token_ledger.report()), 200
+
+@app.route("/quality/stats", methods=["GET"])
+def quality_stats():
+    """Photo quality gate reject rates per check (all workers) and the thresholds in force"""
+    if quality_gate is None:
+        return jsonify({"enabled": False}), 200
+    return jsonify(dict(quality_gate.stats(), enabled=True)), 200
+
+@app.route("/ask", methods=["POST"])
+async def ask():
+    """Handle question queries with language support and error handling"""
+    try:
+        # Validate request
+        payload = request.get_json(silent=True)
+        if isinstance(payload, dict) and payload.get("stream"):
+            return ask_stream()
 
-        logger.info(f"Question processed successfully with {len(sources)} sources")
-        return jsonify({"response": answer, "sources": sources}), 200
+        user_question, language, error = validate_question(payload)
+        if error:
+            return jsonify({"error": error}), 400
 
+        logger.info(f"Processing question in {language}: {user_question[:100]}...")
+        label_request(language=language)
+
+        with deadline(UPSTREAM_DEADLINE_ASK):
+            # Multi-turn: continue a session by id, or start one with "session": true
+            if payload.get("session_id") or payload.get("session"):
+                return await ask_in_session(payload.get("session_id"), user_question, language)
+
+            result = await answer_question(user_question, language)
+        if "error" in result:
+            return jsonify(result), 500
+
+        logger.info(f"Question processed successfully with {len(result['sources'])} sources")
+        return jsonify(result), 200
+
+    except UpstreamBusy:
+        raise
     except Exception as e:
         logger.error(f"Error in /ask: {str(e)}")
         return jsonify({"error": "Failed to process question"}), 500
 
+@app.route("/ask/batch", methods=["POST"])
+async def ask_batch():
+    """Answer many stateless questions in one call with bounded parallelism"""
+    payload = request.get_json(silent=True)
+    errors, groups, error = plan_batch(payload)
+    if error:
+        return jsonify({"error": error}), 400
+
+    items = payload.get("items") if isinstance(payload, dict) else payload
+    logger.info(f"Processing batch of {len(items)} questions ({len(groups)} distinct, {len(errors)} invalid)")
+    if groups:
+        upstream.check_capacity()
+
+    if isinstance(payload, dict) and payload.get("stream"):
+        return Response(stream_batch(items, errors, groups, g.get("timer")),
+                        mimetype="application/x-ndjson", headers={
+                            "Cache-Control": "no-cache",
+                            "X-Accel-Buffering": "no",
+                        })
+
+    semaphore = asyncio.Semaphore(ASK_BATCH_CONCURRENCY)
+    answers = await asyncio.gather(*(
+        answer_batch_group(semaphore, user_question, language) for user_question, language, _ in groups
+    ))
+    results = {index: {"error": error} for index, error in errors.items()}
+    for (_, _, indexes), result in zip(groups, answers):
+        for index in indexes:
+            results[index] = result
+    return jsonify({
+        "results": [batch_item(items, index, results[index]) for index in range(len(items))],
+        "items": len(items),
+        "unique": len(groups),
+    }), 200
+
+@app.route("/sessions/<session_id>", methods=["GET"])
+def get_session(session_id):
+    """Turn count, summary state and token usage of a session"""
+    session = session_store.get(session_id)
+    if session is None:
+        return jsonify({"error": "Session not found"}), 404
+    return jsonify(session_store.public(session)), 200
+
+@app.route("/sessions/<session_id>", methods=["DELETE"])
+async def delete_session(session_id):
+    """End a session and drop its cached prefix"""
+    session = session_store.delete(session_id)
+    if session is None:
+        return jsonify({"error": "Session not found"}), 404
+    for cache in [session.get('cache')] + session.get('stale_caches', []):
+        if cache:
+            await delete_cached_content(cache)
+    logger.info(f"Session {session_id} ended after {len(session['turns']) // 2} turns in window")
+    return jsonify({"deleted": session_id}), 200
+
+@app.route("/ask/stream", methods=["POST"])
+def ask_stream():
+    """Stream an answer as server-sent events: token events, then a final done event with sources"""
+    payload = request.get_json(silent=True)
+    user_question, language, error = validate_question(payload)
+    if error:
+        return jsonify({"error": error}), 400
+
+    logger.info(f"Streaming question in {language}: {user_question[:100]}...")
+    label_request(language=language)
+
+    if payload.get("session_id") or payload.get("session"):
+        try:
+            upstream.check_capacity()
+            session = open_session(payload.get("session_id"), language)
+        except UpstreamBusy:
+            raise
+        except Exception as e:
+            logger.error(f"Error preparing session stream: {str(e)}")
+            return jsonify({"error": "Failed to process question"}), 500
+        return Response(stream_session_turn(session['id'], user_question, language, g.get("timer")),
+                        mimetype="text/event-stream", headers={
+                            "Cache-Control": "no-cache",
+                            "X-Accel-Buffering": "no",
+                        })
+
+    kb_version = knowledge_base_version()
+    with stage("answer_cache"):
+        cached, tier = answer_cache.get(language, user_question, kb_version)
+    if cached:
+        logger.info(f"Answer cache {tier} hit for streamed question in {language}")
+        body = sse_event("token", {"text": cached['answer']}) + \
+            sse_event("done", {"sources": cached['sources'], "cached": tier})
+        return Response(body, mimetype="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+    try:
+        prompt, local_sources = build_question_prompt(user_question, language)
+        config = answer_config(language)
+        # Tokens are already on the wire, so streaming never escalates - it only routes
+        decision = model_router.route("ask", user_question, language)
+        upstream.check_capacity()
+    except UpstreamBusy:
+        raise
+    except Exception as e:
+        logger.error(f"Error preparing /ask/stream: {str(e)}")
+        return jsonify({"error": "Failed to process question"}), 500
+
+    label_request(model=decision.model)
+    timer = g.get("timer")
+    flight_key = question_flight_key(user_question, language, kb_version)
+
+    def follow(flight):
+        """Serve the result of an identical question already in flight; returns False to answer directly"""
+        try:
+            result = ask_flights.wait(flight)
+        except (LeaderGone, TimeoutError):
+            return False
+        except UpstreamBusy as e:
+            yield sse_event("error", {"error": "Server busy, please retry", "retry_after": e.retry_after})
+            return True
+        except Exception as e:
+            logger.error(f"Coalesced /ask/stream failed: {str(e)}")
+            yield sse_event("error", {"error": "Failed to process question"})
+            return True
+        if "error" in result:
+            yield sse_event("error", {"error": "Failed to process question"})
+        else:
+            yield sse_event("token", {"text": result['response']})
+            yield sse_event("done", {"sources": result['sources'], "coalesced": True})
+        return True
+
+    def generate():
+        flight, leader = ask_flights.join(flight_key)
+        if not leader and (yield from follow(flight)):
+            return
+        # Waiters see the client disconnecting (GeneratorExit) as a handover, not a failure
+        outcome = {"error": LeaderGone("ask")}
+        sources = local_sources
+        received = False
+        parts = []
+        usage = None
+        start = time.monotonic()
+        try:
+            # Runs here, not in the view: /ask delegates to this view from inside an event loop
+            reused, canonical = asyncio.run(reuse_canonical_answer(user_question, language, kb_version))
+            if reused:
+                outcome = {"result": reused}
+                yield sse_event("token", {"text": reused['response']})
+                yield sse_event("done", {"sources": reused['sources'], "cached": reused['cached']})
+                return
+            if timer and canonical is not None:
+                timer.add("canonicalize", time.monotonic() - start)
+            start = time.monotonic()
+            for chunk in stream_content(decision.model, prompt, config):
+                if chunk.text:
+                    if not received and timer:
+                        timer.add("first_token", time.monotonic() - start)
+                    received = True
+                    parts.append(chunk.text)
+                    yield sse_event("token", {"text": chunk.text})
+                if chunk.candidates:
+                    sources = extract_sources(chunk, sources)
+                if chunk.usage_metadata:
+                    usage = chunk.usage_metadata
+            record_usage(decision.model, usage, timer)
+
+            if not received:
+                yield sse_event("token", {"text": "No answer generated"})
+            else:
+                answer_cache.put(language, user_question, "".join(parts), sources, kb_version)
+                remember_canonical_answer(user_question, language, canonical, "".join(parts), sources, kb_version)
+            if timer:
+                timer.add("model", time.monotonic() - start)
+            model_router.record(decision, time.monotonic() - start)
+            logger.info(f"Streamed question successfully with {len(sources)} sources")
+            outcome = {"result": {"response": "".join(parts) or "No answer generated", "sources": sources}}
+            yield sse_event("done", {"sources": sources})
+        except Exception as e:
+            # Nothing sent yet and the model is down or too slow: answer from the knowledge base
+            degraded = None if received else degraded_answer(user_question, language, e)
+            if degraded:
+                outcome = {"result": degraded}
+                yield sse_event("token", {"text": degraded['response']})
+                yield sse_event("done", {"sources": degraded['sources'], "degraded": True})
+            elif isinstance(e, UpstreamBusy):
+                outcome = {"error": e}
+                yield sse_event("error", {"error": "Server busy, please retry", "retry_after": e.retry_after})
+            else:
+                outcome = {"error": e}
+                logger.error(f"Error in /ask/stream: {str(e)}")
+                yield sse_event("error", {"error": "Failed to process question"})
+        finally:
+            if leader:
+                ask_flights.complete(flight_key, flight, **outcome)
+
+    # The generators only use values captured here, so no request context is pushed for them:
+    # stream_with_context cannot be used when /ask (an async view) delegates to this one
+    return Response(generate(), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+
 @app.route("/analyze", methods=["POST"])
-def analyze_crop_image():
+async def analyze_crop_image():
     """Handle crop disease image analysis"""
     try:
         if "file" not in request.files:
@@ -280,69 +1874,381 @@ def analyze_crop_image():
         if not image_file.filename.lower().endswith(('.jpg', '.jpeg', '.png')):
             return jsonify({"error": "Only JPG, JPEG, and PNG images are allowed"}), 400
 
-        # Get language-specific instruction
-        system_instruction = AGRICULTURAL_INSTRUCTIONS.get(language, AGRICULTURAL_INSTRUCTIONS['english'])
+        # Get the language's prebuilt analysis instructions
+        system_instruction = ANALYSIS_INSTRUCTIONS.get(language, ANALYSIS_INSTRUCTIONS['english'])
 
         logger.info(f"Analyzing crop image in {language}: {image_file.filename}")
+        label_request(language=language)
 
-        # Read image data
-        image_bytes = image_file.read()
+        # Normalize the spooled upload in place (orientation, size, no EXIF) before the model call
+        try:
+            with stage("normalize"):
+                normalized = normalize_image(image_file.stream, max_edge=IMAGE_MAX_EDGE,
+                                             output_format=IMAGE_OUTPUT_FORMAT, quality=IMAGE_QUALITY)
+        except InvalidImageError as e:
+            logger.warning(f"Rejected unreadable image {image_file.filename}: {str(e)}")
+            return jsonify({"error": "Could not read the image. Please upload a valid JPG or PNG photo."}), 400
+
+        saved = normalized.original_bytes - len(normalized.data)
+        logger.info(f"Normalized image {image_file.filename}: {normalized.original_bytes} -> {len(normalized.data)} bytes "
+                    f"({saved} saved, {normalized.width}x{normalized.height})")
+
+        # Blurry, dark or plant-less photos are sent back for a retake without a model call
+        if quality_gate:
+            with stage("quality"):
+                quality = quality_gate.check(normalized.image)
+            if not quality.ok:
+                return jsonify(retake_response(quality, language)), 422
+
+        # The farmer's question shapes the analysis and the model tier, so cached and
+        # in-flight analyses are both keyed by photo, language and normalized question
+        notes = request.form.get("question", "").strip()[:500]
+        notes_key = normalize_question(notes)
+
+        # Near-duplicate photos (retries, re-forwards) reuse the stored analysis
+        with stage("image_cache"):
+            image_hash = dhash(normalized.image)
+            cached = image_cache.lookup(image_hash, language, notes_key)
+        if cached:
+            logger.info(f"Image cache hit for {image_file.filename} (distance {cached['distance']})")
+            return jsonify({"response": cached['analysis'], "cached": "perceptual"}), 200
+
+        # The same photo forwarded to many farmers at once is analyzed once
+        with deadline(UPSTREAM_DEADLINE_ANALYZE):
+            result = await analyze_flights.run(
+                (language, image_hash, notes_key),
+                lambda: analyze_image(normalized, image_hash, language, system_instruction, notes)
+            )
+        if "error" in result:
+            return jsonify(result), 500
 
-        # Prepare prompt for crop disease analysis
-        analysis_prompt = f"""{system_instruction}
+        logger.info("Image analysis completed successfully")
+        return jsonify(result), 200
 
-Analyze this crop image and provide:
-1. Identify the crop (if visible)
-2. Identify any diseases, pests, or health issues
-3. Assess the severity (mild, moderate, severe)
-4. Recommend immediate treatment steps
-5. Suggest preventive measures for the future
-
-Please provide practical, actionable advice in {language} language."""
+    except UpstreamBusy:
+        raise
+    except Exception as e:
+        logger.error(f"Error in /analyze_crop_image: {str(e)}")
+        return jsonify({"error": "Failed to analyze image. Please try again with a clear crop image."}), 500
 
-        # Ensure file search store is available
-        store = ensure_file_search_store()
-
-        # Use Gemini Vision API for image analysis
-        response = client.models.generate_content(
-            model='gemini-3-pro-preview',
-            contents=[
-                types.Content(
-                    parts=[
-                        types.Part(text=analysis_prompt),
-                        types.Part(inline_data=types.Blob(
-                            mime_type=image_file.content_type or 'image/jpeg',
-                            data=image_bytes
-                        ))
-                    ]
+async def analyze_image(normalized, image_hash, language, system_instruction, notes):
+    """Run the vision model on a normalized photo; returns a response dict (or one with an "error" key)
+
+    The task and language instructions go in the system instruction; the prompt carries
+    the photo, the farmer's question (if any) and knowledge base excerpts.
+    """
+    analysis_prompt = "Crop photo to analyze."
+    if notes:
+        analysis_prompt = f"{analysis_prompt}\n\nFarmer's question: {notes}"
+
+    # Attach disease and pest excerpts from the local knowledge base
+    if RETRIEVAL_MODE != "remote":
+        context, _ = retrieve_context(f"sugarcane disease pest symptoms treatment {notes}",
+                                      categories=('diseases', 'pest_control', 'uploads'))
+        if context:
+            analysis_prompt = f"{analysis_prompt}\n\n{context}"
+
+    # Use Gemini Vision API for image analysis on the routed model tier
+    decision = model_router.route("analyze", notes, language, has_image=True)
+    response, _ = await generate_routed(
+        decision,
+        contents=[
+            types.Content(
+                parts=[
+                    types.Part(text=analysis_prompt),
+                    types.Part(inline_data=types.Blob(
+                        mime_type=normalized.mime_type,
+                        data=normalized.data
+                    ))
+                ]
+            )
+        ],
+        config=types.GenerateContentConfig(
+            system_instruction=system_instruction,
+            tools=file_search_tools(),
+            max_output_tokens=ANALYZE_MAX_OUTPUT_TOKENS or None
+        )
+    )
+
+    # Extract analysis
+    if not response.candidates:
+        return {"error": "No analysis generated"}
+
+    analysis = response.text or "Unable to analyze the image"
+    if response.text:
+        image_cache.add(image_hash, language, analysis, normalize_question(notes))
+    return {"response": analysis}
+
+def parse_plot(raw):
+    """Plot metadata sent with a survey (a JSON object in the "plot" form field); returns (plot, error)"""
+    if not raw:
+        return {}, None
+    if len(raw) > 2000:
+        return None, "Plot details too long (max 2000 characters)"
+    try:
+        plot = json.loads(raw)
+    except ValueError:
+        return None, "Plot details must be a JSON object"
+    if not isinstance(plot, dict):
+        return None, "Plot details must be a JSON object"
+    return plot, None
+
+def retake_response(quality, language):
+    """Error body for a photo the quality gate rejected: advice for its first failed check"""
+    messages = RETAKE_MESSAGES.get(language, RETAKE_MESSAGES['english'])
+    return {"error": messages[quality.failed[0]], "retake": True, "failed_checks": quality.failed,
+            "measures": quality.measures}
+
+def normalize_survey_photo(index, image_file, language):
+    """Normalize, quality-check and hash one survey photo; returns its survey entry (with "error" when unusable)"""
+    photo = {"index": index, "filename": image_file.filename}
+    if not image_file.filename.lower().endswith(('.jpg', '.jpeg', '.png')):
+        return dict(photo, error="Only JPG, JPEG, and PNG images are allowed")
+    try:
+        normalized = normalize_image(image_file.stream, max_edge=IMAGE_MAX_EDGE,
+                                     output_format=IMAGE_OUTPUT_FORMAT, quality=IMAGE_QUALITY)
+    except InvalidImageError as e:
+        logger.warning(f"Rejected unreadable survey photo {image_file.filename}: {str(e)}")
+        return dict(photo, error="Could not read the image. Please upload a valid JPG or PNG photo.")
+    if quality_gate:
+        quality = quality_gate.check(normalized.image)
+        if not quality.ok:
+            return dict(photo, **retake_response(quality, language))
+    return dict(photo, normalized=normalized, hash=dhash(normalized.image))
+
+def plan_survey_groups(photos):
+    """Split photos into model calls of at most ANALYZE_BATCH_GROUP_SIZE photos and ANALYZE_BATCH_GROUP_BYTES"""
+    groups, current, size = [], [], 0
+    for photo in photos:
+        photo_bytes = len(photo['normalized'].data)
+        if current and (len(current) >= ANALYZE_BATCH_GROUP_SIZE or size + photo_bytes > ANALYZE_BATCH_GROUP_BYTES):
+            groups.append(current)
+            current, size = [], 0
+        current.append(photo)
+        size += photo_bytes
+    if current:
+        groups.append(current)
+    return groups
+
+def survey_prompt(plot, notes, context):
+    """Survey context for the model: plot details, the surveyor's notes and knowledge base excerpts"""
+    lines = []
+    if plot:
+        lines.append(f"Plot details: {json.dumps(plot, ensure_ascii=False)}")
+    if notes:
+        lines.append(f"Surveyor notes: {notes}")
+    if context:
+        lines.append(context)
+    return "\n\n".join(lines)
+
+def finding_text(finding):
+    """Plain-text analysis of one survey finding, served to /analyze requests for the same photo"""
+    headline = finding.get("issue") or ""
+    if finding.get("crop"):
+        headline = f"{finding['crop']}: {headline}"
+    if finding.get("severity"):
+        headline = f"{headline} ({finding['severity']})"
+    return "\n\n".join(text for text in (headline.strip(), finding.get("treatment")) if text)
+
+def survey_findings(response, group):
+    """Per-photo results of one group call, keyed by survey index"""
+    try:
+        findings = json.loads(response.text or "")["findings"]
+    except (ValueError, KeyError, TypeError):
+        logger.warning("Survey response was not the expected JSON")
+        findings = []
+    by_photo = {f.get("photo"): f for f in findings if isinstance(f, dict)}
+    results = {}
+    for number, photo in enumerate(group, 1):
+        finding = by_photo.get(number)
+        results[photo['index']] = {"finding": {k: v for k, v in finding.items() if k != "photo"}} if finding \
+            else {"error": "No finding returned for this photo"}
+    return results
+
+async def analyze_survey_group(semaphore, group, language, plot, notes, context):
+    """Analyze one group of photos in a single multi-image call; returns {survey index: result}"""
+    async with semaphore:
+        try:
+            parts = [types.Part(text=f"{survey_prompt(plot, notes, context)}\n\nPhotos:".lstrip())]
+            for number, photo in enumerate(group, 1):
+                parts.append(types.Part(text=f"Photo {number}:"))
+                parts.append(types.Part(inline_data=types.Blob(
+                    mime_type=photo['normalized'].mime_type,
+                    data=photo['normalized'].data
+                )))
+            decision = model_router.route("analyze", notes, language, has_image=True)
+            with deadline(UPSTREAM_DEADLINE_ANALYZE):
+                response, _ = await generate_routed(
+                    decision,
+                    contents=[types.Content(role="user", parts=parts)],
+                    config=types.GenerateContentConfig(
+                        system_instruction=SURVEY_INSTRUCTIONS.get(language, SURVEY_INSTRUCTIONS['english']),
+                        response_mime_type="application/json",
+                        response_schema=SURVEY_FINDINGS_SCHEMA,
+                        max_output_tokens=ANALYZE_MAX_OUTPUT_TOKENS or None
+                    )
                 )
-            ],
+            return survey_findings(response, group)
+        except UpstreamBusy as e:
+            return {photo['index']: {"error": "Server busy, please retry", "retry_after": e.retry_after}
+                    for photo in group}
+        except Exception as e:
+            logger.error(f"Error in /analyze/batch group: {str(e)}")
+            return {photo['index']: {"error": "Failed to analyze photo"} for photo in group}
+
+async def summarize_survey(results, language, plot, notes):
+    """Plot-level summary of the per-photo results (fast model, text only)"""
+    lines = []
+    for index, result in sorted(results.items()):
+        if "finding" in result:
+            lines.append(f"Photo {index + 1}: {json.dumps(result['finding'], ensure_ascii=False)}")
+        elif "analysis" in result:
+            lines.append(f"Photo {index + 1}: {result['analysis'][:600]}")
+    with deadline(UPSTREAM_DEADLINE_ASK):
+        response = await generate_content(
+            MODEL_FAST,
+            contents=f"{survey_prompt(plot, notes, '')}\n\nFindings:\n".lstrip() + "\n".join(lines),
             config=types.GenerateContentConfig(
-                tools=[types.Tool(
-                    file_search=types.FileSearch(
-                        file_search_store_names=[store.name]
-                    )
-                )]
+                system_instruction=SURVEY_SUMMARY_INSTRUCTIONS.get(language, SURVEY_SUMMARY_INSTRUCTIONS['english']),
+                max_output_tokens=ASK_MAX_OUTPUT_TOKENS or None
             )
         )
-
-        # Extract analysis
-        if not response.candidates:
-            return jsonify({"error": "No analysis generated"}), 500
-
-        analysis = response.text or "Unable to analyze the image"
-
-        logger.info(f"Image analysis completed successfully")
-        return jsonify({"response": analysis}), 200
-
-    except Exception as e:
-        logger.error(f"Error in /analyze_crop_image: {str(e)}")
-        return jsonify({"error": "Failed to analyze image. Please try again with a clear crop image."}), 500
+    return (response.text or "").strip()
+
+def stream_survey(photos, language, plot, notes, context, timer=None):
+    """NDJSON generator: a line per photo as its group finishes, then the plot summary and a done line
+
+    Findings are stored in the image cache, so the same photo sent to /analyze later (or in
+    another survey) is not analyzed again.
+    """
+    results = {}
+    notes_key = normalize_question(notes)
+    for photo in photos:
+        if "error" in photo:
+            results[photo['index']] = {key: photo[key] for key in ("error", "retake", "failed_checks", "measures")
+                                       if key in photo}
+        elif "cached" in photo:
+            cached = photo['cached']
+            results[photo['index']] = {"finding": cached['finding']} if "finding" in cached \
+                else {"analysis": cached['analysis']}
+            results[photo['index']]["cached"] = "perceptual"
+        else:
+            continue
+        yield json.dumps(dict(results[photo['index']], index=photo['index'], filename=photo['filename']),
+                         ensure_ascii=False) + "\n"
+
+    groups = plan_survey_groups([p for p in photos if p['index'] not in results])
+    by_index = {photo['index']: photo for photo in photos}
+
+    # Streaming responses run outside the view's event loop, so drive a private one here
+    loop = asyncio.new_event_loop()
+    semaphore = asyncio.Semaphore(ANALYZE_BATCH_CONCURRENCY)
+    pending = {
+        loop.create_task(analyze_survey_group(semaphore, group, language, plot, notes, context),
+                         context=timer_context(timer))
+        for group in groups
+    }
+    try:
+        while pending:
+            done, pending = loop.run_until_complete(asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED))
+            for task in done:
+                for index, result in sorted(task.result().items()):
+                    results[index] = result
+                    if "finding" in result:
+                        try:
+                            image_cache.add(by_index[index]['hash'], language, finding_text(result['finding']),
+                                            notes_key, finding=result['finding'])
+                        except Exception as e:
+                            logger.error(f"Could not store survey finding in the image cache: {str(e)}")
+                    yield json.dumps(dict(result, index=index, filename=by_index[index]['filename']),
+                                     ensure_ascii=False) + "\n"
+
+        summary = {"summary": None, "plot": plot}
+        if any("finding" in r or "analysis" in r for r in results.values()):
+            try:
+                summary["summary"] = loop.run_until_complete(loop.create_task(
+                    summarize_survey(results, language, plot, notes), context=timer_context(timer)
+                ))
+            except UpstreamBusy as e:
+                summary.update(error="Server busy, please retry", retry_after=e.retry_after)
+            except Exception as e:
+                logger.error(f"Error summarizing /analyze/batch: {str(e)}")
+                summary["error"] = "Failed to summarize the survey"
+        yield json.dumps(summary, ensure_ascii=False) + "\n"
+        yield json.dumps({"done": True, "images": len(photos), "model_calls": len(groups)}) + "\n"
+    finally:
+        # Client went away: cancel what is still waiting for the model
+        for task in pending:
+            task.cancel()
+        if pending:
+            loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+        loop.close()
+
+@app.route("/analyze/batch", methods=["POST"])
+async def analyze_batch():
+    """Field survey: many photos of one plot, analyzed a few per model call and streamed back as NDJSON"""
+    image_files = [f for f in request.files.getlist("files") if f.filename]
+    if not image_files:
+        return jsonify({"error": "No images provided"}), 400
+    if len(image_files) > ANALYZE_BATCH_MAX_IMAGES:
+        return jsonify({"error": f"Too many images (max {ANALYZE_BATCH_MAX_IMAGES})"}), 400
+    plot, error = parse_plot(request.form.get("plot"))
+    if error:
+        return jsonify({"error": error}), 400
+
+    language = request.form.get("language", "english").lower()
+    notes = request.form.get("notes", "").strip()[:500]
+    logger.info(f"Analyzing field survey of {len(image_files)} photos in {language}")
+    label_request(language=language)
+    upstream.check_capacity()
+
+    # The uploads are only readable during the request, so normalize them all before streaming
+    loop = asyncio.get_running_loop()
+    with stage("normalize"):
+        photos = await asyncio.gather(*(
+            loop.run_in_executor(image_workers, normalize_survey_photo, index, image_file, language)
+            for index, image_file in enumerate(image_files)
+        ))
+    with stage("image_cache"):
+        for photo in photos:
+            if "hash" in photo:
+                cached = image_cache.lookup(photo['hash'], language, normalize_question(notes))
+                if cached:
+                    photo['cached'] = cached
+
+    context = ""
+    if RETRIEVAL_MODE != "remote":
+        context, _ = retrieve_context(f"sugarcane disease pest symptoms treatment {notes}",
+                                      categories=('diseases', 'pest_control', 'uploads'))
+
+    return Response(stream_survey(photos, language, plot, notes, context, g.get("timer")),
+                    mimetype="application/x-ndjson", headers={
+                        "Cache-Control": "no-cache",
+                        "X-Accel-Buffering": "no",
+                    })
+
+@app.errorhandler(UpstreamBusy)
+def upstream_busy(error):
+    """Backpressure: the upstream queue is full, tell the client when to retry"""
+    logger.warning(f"Rejected request, upstream busy: {str(error)}")
+    response = jsonify({"error": "Server busy, please retry shortly", "retry_after": error.retry_after})
+    response.status_code = 503
+    response.headers["Retry-After"] = str(error.retry_after)
+    return response
+
+@app.errorhandler(DeadlineExceeded)
+def upstream_deadline(error):
+    """The model did not answer within the endpoint's deadline"""
+    logger.warning(f"Request hit its upstream deadline: {str(error)}")
+    response = jsonify({"error": "The advisor is taking too long, please retry", "retry_after": error.retry_after})
+    response.status_code = 504
+    response.headers["Retry-After"] = str(error.retry_after)
+    return response
 
 @app.errorhandler(413)
 def request_entity_too_large(error):
     """Handle file size limit exceeded"""
-    return jsonify({"error": "File too large (max 50MB)"}), 413
+    return jsonify({"error": "File too large (max 50MB per request; send larger files through /uploads in chunks)"}), 413
 
 @app.errorhandler(404)
 def not_found(error):
@@ -0,0 +1,328 @@
+"""Load benchmark for /ask, /analyze, /upload and /health
+
+Runs offline against the Gemini stand-in (fake_genai.py), either in this process or
+against a server started with GENAI_FAKE=1, and reports p50/p95/p99 latency, throughput
+and peak RSS per concurrency level.
+
+    # in-process, no server or API key needed
+    python benchmark.py --in-process --concurrency 1,8,32 --requests 200
+
+    # against a running server (pass its master pid to include worker memory; Linux only)
+    GENAI_FAKE=1 gunicorn -c gunicorn.conf.py app:app &
+    python benchmark.py --url http://localhost:5000 --pid $!
+
+    # record the generated traffic, replay it later, fail on a p95/throughput regression
+    python benchmark.py --in-process --record traffic.jsonl --json baseline.json
+    python benchmark.py --in-process --replay traffic.jsonl --baseline baseline.json
+"""
+import argparse
+import base64
+import io
+import json
+import math
+import os
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageDraw
+
+QUESTIONS = [
+    ("english", "What is the best time to plant sugarcane?"),
+    ("english", "How do I control white grub in my ratoon crop?"),
+    ("english", "My sugarcane leaves have red streaks with white spots, what disease is this?"),
+    ("english", "How much urea should I apply per acre and when?"),
+    ("hindi", "गन्ने में सफेद सुंडी का इलाज क्या है?"),
+    ("hindi", "गन्ने की सिंचाई कितने दिन में करनी चाहिए?"),
+    ("marathi", "ऊस लागवडीसाठी योग्य वेळ कोणती?"),
+    ("marathi", "उसाच्या पानांवर तांबेरा रोग आला आहे, काय करावे?"),
+]
+
+ENDPOINTS = ("ask", "analyze", "upload", "health")
+
+
+def make_image(rng, size=(640, 480)):
+    """A random leaf-like JPEG; different seeds give perceptually different images"""
+    image = Image.new("RGB", size, (40 + rng.randrange(40), 120 + rng.randrange(80), 40))
+    draw = ImageDraw.Draw(image)
+    for _ in range(12):
+        x, y = rng.randrange(size[0]), rng.randrange(size[1])
+        w, h = rng.randrange(20, 200), rng.randrange(20, 200)
+        draw.ellipse((x, y, x + w, y + h), fill=(rng.randrange(60, 200), rng.randrange(40, 160), rng.randrange(60)))
+    out = io.BytesIO()
+    image.save(out, "JPEG", quality=85)
+    return out.getvalue()
+
+
+def synthetic_requests(endpoints, count, unique, seed):
+    """Request specs cycling through the endpoints; `unique` defeats the answer/image caches"""
+    rng = random.Random(seed)
+    specs = []
+    for i in range(count):
+        endpoint = endpoints[i % len(endpoints)]
+        nonce = f" (#{i}-{rng.randrange(10 ** 6)})" if unique else ""
+        language, question = rng.choice(QUESTIONS)
+        if endpoint == "ask":
+            specs.append({"method": "POST", "path": "/ask", "json": {"question": question + nonce, "language": language}})
+        elif endpoint == "analyze":
+            specs.append({"method": "POST", "path": "/analyze", "form": {"language": language},
+                          "files": {"file": {"filename": "crop.jpg", "content_type": "image/jpeg",
+                                             "data": make_image(rng if unique else random.Random(i % 4))}}})
+        elif endpoint == "upload":
+            text = f"Sugarcane note {i}{nonce}: {question}\n".encode("utf-8") * 20
+            specs.append({"method": "POST", "path": "/upload",
+                          "files": {"files": {"filename": f"note_{i}.txt", "content_type": "text/plain", "data": text}}})
+        else:
+            specs.append({"method": "GET", "path": "/health"})
+    return specs
+
+
+def save_requests(specs, path):
+    """Write request specs as JSONL (file bodies base64-encoded)"""
+    with open(path, "w", encoding="utf-8") as f:
+        for spec in specs:
+            spec = dict(spec)
+            if "files" in spec:
+                spec["files"] = {field: dict(upload, data=base64.b64encode(upload["data"]).decode("ascii"))
+                                 for field, upload in spec["files"].items()}
+            f.write(json.dumps(spec, ensure_ascii=False) + "\n")
+
+
+def load_requests(path):
+    """Read a traffic file; a file given as a plain string is a path on disk"""
+    specs = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            spec = json.loads(line)
+            for field, upload in (spec.get("files") or {}).items():
+                if isinstance(upload, str):
+                    with open(upload, "rb") as data:
+                        upload = {"filename": os.path.basename(upload), "data": data.read()}
+                else:
+                    upload = dict(upload, data=base64.b64decode(upload["data"]))
+                spec["files"][field] = upload
+            specs.append(spec)
+    return specs
+
+
+def endpoint_of(spec):
+    return spec["path"].strip("/").split("/")[0] or "index"
+
+
+class HttpTransport:
+    """Sends requests to a running server, one HTTP session per thread"""
+
+    def __init__(self, base_url):
+        import requests
+        self.requests = requests
+        self.base_url = base_url.rstrip("/")
+        self.local = threading.local()
+
+    def send(self, spec):
+        session = getattr(self.local, "session", None)
+        if session is None:
+            session = self.local.session = self.requests.Session()
+        files = {field: (u["filename"], u["data"], u.get("content_type")) for field, u in (spec.get("files") or {}).items()}
+        response = session.request(spec["method"], self.base_url + spec["path"], json=spec.get("json"),
+                                   data=spec.get("form"), files=files or None, timeout=300)
+        return response.status_code
+
+
+class InProcessTransport:
+    """Imports app.py with the Gemini stand-in and drives it through Flask test clients"""
+
+    def __init__(self):
+        state = tempfile.mkdtemp(prefix="benchmark-")
+        os.environ.setdefault("GENAI_FAKE", "1")
+        for name, default in (("RETRIEVAL_INDEX_DIR", "index"), ("FILE_SEARCH_REGISTRY_PATH", "registry.json"),
+                              ("SHARED_STATE_PATH", "shared_state.db"),
+                              ("SESSION_DIR", "sessions"), ("UPLOAD_FOLDER", "uploads")):
+            os.environ.setdefault(name, os.path.join(state, default))
+        import app
+        self.app = app.app
+        self.local = threading.local()
+
+    def send(self, spec):
+        client = getattr(self.local, "client", None)
+        if client is None:
+            client = self.local.client = self.app.test_client()
+        kwargs = {"json": spec["json"]} if "json" in spec else {}
+        if "form" in spec or "files" in spec:
+            data = dict(spec.get("form") or {})
+            for field, upload in (spec.get("files") or {}).items():
+                data[field] = (io.BytesIO(upload["data"]), upload["filename"], upload.get("content_type"))
+            kwargs = {"data": data, "content_type": "multipart/form-data"}
+        response = client.open(spec["path"], method=spec["method"], **kwargs)
+        response.get_data()
+        return response.status_code
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def peak_rss_mb(pid=None):
+    """Peak resident memory of this process, or summed over a server pid and its descendants"""
+    if pid is None:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    total_kb = 0
+    pids = [pid]
+    for parent in pids:
+        try:
+            with open(f"/proc/{parent}/task/{parent}/children") as f:
+                pids += [int(p) for p in f.read().split()]
+        except OSError:
+            pass
+    for p in pids:
+        try:
+            with open(f"/proc/{p}/status") as f:
+                total_kb += next(int(line.split()[1]) for line in f if line.startswith("VmHWM:"))
+        except (OSError, StopIteration):
+            pass
+    return total_kb / 1024
+
+
+def run_level(transport, specs, concurrency, pace=0.0):
+    """Send every spec with `concurrency` workers; returns per-endpoint and total results"""
+    latencies = {}
+    failures = {}
+    statuses = {}
+    lock = threading.Lock()
+
+    def one(indexed):
+        index, spec = indexed
+        if pace:
+            time.sleep(max(0.0, start + index * pace - time.monotonic()))
+        endpoint = endpoint_of(spec)
+        began = time.monotonic()
+        try:
+            status = transport.send(spec)
+        except Exception as e:
+            status = type(e).__name__
+        elapsed = time.monotonic() - began
+        with lock:
+            latencies.setdefault(endpoint, []).append(elapsed)
+            statuses.setdefault(endpoint, {}).setdefault(str(status), 0)
+            statuses[endpoint][str(status)] += 1
+            if not isinstance(status, int) or status >= 500:
+                failures[endpoint] = failures.get(endpoint, 0) + 1
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, enumerate(specs)))
+    wall = time.monotonic() - start
+
+    results = {}
+    for endpoint, values in sorted(latencies.items()):
+        values.sort()
+        results[endpoint] = {
+            "requests": len(values),
+            "errors": failures.get(endpoint, 0),
+            "statuses": statuses[endpoint],
+            "p50_ms": round(percentile(values, 50) * 1000, 1),
+            "p95_ms": round(percentile(values, 95) * 1000, 1),
+            "p99_ms": round(percentile(values, 99) * 1000, 1),
+            "throughput_rps": round(len(values) / wall, 2),
+        }
+    return {"concurrency": concurrency, "seconds": round(wall, 2),
+            "throughput_rps": round(len(specs) / wall, 2), "endpoints": results}
+
+
+def print_level(level, rss_mb):
+    print(f"\nconcurrency={level['concurrency']}  wall={level['seconds']}s  "
+          f"throughput={level['throughput_rps']} req/s  peak_rss={rss_mb:.0f} MB")
+    print(f"  {'endpoint':<10}{'n':>6}{'err':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>9}  statuses")
+    for endpoint, r in level["endpoints"].items():
+        print(f"  {endpoint:<10}{r['requests']:>6}{r['errors']:>6}{r['p50_ms']:>10}{r['p95_ms']:>10}"
+              f"{r['p99_ms']:>10}{r['throughput_rps']:>9}  {r['statuses']}")
+
+
+def regressions(results, baseline, tolerance):
+    """Messages for p95 latencies or throughputs worse than the baseline by more than tolerance"""
+    found = []
+    previous = {level["concurrency"]: level for level in baseline["levels"]}
+    for level in results["levels"]:
+        old = previous.get(level["concurrency"])
+        if not old:
+            continue
+        if level["throughput_rps"] < old["throughput_rps"] * (1 - tolerance):
+            found.append(f"c={level['concurrency']} throughput {old['throughput_rps']} -> {level['throughput_rps']} req/s")
+        for endpoint, r in level["endpoints"].items():
+            before = old["endpoints"].get(endpoint)
+            if before and r["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+                found.append(f"c={level['concurrency']} {endpoint} p95 {before['p95_ms']} -> {r['p95_ms']} ms")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load benchmark for the sugarcane advisor API")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--url", default="http://localhost:5000", help="server to benchmark")
+    target.add_argument("--in-process", action="store_true", help="import app.py with GENAI_FAKE=1 instead")
+    parser.add_argument("--pid", type=int, help="server master pid, to report its peak RSS")
+    parser.add_argument("--endpoints", default="ask,analyze,upload,health",
+                        help=f"comma-separated subset of {','.join(ENDPOINTS)}")
+    parser.add_argument("--concurrency", default="1,8,32", help="comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=200, help="requests per level")
+    parser.add_argument("--unique", action="store_true", help="make every request distinct (cache misses)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--replay", help="JSONL traffic file to send instead of synthetic requests")
+    parser.add_argument("--rate", type=float, default=0.0, help="replay at this many req/s (0 = as fast as possible)")
+    parser.add_argument("--record", help="write the synthetic requests to this JSONL file")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--baseline", help="results file to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="allowed p95/throughput regression")
+    args = parser.parse_args()
+
+    endpoints = [e for e in args.endpoints.split(",") if e]
+    unknown = set(endpoints) - set(ENDPOINTS)
+    if unknown:
+        parser.error(f"unknown endpoints: {', '.join(sorted(unknown))}")
+
+    if args.replay:
+        specs = load_requests(args.replay)
+    else:
+        specs = synthetic_requests(endpoints, args.requests, args.unique, args.seed)
+    if args.record:
+        save_requests(specs, args.record)
+        print(f"Recorded {len(specs)} requests to {args.record}")
+
+    transport = InProcessTransport() if args.in_process else HttpTransport(args.url)
+    pace = 1.0 / args.rate if args.rate else 0.0
+
+    results = {"target": "in-process" if args.in_process else args.url, "requests": len(specs), "levels": []}
+    for concurrency in [int(c) for c in args.concurrency.split(",") if c]:
+        level = run_level(transport, specs, concurrency, pace)
+        level["peak_rss_mb"] = round(peak_rss_mb(None if args.in_process else args.pid), 1) \
+            if args.in_process or args.pid else None
+        results["levels"].append(level)
+        print_level(level, level["peak_rss_mb"] or 0)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            found = regressions(results, json.load(f), args.max_regression)
+        if found:
+            print("\nRegressions against baseline:")
+            for message in found:
+                print(f"  {message}")
+            return 1
+        print("\nNo regressions against baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,228 @@
+"""Content-addressed storage for uploaded documents with dedup and a disk quota"""
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+COPY_BLOCK_SIZE = 1024 * 1024
+
+
+class QuotaExceeded(Exception):
+    """A new upload does not fit: everything still stored is referenced or being ingested"""
+
+
+class BlobStore:
+    """Stores each distinct upload once under blobs/<aa>/<sha256>.<ext>
+
+    manifest.json maps upload names to content hashes and keeps per-blob size,
+    reference count and last access time. When the stored bytes exceed the quota,
+    the least recently used unreferenced blobs are deleted. Blobs that a name still
+    points to, or that in_use() reports (pending ingestion jobs), are never evicted;
+    a new upload that cannot fit then raises QuotaExceeded.
+    """
+
+    def __init__(self, root, quota_bytes=0, in_use=None):
+        self.root = root
+        self.quota_bytes = quota_bytes
+        # in_use() returns the digests that must stay on disk regardless of references
+        self.in_use = in_use or (lambda: ())
+        self.blob_dir = os.path.join(root, 'blobs')
+        self.manifest_path = os.path.join(root, 'manifest.json')
+
+    @contextmanager
+    def _locked(self):
+        os.makedirs(self.root, exist_ok=True)
+        with open(self.manifest_path + '.lock', 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read(self):
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'names': {}, 'blobs': {}}
+        except ValueError as e:
+            logger.error(f"Upload manifest is corrupt, starting fresh: {str(e)}")
+            return {'names': {}, 'blobs': {}}
+
+    def _write(self, manifest):
+        tmp_path = f"{self.manifest_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(tmp_path, self.manifest_path)
+
+    def blob_path(self, digest, ext):
+        """Location of a blob on disk"""
+        suffix = f".{ext}" if ext else ""
+        return os.path.join(self.blob_dir, digest[:2], f"{digest}{suffix}")
+
+    def _tmp_path(self):
+        os.makedirs(self.blob_dir, exist_ok=True)
+        return os.path.join(self.blob_dir, f".incoming.{os.getpid()}.{time.monotonic_ns()}")
+
+    def _hash_stream(self, stream):
+        digest = hashlib.sha256()
+        size = 0
+        for block in iter(lambda: stream.read(COPY_BLOCK_SIZE), b''):
+            digest.update(block)
+            size += len(block)
+        return digest.hexdigest(), size
+
+    def _copy_stream(self, stream, dest, digest=None):
+        """Write a stream to dest, hashing it on the way when digest is given"""
+        size = 0
+        with open(dest, 'wb') as out:
+            for block in iter(lambda: stream.read(COPY_BLOCK_SIZE), b''):
+                if digest is not None:
+                    digest.update(block)
+                out.write(block)
+                size += len(block)
+        return size
+
+    def put(self, name, stream):
+        """Store an upload under a name; returns (digest, path, is_new)
+
+        Seekable streams (Werkzeug spools uploads) are hashed first, so a duplicate costs
+        one read and no disk write. Other streams are hashed while they are written.
+        """
+        ext = name.rsplit('.', 1)[1].lower() if '.' in name else ''
+        tmp_path = None
+        if stream.seekable():
+            digest, size = self._hash_stream(stream)
+        else:
+            hasher = hashlib.sha256()
+            tmp_path = self._tmp_path()
+            size = self._copy_stream(stream, tmp_path, hasher)
+            digest = hasher.hexdigest()
+
+        try:
+            return self._register(name, ext, digest, size, tmp_path, stream)
+        except QuotaExceeded:
+            if tmp_path is not None:
+                os.remove(tmp_path)
+            raise
+
+    def adopt(self, name, file_path, digest, size):
+        """Store a file already written and hashed elsewhere (chunked uploads); moves it
+
+        Returns (digest, path, is_new) like put(). file_path must be on the same filesystem
+        as the blob directory; a duplicate is deleted instead of moved. On QuotaExceeded the
+        file is left where it is.
+        """
+        ext = name.rsplit('.', 1)[1].lower() if '.' in name else ''
+        return self._register(name, ext, digest, size, file_path)
+
+    def _register(self, name, ext, digest, size, tmp_path, stream=None):
+        path = self.blob_path(digest, ext)
+        with self._locked():
+            manifest = self._read()
+            blob = manifest['blobs'].get(digest)
+            is_new = blob is None or not os.path.exists(path)
+            if blob is None:
+                blob = {'size': size, 'ext': ext, 'refs': 0, 'created_at': time.time()}
+                manifest['blobs'][digest] = blob
+
+            previous = manifest['names'].get(name)
+            if previous != digest:
+                if previous in manifest['blobs']:
+                    manifest['blobs'][previous]['refs'] = max(0, manifest['blobs'][previous]['refs'] - 1)
+                manifest['names'][name] = digest
+                blob['refs'] += 1
+            blob['last_access'] = time.time()
+
+            # Decided before anything is written, so a refused upload leaves the store as it was
+            evicted, excess = self._evict(manifest)
+            if is_new and excess > 0:
+                raise QuotaExceeded(
+                    f"Upload quota is full: {excess} bytes over {self.quota_bytes} "
+                    f"with every stored file still in use"
+                )
+            if is_new:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                if tmp_path is None:
+                    stream.seek(0)
+                    tmp_path = self._tmp_path()
+                    self._copy_stream(stream, tmp_path)
+                os.replace(tmp_path, path)
+                tmp_path = None
+            self._write(manifest)
+            for old_digest, old_blob in evicted:
+                try:
+                    os.remove(self.blob_path(old_digest, old_blob['ext']))
+                except FileNotFoundError:
+                    pass
+                logger.info(f"Evicted upload blob {old_digest[:12]} ({old_blob['size']} bytes) to stay within quota")
+
+        if tmp_path is not None:
+            os.remove(tmp_path)
+        if not is_new:
+            logger.info(f"Duplicate upload {name} matches stored blob {digest[:12]}")
+        return digest, path, is_new
+
+    def _evict(self, manifest):
+        """Drop unreferenced blobs from the manifest, least recently used first, until the quota is met
+
+        Returns (evicted (digest, blob) pairs, bytes still over the quota). Blobs with
+        references or in in_use() are kept; the caller deletes the evicted files.
+        """
+        if not self.quota_bytes:
+            return [], 0
+        total = sum(b['size'] for b in manifest['blobs'].values())
+        if total <= self.quota_bytes:
+            return [], 0
+        in_use = set(self.in_use())
+        candidates = sorted(
+            (d for d, b in manifest['blobs'].items() if b['refs'] <= 0 and d not in in_use),
+            key=lambda d: manifest['blobs'][d].get('last_access', 0)
+        )
+        evicted = []
+        for digest in candidates:
+            if total <= self.quota_bytes:
+                break
+            blob = manifest['blobs'].pop(digest)
+            evicted.append((digest, blob))
+            total -= blob['size']
+        return evicted, max(0, total - self.quota_bytes)
+
+    def touch(self, digest):
+        """Mark a blob as recently used"""
+        with self._locked():
+            manifest = self._read()
+            if digest in manifest['blobs']:
+                manifest['blobs'][digest]['last_access'] = time.time()
+                self._write(manifest)
+
+    def remove(self, name):
+        """Drop a name; its blob is kept until quota eviction needs the space"""
+        with self._locked():
+            manifest = self._read()
+            digest = manifest['names'].pop(name, None)
+            if digest in manifest['blobs']:
+                manifest['blobs'][digest]['refs'] = max(0, manifest['blobs'][digest]['refs'] - 1)
+            self._write(manifest)
+            return digest is not None
+
+    def title_for_path(self, path):
+        """Upload name for a blob path (used as the source title), or None"""
+        digest = os.path.basename(path).split('.', 1)[0]
+        names = [n for n, d in self._read()['names'].items() if d == digest]
+        return names[-1] if names else None
+
+    def usage(self):
+        """Stored bytes, blob and name counts against the quota"""
+        manifest = self._read()
+        return {
+            'bytes': sum(b['size'] for b in manifest['blobs'].values()),
+            'blobs': len(manifest['blobs']),
+            'names': len(manifest['names']),
+            'quota_bytes': self.quota_bytes,
+        }
@@ -0,0 +1,84 @@
+"""Cross-language answer reuse: one canonical answer per question, translated per language"""
+import threading
+
+from answer_cache import AnswerCache
+
+CANONICAL_LANGUAGE = 'canonical'
+META_NAMESPACE = 'canonical_answers_meta'
+
+
+class CanonicalAnswers:
+    """Answers keyed by a short English rendering of the question, whatever language asked it
+
+    The first full answer is kept in the language it was generated in, together with its
+    sources. A later question in another language that canonicalizes to the same (or a
+    near-duplicate) English question is answered by translating that answer once; the
+    translation is stored on the entry so further hits in that language cost nothing.
+    Matching, LRU, TTL and knowledge base versioning come from AnswerCache; with a
+    SharedState, entries, translations and the languages seen are shared by all workers.
+    """
+
+    def __init__(self, max_entries=2000, ttl_seconds=86400, similarity_threshold=0.85, shared=None):
+        self._cache = AnswerCache(max_entries=max_entries, ttl_seconds=ttl_seconds,
+                                  similarity_threshold=similarity_threshold,
+                                  shared=shared, namespace='canonical_answers')
+        self._shared = shared
+        self._lock = threading.Lock()
+        self._languages = set()
+        self.counters = {'hits': 0, 'translations': 0, 'misses': 0, 'stores': 0}
+
+    def _known_languages(self):
+        with self._lock:
+            languages = set(self._languages)
+        if self._shared is not None:
+            languages.update(self._shared.get(META_NAMESPACE, 'languages', []))
+        return languages
+
+    def worth_checking(self, language):
+        """False while nothing has been answered in another language (saves canonicalizing)"""
+        return bool(self._known_languages() - {language})
+
+    def lookup(self, canonical_question, version):
+        """Entry for a canonical question, or None"""
+        entry, _ = self._cache.get(CANONICAL_LANGUAGE, canonical_question, version)
+        with self._lock:
+            self.counters['hits' if entry else 'misses'] += 1
+        return entry
+
+    def answer_in(self, entry, language):
+        """Stored answer text for language, or None when it still needs translating"""
+        if entry['answer_language'] == language:
+            return entry['answer']
+        with self._lock:
+            return entry['translations'].get(language)
+
+    def add_translation(self, entry, language, text):
+        """Keep a translation of an entry's answer"""
+        with self._lock:
+            entry['translations'][language] = text
+            self.counters['translations'] += 1
+        self._cache.publish(CANONICAL_LANGUAGE, entry)
+
+    def put(self, canonical_question, language, answer, sources, version):
+        """Store a freshly generated answer under its canonical question"""
+        self._cache.put(CANONICAL_LANGUAGE, canonical_question, answer, sources, version,
+                        answer_language=language, translations={})
+        with self._lock:
+            self._languages.add(language)
+            self.counters['stores'] += 1
+        if self._shared is not None:
+            self._shared.update(META_NAMESPACE, 'languages', lambda known: sorted(set(known or []) | {language}))
+
+    def invalidate(self):
+        """Drop every canonical answer (knowledge base changed)"""
+        self._cache.invalidate()
+        with self._lock:
+            self._languages.clear()
+        if self._shared is not None:
+            self._shared.delete(META_NAMESPACE, 'languages')
+
+    def stats(self):
+        """Hit/translation counters and current size"""
+        with self._lock:
+            counters = dict(self.counters)
+        return dict(counters, entries=self._cache.stats()['entries'], languages=sorted(self._known_languages()))
@@ -0,0 +1,231 @@
+"""Resumable chunked uploads: init, write chunks at an offset, finalize"""
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+WRITE_BLOCK_SIZE = 256 * 1024
+UPLOAD_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+
+class UploadNotFound(LookupError):
+    """Unknown, finished or expired upload id"""
+
+
+class UploadBusy(RuntimeError):
+    """Another request is writing to the same upload"""
+
+
+class OffsetMismatch(ValueError):
+    """A chunk did not start where the stored data ends; .offset is where it does"""
+
+    def __init__(self, offset):
+        super().__init__(f"Upload continues at offset {offset}")
+        self.offset = offset
+
+
+class ChunkedUploads:
+    """Partial uploads kept as <directory>/<id>.part next to a <id>.json descriptor
+
+    The size of the .part file is the upload's offset, so whatever reached the disk before
+    a dropped connection counts and the client resumes from there. Chunks stream to disk in
+    small blocks and feed a SHA-256 kept per process, so memory does not grow with the file.
+    A worker that did not see the earlier chunks (another process, a restart) rehashes the
+    stored prefix once before continuing.
+    """
+
+    def __init__(self, directory, max_bytes, chunk_bytes, ttl_seconds=24 * 3600):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.chunk_bytes = chunk_bytes
+        self.ttl_seconds = ttl_seconds
+        self._hashers = {}
+        self._hashers_lock = threading.Lock()
+
+    def _path(self, upload_id, suffix):
+        if not UPLOAD_ID_PATTERN.match(upload_id or ''):
+            raise UploadNotFound(upload_id)
+        return os.path.join(self.directory, f"{upload_id}.{suffix}")
+
+    @contextmanager
+    def _locked(self, upload_id):
+        lock_path = self._path(upload_id, 'lock')
+        if not os.path.exists(self._path(upload_id, 'json')):
+            raise UploadNotFound(upload_id)
+        with open(lock_path, 'a') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise UploadBusy(upload_id)
+            try:
+                yield self._read(upload_id)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read(self, upload_id):
+        try:
+            with open(self._path(upload_id, 'json'), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            raise UploadNotFound(upload_id)
+
+    def _offset(self, upload_id):
+        try:
+            return os.path.getsize(self._path(upload_id, 'part'))
+        except FileNotFoundError:
+            return 0
+
+    def create(self, filename, size, sha256=None):
+        """Start an upload of `size` bytes; returns its public status"""
+        if size <= 0:
+            raise ValueError("size must be a positive number of bytes")
+        if size > self.max_bytes:
+            raise ValueError(f"File is larger than the {self.max_bytes // (1024 * 1024)}MB limit")
+        self.prune()
+        os.makedirs(self.directory, exist_ok=True)
+        record = {
+            'id': uuid.uuid4().hex,
+            'filename': filename,
+            'size': size,
+            'sha256': sha256.lower() if sha256 else None,
+            'created_at': time.time(),
+        }
+        open(self._path(record['id'], 'part'), 'wb').close()
+        tmp_path = f"{self._path(record['id'], 'json')}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(record, f, ensure_ascii=False)
+        os.replace(tmp_path, self._path(record['id'], 'json'))
+        logger.info(f"Started chunked upload {record['id']} for {filename} ({size} bytes)")
+        return self.public(record, 0)
+
+    def status(self, upload_id):
+        """Public status of an upload: where the next chunk starts"""
+        return self.public(self._read(upload_id), self._offset(upload_id))
+
+    def public(self, record, offset):
+        """Upload record as returned to clients"""
+        updated_at = record['created_at']
+        try:
+            updated_at = os.path.getmtime(self._path(record['id'], 'part'))
+        except FileNotFoundError:
+            pass
+        return {
+            'id': record['id'],
+            'filename': record['filename'],
+            'size': record['size'],
+            'offset': offset,
+            'chunk_size': self.chunk_bytes,
+            'complete': offset >= record['size'],
+            'expires_at': updated_at + self.ttl_seconds,
+        }
+
+    def _hasher(self, upload_id, offset):
+        """SHA-256 state covering the first `offset` bytes of the upload"""
+        with self._hashers_lock:
+            cached = self._hashers.pop(upload_id, None)
+        if cached is not None and cached[0] == offset:
+            return cached[1]
+        hasher = hashlib.sha256()
+        remaining = offset
+        with open(self._path(upload_id, 'part'), 'rb') as f:
+            while remaining:
+                block = f.read(min(WRITE_BLOCK_SIZE, remaining))
+                if not block:
+                    break
+                hasher.update(block)
+                remaining -= len(block)
+        return hasher
+
+    def write(self, upload_id, offset, stream):
+        """Append a chunk that starts at `offset`; returns the public status after it
+
+        Bytes written before the stream fails stay on disk, so a retry resumes from the
+        returned (or re-queried) offset rather than resending the whole chunk.
+        """
+        with self._locked(upload_id) as record:
+            current = self._offset(upload_id)
+            if offset != current:
+                raise OffsetMismatch(current)
+            hasher = self._hasher(upload_id, current)
+            remaining = record['size'] - current
+            written = 0
+            try:
+                with open(self._path(upload_id, 'part'), 'ab') as out:
+                    for block in iter(lambda: stream.read(WRITE_BLOCK_SIZE), b''):
+                        if written + len(block) > remaining:
+                            raise ValueError(f"Chunk runs past the declared size of {record['size']} bytes")
+                        out.write(block)
+                        hasher.update(block)
+                        written += len(block)
+            finally:
+                with self._hashers_lock:
+                    self._hashers[upload_id] = (current + written, hasher)
+            return self.public(record, current + written)
+
+    @contextmanager
+    def finalize(self, upload_id):
+        """Yield (record, part path, sha256) of a complete upload; it is removed afterwards
+
+        The caller moves the .part file away inside the block; if the block raises, the
+        upload is kept so finalize can be retried.
+        """
+        with self._locked(upload_id) as record:
+            offset = self._offset(upload_id)
+            if offset < record['size']:
+                raise OffsetMismatch(offset)
+            digest = self._hasher(upload_id, offset).hexdigest()
+            if record['sha256'] and record['sha256'] != digest:
+                self._remove(upload_id)
+                raise ValueError("Uploaded content does not match the declared sha256; start the upload again")
+            yield record, self._path(upload_id, 'part'), digest
+            self._remove(upload_id)
+        logger.info(f"Finished chunked upload {upload_id} for {record['filename']} ({digest[:12]})")
+
+    def abort(self, upload_id):
+        """Discard an unfinished upload"""
+        with self._locked(upload_id):
+            self._remove(upload_id)
+
+    def _remove(self, upload_id):
+        with self._hashers_lock:
+            self._hashers.pop(upload_id, None)
+        for suffix in ('part', 'json', 'lock'):
+            try:
+                os.remove(self._path(upload_id, suffix))
+            except FileNotFoundError:
+                pass
+
+    def prune(self):
+        """Delete uploads that received no data for ttl_seconds; returns how many"""
+        removed = 0
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return 0
+        cutoff = time.time() - self.ttl_seconds
+        for name in names:
+            if not name.endswith('.json'):
+                continue
+            upload_id = name[:-len('.json')]
+            try:
+                part = self._path(upload_id, 'part')
+                last_write = os.path.getmtime(part) if os.path.exists(part) else os.path.getmtime(
+                    self._path(upload_id, 'json'))
+                if last_write > cutoff:
+                    continue
+                with self._locked(upload_id):
+                    self._remove(upload_id)
+                removed += 1
+            except (UploadNotFound, UploadBusy, OSError):
+                continue
+        if removed:
+            logger.info(f"Pruned {removed} abandoned chunked upload(s)")
+        return removed
@@ -0,0 +1,86 @@
+"""pytest setup: the app runs against the offline Gemini stand-in with throwaway state"""
+import atexit
+import io
+import os
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+import pytest
+from PIL import Image
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+STATE = tempfile.mkdtemp(prefix="advisor-tests-")
+# Registered before the app is imported, so it runs after the app's exit handlers (metrics flush)
+atexit.register(shutil.rmtree, STATE, ignore_errors=True)
+
+# Must be set before app.py is imported: it reads its configuration at import time
+os.environ.update({
+    "GENAI_FAKE": "1",
+    "GENAI_FAKE_LATENCY": "0",
+    "WARMUP": "0",
+    "READINESS_INTERVAL": "300",
+    "CANONICAL_ANSWERS": "0",
+    "GENAI_FAKE_UPLOAD_SECONDS": "0",
+    "EXTRACTION_WORKERS": "1",
+    "OPERATION_POLL_INITIAL": "0.05",
+    "UPLOAD_FOLDER": os.path.join(STATE, "uploads"),
+    "METRICS_DIR": os.path.join(STATE, "metrics"),
+    "CHUNK_STORE_DIR": os.path.join(STATE, "chunks"),
+    "RETRIEVAL_INDEX_DIR": os.path.join(STATE, "index"),
+    "FILE_SEARCH_REGISTRY_PATH": os.path.join(STATE, "registry.json"),
+    "SHARED_STATE_PATH": os.path.join(STATE, "shared_state.db"),
+    "SESSION_DIR": os.path.join(STATE, "sessions"),
+})
+sys.path.insert(0, HERE)
+os.chdir(HERE)
+
+# Needs a server on localhost:5000; run it by hand with `python test_app_functionality.py`
+collect_ignore = ["test_app_functionality.py"]
+
+
+@pytest.fixture(scope="session")
+def app_module():
+    import app
+    return app
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
+
+
+@pytest.fixture
+def model_calls(app_module, monkeypatch):
+    """(model, contents, config) of every model call the app makes during a test"""
+    calls = []
+    generate_content = app_module.generate_content
+
+    async def recording(model, contents, config):
+        calls.append((model, contents, config))
+        return await generate_content(model, contents, config)
+
+    monkeypatch.setattr(app_module, 'generate_content', recording)
+    return calls
+
+
+@pytest.fixture
+def crop_photo():
+    """make(seed) -> JPEG bytes of a sharp, leaf-green photo that passes the quality gate
+
+    Different seeds give photos far apart in dHash, the same seed the same photo.
+    """
+    def make(seed, size=480):
+        rng = np.random.default_rng(seed)
+        pixels = np.zeros((size, size, 3), dtype=np.uint8)
+        pixels[..., 0] = rng.integers(40, 90, (size, size))
+        pixels[..., 1] = rng.integers(110, 200, (size, size))
+        pixels[..., 2] = rng.integers(30, 70, (size, size))
+        # Coarse blocks of light and shade, so photos differ in their low-resolution hash too
+        blocks = rng.uniform(0.6, 1.0, (9, 9)).repeat(-(-size // 9), 0).repeat(-(-size // 9), 1)[:size, :size]
+        pixels = (pixels * blocks[..., None]).astype(np.uint8)
+        buffer = io.BytesIO()
+        Image.fromarray(pixels).save(buffer, format='JPEG', quality=90)
+        return buffer.getvalue()
+    return make
@@ -0,0 +1,230 @@
+"""Offline stand-in for the parts of google-genai's Client that app.py uses
+
+Enabled with GENAI_FAKE=1. Every call sleeps for a lognormal latency and fails with a
+503 at a configurable rate, so benchmarks exercise the same code paths (routing,
+escalation, retries, backpressure) without a network or an API key.
+"""
+import asyncio
+import itertools
+import json
+import math
+import random
+import threading
+import time
+
+from google.genai import errors as genai_errors
+from google.genai import types
+
+FAKE_ANSWER = (
+    "For sugarcane, keep the field weed free for the first 90 days, give irrigation every "
+    "8-10 days in summer and 15-20 days in winter, and split nitrogen into three doses at "
+    "planting, tillering and grand growth. Remove and destroy affected shoots, and consult "
+    "your local Krishi Vigyan Kendra before spraying any pesticide."
+)
+
+
+class LatencyModel:
+    """Lognormal latency around a median, plus a failure probability"""
+
+    def __init__(self, median=0.8, sigma=0.5, failure_rate=0.0, seed=None):
+        self.median = median
+        self.sigma = sigma
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self, scale=1.0):
+        """Seconds for one call; raises a 503 ServerError for a failed call"""
+        with self._lock:
+            seconds = self.median * scale * math.exp(self._random.gauss(0, self.sigma)) if self.median else 0
+            failed = self._random.random() < self.failure_rate
+        if failed:
+            raise genai_errors.ServerError(503, {'error': {
+                'code': 503, 'message': 'Fake upstream overloaded', 'status': 'UNAVAILABLE',
+            }})
+        return seconds
+
+
+def _prompt_text(contents):
+    if isinstance(contents, str):
+        return contents
+    texts = []
+    for item in contents if isinstance(contents, list) else [contents]:
+        if isinstance(item, str):
+            texts.append(item)
+        elif isinstance(item, types.Content):
+            texts.extend(part.text for part in item.parts or [] if part.text)
+        elif isinstance(item, types.Part) and item.text:
+            texts.append(item.text)
+    return "\n".join(texts)
+
+
+def _image_count(contents):
+    items = contents if isinstance(contents, list) else [contents]
+    return sum(1 for item in items if isinstance(item, types.Content)
+               for part in item.parts or [] if part.inline_data)
+
+
+def _fake_json(schema, count, number=1):
+    """A value matching a response schema; arrays get one element per attached image"""
+    if schema.type == types.Type.OBJECT:
+        return {name: _fake_json(prop, count, number) for name, prop in (schema.properties or {}).items()}
+    if schema.type == types.Type.ARRAY:
+        return [_fake_json(schema.items, count, n) for n in range(1, max(1, count) + 1)]
+    if schema.type == types.Type.INTEGER:
+        return number
+    if schema.enum:
+        return schema.enum[number % len(schema.enum)]
+    sentences = FAKE_ANSWER.split('. ')
+    return sentences[number % len(sentences)]
+
+
+def _response(model, contents, config, text=None):
+    prompt = _prompt_text(contents)
+    if config is not None and getattr(config, 'system_instruction', None):
+        prompt += _prompt_text(config.system_instruction)
+    if text is None and config is not None and getattr(config, 'response_schema', None):
+        schema = config.response_schema
+        if isinstance(schema, dict):
+            schema = types.Schema.model_validate(schema)
+        text = json.dumps(_fake_json(schema, _image_count(contents)))
+    text = text or FAKE_ANSWER
+    cached = 0
+    if config is not None and getattr(config, 'cached_content', None):
+        cached = 1024
+    return types.GenerateContentResponse(
+        model_version=model,
+        candidates=[types.Candidate(
+            content=types.Content(role='model', parts=[types.Part(text=text)]),
+            finish_reason=types.FinishReason.STOP,
+        )],
+        usage_metadata=types.GenerateContentResponseUsageMetadata(
+            prompt_token_count=len(prompt) // 4 + cached,
+            cached_content_token_count=cached or None,
+            candidates_token_count=len(text) // 4,
+            total_token_count=(len(prompt) + len(text)) // 4 + cached,
+        ),
+    )
+
+
+def _chunks(text, count):
+    words = text.split(' ')
+    size = max(1, math.ceil(len(words) / count))
+    for i in range(0, len(words), size):
+        yield ' '.join(words[i:i + size]) + (' ' if i + size < len(words) else '')
+
+
+class _Models:
+    def __init__(self, fake):
+        self._fake = fake
+
+    def get(self, model, config=None):
+        time.sleep(self._fake.latency.sample(0.1))
+        return types.Model(name=f"models/{model}", display_name=model)
+
+    def generate_content(self, model, contents, config=None):
+        time.sleep(self._fake.latency.sample())
+        return _response(model, contents, config)
+
+    def generate_content_stream(self, model, contents, config=None):
+        total = self._fake.latency.sample()
+        for chunk in _chunks(FAKE_ANSWER, self._fake.stream_chunks):
+            time.sleep(total / self._fake.stream_chunks)
+            yield _response(model, contents, config, chunk)
+
+
+class _AsyncModels:
+    def __init__(self, fake):
+        self._fake = fake
+
+    async def get(self, model, config=None):
+        await asyncio.sleep(self._fake.latency.sample(0.1))
+        return types.Model(name=f"models/{model}", display_name=model)
+
+    async def generate_content(self, model, contents, config=None):
+        await asyncio.sleep(self._fake.latency.sample())
+        return _response(model, contents, config)
+
+    async def generate_content_stream(self, model, contents, config=None):
+        total = self._fake.latency.sample()
+
+        async def stream():
+            for chunk in _chunks(FAKE_ANSWER, self._fake.stream_chunks):
+                await asyncio.sleep(total / self._fake.stream_chunks)
+                yield _response(model, contents, config, chunk)
+        return stream()
+
+
+class _AsyncCaches:
+    def __init__(self, fake):
+        self._fake = fake
+
+    async def create(self, model, config=None):
+        await asyncio.sleep(self._fake.latency.sample(0.5))
+        return types.CachedContent(name=f"cachedContents/fake-{next(self._fake.ids)}", model=model)
+
+    async def delete(self, name, config=None):
+        await asyncio.sleep(self._fake.latency.sample(0.1))
+
+
+class _FileSearchStores:
+    def __init__(self, fake):
+        self._fake = fake
+        self._stores = {}
+
+    def create(self, config=None):
+        time.sleep(self._fake.latency.sample(0.3))
+        display_name = (config or {}).get('display_name') if isinstance(config, dict) else config.display_name
+        store = types.FileSearchStore(name=f"fileSearchStores/fake-{next(self._fake.ids)}", display_name=display_name)
+        self._stores[store.name] = store
+        return store
+
+    def list(self, config=None):
+        return list(self._stores.values())
+
+    def get(self, name, config=None):
+        return self._stores.get(name) or types.FileSearchStore(name=name)
+
+    def delete(self, name, config=None):
+        self._stores.pop(name, None)
+
+    def upload_to_file_search_store(self, file_search_store_name, file, config=None):
+        time.sleep(self._fake.latency.sample(0.5))
+        name = f"{file_search_store_name}/upload/operations/fake-{next(self._fake.ids)}"
+        self._fake.operations.start(name, self._fake.upload_seconds)
+        return types.UploadToFileSearchStoreOperation(name=name, done=False)
+
+
+class _Operations:
+    def __init__(self, fake):
+        self._fake = fake
+        self._ready_at = {}
+
+    def start(self, name, seconds):
+        self._ready_at[name] = time.monotonic() + seconds
+
+    def get(self, operation, config=None):
+        time.sleep(self._fake.latency.sample(0.05))
+        done = time.monotonic() >= self._ready_at.get(operation.name, 0)
+        return types.UploadToFileSearchStoreOperation(name=operation.name, done=done)
+
+
+class _Aio:
+    def __init__(self, fake):
+        self.models = _AsyncModels(fake)
+        self.caches = _AsyncCaches(fake)
+
+
+class FakeClient:
+    """genai.Client look-alike: models, aio.models, aio.caches, file_search_stores, operations"""
+
+    def __init__(self, latency_median=0.8, latency_sigma=0.5, failure_rate=0.0, stream_chunks=8,
+                 upload_seconds=2.0, seed=None):
+        self.latency = LatencyModel(latency_median, latency_sigma, failure_rate, seed)
+        self.stream_chunks = stream_chunks
+        self.upload_seconds = upload_seconds
+        self.ids = itertools.count(1)
+        self.models = _Models(self)
+        self.aio = _Aio(self)
+        self.file_search_stores = _FileSearchStores(self)
+        self.operations = _Operations(self)
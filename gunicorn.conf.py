@@ -0,0 +1,43 @@
+# Gunicorn settings shared by Procfile and render.yaml
+import os
+import sys
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+
+# Threads only park on upstream futures (the Gemini calls run on each worker's
+# upstream event loop), so a worker can hold many more requests than it has CPUs
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "64"))
+
+# Import the app once in the master; workers fork with it loaded and share its pages.
+# Per-process work (threads, provider clients, warm-up) starts in post_fork instead.
+preload_app = os.getenv("GUNICORN_PRELOAD", "1").lower() in ("1", "true", "yes")
+if preload_app:
+    os.environ["WORKER_START_DEFERRED"] = "1"
+
+timeout = 120
+keepalive = 5
+accesslog = "-"
+errorlog = "-"
+
+
+def when_ready(server):
+    """Master, after preloading: import google.genai here too so workers do not each import it"""
+    if preload_app:
+        import app
+        app.load_heavy_modules()
+
+
+def post_fork(server, worker):
+    """Worker, right after fork: start what does not survive fork()"""
+    if preload_app:
+        import app
+        app.start_worker()
+
+
+def worker_exit(server, worker):
+    """Worker, on its way out: publish the metrics counted since its last snapshot"""
+    app = sys.modules.get("app")
+    if app is not None:
+        app.metrics.flush()
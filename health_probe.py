@@ -0,0 +1,106 @@
+"""Background readiness prober so health endpoints never call the provider themselves"""
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+logger = logging.getLogger(__name__)
+
+
+class ReadinessProber:
+    """Runs named checks on an interval in a daemon thread and caches the outcome
+
+    A check is a callable that returns a short detail (or None) when healthy and raises
+    otherwise. Each check gets `timeout` seconds; one that is still running from an earlier
+    round is reported as hung instead of being started again, so a stalled provider costs
+    one thread, never a request worker. status() only reads the cached result.
+    """
+
+    def __init__(self, checks, interval=30.0, timeout=5.0, stale_after=None):
+        self.checks = checks
+        self.interval = interval
+        self.timeout = timeout
+        self.stale_after = stale_after or interval * 3
+        self._results = {}
+        self._checked_at = None
+        self._running = {}
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def ensure_started(self):
+        """Start the probe thread in this process (again after fork)"""
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._running = {}
+            self._pid = os.getpid()
+            threading.Thread(target=self._loop, name='readiness-prober', daemon=True).start()
+
+    def _loop(self):
+        while True:
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Readiness probe round failed: {str(e)}")
+            time.sleep(self.interval)
+
+    def _submit(self, name, check):
+        # Daemon threads rather than an executor: a hung check must not block worker exit
+        future = Future()
+
+        def run():
+            start = time.perf_counter()
+            try:
+                detail = check()
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result((detail, time.perf_counter() - start))
+
+        threading.Thread(target=run, name=f'readiness-{name}', daemon=True).start()
+        return future
+
+    def run_once(self):
+        """Run every check once and publish the results"""
+        futures = {}
+        for name, check in self.checks.items():
+            previous = self._running.get(name)
+            if previous is not None and not previous.done():
+                continue
+            futures[name] = self._running[name] = self._submit(name, check)
+
+        results = {}
+        deadline = time.monotonic() + self.timeout
+        for name in self.checks:
+            future = futures.get(name)
+            if future is None:
+                results[name] = {'ok': False, 'error': 'previous check still running', 'latency_ms': None}
+                continue
+            try:
+                detail, seconds = future.result(timeout=max(0.0, deadline - time.monotonic()))
+                results[name] = {'ok': True, 'detail': detail, 'latency_ms': round(seconds * 1000, 1)}
+            except FutureTimeout:
+                results[name] = {'ok': False, 'error': f'timed out after {self.timeout:g}s', 'latency_ms': None}
+            except Exception as e:
+                results[name] = {'ok': False, 'error': str(e), 'latency_ms': None}
+
+        for name, result in results.items():
+            was_ok = self._results.get(name, {}).get('ok')
+            if not result['ok'] and was_ok is not False:
+                logger.warning(f"Readiness check '{name}' failing: {result['error']}")
+            elif result['ok'] and was_ok is False:
+                logger.info(f"Readiness check '{name}' recovered")
+        self._results = results
+        self._checked_at = time.time()
+
+    def status(self):
+        """Cached readiness: {"ready", "checked_at", "age_seconds", "checks"}"""
+        checked_at, results = self._checked_at, self._results
+        if checked_at is None:
+            return {'ready': False, 'checked_at': None, 'age_seconds': None, 'checks': {}}
+        age = time.time() - checked_at
+        ready = age <= self.stale_after and all(r['ok'] for r in results.values())
+        return {'ready': ready, 'checked_at': checked_at, 'age_seconds': round(age, 1), 'checks': results}
@@ -0,0 +1,113 @@
+"""Perceptual-hash index mapping crop photos to previous analyses"""
+import hashlib
+import threading
+import time
+
+from PIL import Image
+
+HASH_SIZE = 8
+
+NAMESPACE = 'image_analyses'
+META_NAMESPACE = 'image_analyses_meta'
+
+
+def dhash(image, hash_size=HASH_SIZE):
+    """64-bit difference hash over a grayscale (hash_size+1 x hash_size) thumbnail"""
+    small = image.convert('L').resize((hash_size + 1, hash_size), Image.BILINEAR)
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] < pixels[offset + col + 1])
+    return value
+
+
+def _key(image_hash, language, notes=''):
+    key = f"{language}:{image_hash:016x}"
+    if notes:
+        key += ':' + hashlib.sha256(notes.encode('utf-8')).hexdigest()[:16]
+    return key
+
+
+def hamming(a, b):
+    """Number of differing bits between two hashes"""
+    return (a ^ b).bit_count()
+
+
+class PerceptualHashIndex:
+    """Near-duplicate image lookup by Hamming distance over analyses kept in shared state
+
+    Entries are kept per language (an analysis is written in the farmer's language) and
+    per normalized notes (the farmer's question shapes the analysis and the model tier),
+    in the `image_analyses` namespace of a SharedState, so every worker sees every stored
+    analysis and they survive restarts. Each process scans an in-memory copy and reloads
+    it when the namespace's generation counter moves (one point read per lookup).
+    """
+
+    def __init__(self, state, threshold=6, max_entries=5000, ttl_seconds=30 * 86400):
+        self.state = state
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = []
+        self._generation = None
+        self._lock = threading.Lock()
+        self.counters = {'hits': 0, 'misses': 0, 'stores': 0}
+
+    def _load(self):
+        generation = self.state.get(META_NAMESPACE, 'generation', 0)
+        if generation == self._generation:
+            return
+        entries = [dict(entry, hash=int(entry['hash'], 16)) for _, entry in self.state.items(NAMESPACE)]
+        entries.sort(key=lambda e: e['created_at'])
+        self._entries = entries
+        self._generation = generation
+
+    def lookup(self, image_hash, language, notes=''):
+        """Closest stored analysis within the threshold for this language and notes, or None"""
+        with self._lock:
+            self._load()
+            cutoff = time.time() - self.ttl_seconds
+            best, best_distance = None, self.threshold + 1
+            for entry in self._entries:
+                if entry['language'] != language or entry.get('notes', '') != notes or entry['created_at'] < cutoff:
+                    continue
+                distance = hamming(entry['hash'], image_hash)
+                if distance < best_distance:
+                    best, best_distance = entry, distance
+            if best is None:
+                self.counters['misses'] += 1
+                return None
+            self.counters['hits'] += 1
+            return dict(best, distance=best_distance)
+
+    def add(self, image_hash, language, analysis, notes='', finding=None):
+        """Remember an analysis for an image hash (and the structured survey finding it came from)"""
+        entry = {'hash': image_hash, 'language': language, 'notes': notes, 'analysis': analysis,
+                 'created_at': time.time()}
+        if finding is not None:
+            entry['finding'] = finding
+        self.state.set(NAMESPACE, _key(image_hash, language, notes), dict(entry, hash=f"{image_hash:016x}"),
+                       ttl=self.ttl_seconds)
+        with self._lock:
+            self._load()
+            self._entries = [e for e in self._entries
+                             if (e['hash'], e['language'], e.get('notes', '')) != (image_hash, language, notes)]
+            self._entries.append(entry)
+            overflow = self._entries[:max(0, len(self._entries) - self.max_entries)]
+            self._entries = self._entries[len(overflow):]
+            self.counters['stores'] += 1
+        for old in overflow:
+            self.state.delete(NAMESPACE, _key(old['hash'], old['language'], old.get('notes', '')))
+        # Other workers reload on the new generation; this one is already up to date unless
+        # someone else stored in between
+        generation = self.state.incr(META_NAMESPACE, 'generation')
+        with self._lock:
+            if self._generation == generation - 1:
+                self._generation = generation
+
+    def stats(self):
+        """Hit/miss counters and current size"""
+        with self._lock:
+            return dict(self.counters, entries=len(self._entries))
@@ -0,0 +1,98 @@
+"""Image normalization before crop photos are sent to the vision model"""
+import io
+import logging
+from collections import namedtuple
+
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# Refuse absurd dimensions (decompression bombs). PIL itself only warns up to twice this
+# and raises above it; open_image() refuses everything over it
+Image.MAX_IMAGE_PIXELS = 80_000_000
+
+OUTPUT_FORMATS = {
+    'jpeg': ('JPEG', 'image/jpeg'),
+    'webp': ('WEBP', 'image/webp'),
+}
+
+NormalizedImage = namedtuple(
+    'NormalizedImage',
+    ['data', 'mime_type', 'width', 'height', 'original_bytes', 'original_format', 'image']
+)
+
+
+class InvalidImageError(ValueError):
+    """Raised when uploaded bytes are not a decodable image"""
+
+
+def _source(data):
+    """Seekable binary file for bytes or an already open file, rewound to the start"""
+    source = io.BytesIO(data) if isinstance(data, (bytes, bytearray)) else data
+    source.seek(0)
+    return source
+
+
+def _source_size(data):
+    if isinstance(data, (bytes, bytearray)):
+        return len(data)
+    return data.seek(0, io.SEEK_END)
+
+
+def open_image(data, max_edge=None):
+    """Decode image bytes (or a seekable file) fully, raising InvalidImageError for corrupt or truncated files"""
+    try:
+        with Image.open(_source(data)) as probe:
+            probe.verify()
+        if probe.width * probe.height > Image.MAX_IMAGE_PIXELS:
+            raise Image.DecompressionBombError(
+                f"Image size ({probe.width * probe.height} pixels) exceeds limit of {Image.MAX_IMAGE_PIXELS} pixels"
+            )
+        image = Image.open(_source(data))
+        original_format = image.format
+        if max_edge and original_format == 'JPEG':
+            # Let libjpeg decode at a reduced scale - much cheaper than a full decode + resize
+            image.draft('RGB', (max_edge, max_edge))
+        image.load()
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError) as e:
+        raise InvalidImageError(str(e)) from e
+    return image, original_format
+
+
+def normalize_image(data, max_edge=1600, output_format='jpeg', quality=82):
+    """Apply EXIF orientation, downscale to max_edge and re-encode without metadata
+
+    data is bytes or a seekable binary file; a file (e.g. Werkzeug's spooled upload) is
+    decoded in place instead of being read into memory first.
+    """
+    fmt, mime_type = OUTPUT_FORMATS.get(output_format.lower(), OUTPUT_FORMATS['jpeg'])
+    original_bytes = _source_size(data)
+    image, original_format = open_image(data, max_edge)
+
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        image = background
+    elif image.mode != 'RGB':
+        image = image.convert('RGB')
+
+    if max(image.size) > max_edge:
+        image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+    out = io.BytesIO()
+    if fmt == 'JPEG':
+        image.save(out, fmt, quality=quality, optimize=True, progressive=True)
+    else:
+        image.save(out, fmt, quality=quality, method=4)
+
+    return NormalizedImage(
+        data=out.getvalue(),
+        mime_type=mime_type,
+        width=image.width,
+        height=image.height,
+        original_bytes=original_bytes,
+        original_format=original_format,
+        image=image,
+    )
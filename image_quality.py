@@ -0,0 +1,129 @@
+"""Local quality gate for crop photos: resolution, exposure, blur and vegetation checks"""
+import logging
+from collections import namedtuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Checks in the order they run; the cheap ones first
+CHECKS = ('resolution', 'exposure', 'sharpness', 'vegetation')
+
+# Measures are taken on a small copy: enough detail for the statistics, a few milliseconds each
+ANALYSIS_EDGE = 512
+
+SHARPNESS_BUCKETS = (5, 10, 20, 30, 50, 75, 100, 150, 250, 500, 1000, 2500)
+BRIGHTNESS_BUCKETS = (10, 20, 30, 40, 60, 80, 120, 160, 200, 220, 235, 245)
+RATIO_BUCKETS = (0.01, 0.02, 0.05, 0.1, 0.15, 0.2, 0.3, 0.5, 0.7, 0.9)
+
+QualityReport = namedtuple('QualityReport', ['ok', 'failed', 'measures'])
+
+
+def laplacian_variance(gray):
+    """Variance of the 4-neighbour Laplacian of a grayscale array (low = blurry)"""
+    g = gray.astype(np.float32)
+    lap = g[1:-1, :-2] + g[1:-1, 2:] + g[:-2, 1:-1] + g[2:, 1:-1] - 4 * g[1:-1, 1:-1]
+    return float(lap.var())
+
+
+def vegetation_ratio(image):
+    """Share of pixels coloured like leaves: yellow to green hues, not grey, not black"""
+    h, s, v = (np.asarray(c) for c in image.convert('HSV').split())
+    # PIL hue is 0-255 for 0-360 degrees: 25-170 degrees covers dry yellow to blue-green leaves
+    leafy = (h >= 18) & (h <= 120) & (s >= 50) & (v >= 40)
+    return float(leafy.mean())
+
+
+class ImageQualityGate:
+    """Rejects photos the vision model cannot use before any model call is made
+
+    Thresholds: the shorter edge in pixels, mean brightness bounds (0-255) and the
+    share of clipped pixels, Laplacian variance for focus and the share of leaf-coloured
+    pixels. With `enforce` off every photo passes but is still measured and counted,
+    so thresholds can be tuned from the reject rates before switching it on. Measures
+    and outcomes go to the metrics registry (all workers).
+    """
+
+    def __init__(self, metrics, enforce=True, min_edge=320, min_brightness=40, max_brightness=225,
+                 max_clipped=0.5, min_sharpness=30.0, min_vegetation=0.05):
+        self.metrics = metrics
+        self.enforce = enforce
+        self.min_edge = min_edge
+        self.min_brightness = min_brightness
+        self.max_brightness = max_brightness
+        self.max_clipped = max_clipped
+        self.min_sharpness = min_sharpness
+        self.min_vegetation = min_vegetation
+        metrics.counter('image_quality_checks_total', 'Photo quality checks by check and result')
+        metrics.histogram('image_quality_sharpness', 'Laplacian variance of checked photos', SHARPNESS_BUCKETS)
+        metrics.histogram('image_quality_brightness', 'Mean brightness (0-255) of checked photos', BRIGHTNESS_BUCKETS)
+        metrics.histogram('image_quality_vegetation', 'Share of leaf-coloured pixels in checked photos', RATIO_BUCKETS)
+
+    def measure(self, image):
+        """Brightness, clipping, sharpness and vegetation of an RGB image"""
+        factor = -(-max(image.size) // ANALYSIS_EDGE)
+        small = image.reduce(factor) if factor > 1 else image
+        gray = np.asarray(small.convert('L'))
+        return {
+            'width': image.width,
+            'height': image.height,
+            'brightness': float(gray.mean()),
+            'dark_share': float((gray < 16).mean()),
+            'bright_share': float((gray > 240).mean()),
+            'sharpness': laplacian_variance(gray),
+            'vegetation': vegetation_ratio(small),
+        }
+
+    def _failures(self, m):
+        failed = []
+        if min(m['width'], m['height']) < self.min_edge:
+            failed.append('resolution')
+        if m['brightness'] < self.min_brightness or m['dark_share'] > self.max_clipped:
+            failed.append('exposure_dark')
+        elif m['brightness'] > self.max_brightness or m['bright_share'] > self.max_clipped:
+            failed.append('exposure_bright')
+        if m['sharpness'] < self.min_sharpness:
+            failed.append('sharpness')
+        if m['vegetation'] < self.min_vegetation:
+            failed.append('vegetation')
+        return failed
+
+    def check(self, image):
+        """QualityReport for an RGB image; failed lists the checks it did not pass"""
+        measures = self.measure(image)
+        failed = self._failures(measures)
+        self.metrics.observe('image_quality_sharpness', measures['sharpness'])
+        self.metrics.observe('image_quality_brightness', measures['brightness'])
+        self.metrics.observe('image_quality_vegetation', measures['vegetation'])
+        failed_checks = {f.split('_')[0] for f in failed}
+        for check in CHECKS:
+            self.metrics.inc('image_quality_checks_total', check=check,
+                             result='fail' if check in failed_checks else 'pass')
+        ok = not failed or not self.enforce
+        if failed:
+            logger.info(f"Photo quality {'rejected' if not ok else 'would reject'}: {','.join(failed)} "
+                        f"(sharpness={measures['sharpness']:.0f} brightness={measures['brightness']:.0f} "
+                        f"vegetation={measures['vegetation']:.2f} size={measures['width']}x{measures['height']})")
+        return QualityReport(ok, failed, {k: round(v, 4) for k, v in measures.items()})
+
+    def stats(self):
+        """Per-check pass/fail counts and reject rates (all workers), with the thresholds in force"""
+        counts = {check: {'passed': 0, 'failed': 0} for check in CHECKS}
+        for labels, (value,) in self.metrics.series('image_quality_checks_total'):
+            if labels.get('check') in counts:
+                counts[labels['check']]['passed' if labels['result'] == 'pass' else 'failed'] += value
+        for check in counts.values():
+            total = check['passed'] + check['failed']
+            check['reject_rate'] = round(check['failed'] / total, 4) if total else 0.0
+        return {
+            'enforce': self.enforce,
+            'checks': counts,
+            'thresholds': {
+                'min_edge': self.min_edge,
+                'min_brightness': self.min_brightness,
+                'max_brightness': self.max_brightness,
+                'max_clipped': self.max_clipped,
+                'min_sharpness': self.min_sharpness,
+                'min_vegetation': self.min_vegetation,
+            },
+        }
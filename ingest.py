@@ -0,0 +1,418 @@
+"""Local document extraction and chunking for knowledge_base/ and uploads/
+
+Library: ingest(roots, store_dir) extracts changed documents in a process pool, normalizes
+the text and writes token-bounded chunks to a ChunkStore; ingest_in_subprocess() runs the
+same in a `python ingest.py` process. CLI: python ingest.py --help
+"""
+import argparse
+import fcntl
+import gzip
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import re
+import subprocess
+import sys
+import time
+import unicodedata
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from xml.etree import ElementTree
+
+from retrieval import read_text_file
+from store_registry import file_sha256
+
+logger = logging.getLogger(__name__)
+
+DOCUMENT_EXTENSIONS = {'txt', 'md', 'pdf', 'docx'}
+CHUNK_TOKENS = 300
+CHUNK_OVERLAP_TOKENS = 60
+
+# Bump when extraction or chunking changes so every document is reprocessed
+PIPELINE_VERSION = 1
+
+WORD_NS = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+
+# Invisible characters that only break matching (ZWJ/ZWNJ are kept: Indic scripts need them)
+_INVISIBLE_RE = re.compile('[\u00ad\u200b\u2060\ufeff]')
+_SPACE_RE = re.compile('[ \t\u00a0\u2000-\u200a\u202f\u205f\u3000]+')
+_CONTROL_RE = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\x7f]')
+_HYPHEN_BREAK_RE = re.compile(r'(?<=[A-Za-z])-\n(?=[a-z])')
+_BLANK_LINES_RE = re.compile(r'\n{3,}')
+
+
+class UnsupportedDocument(ValueError):
+    """A document type (or PDF without pypdf) that cannot be extracted locally"""
+
+
+def normalize_text(text):
+    """NFC-normalize and clean extracted text
+
+    Indic text from PDFs and Word files mixes precomposed and decomposed forms (nukta,
+    vowel signs), stray soft hyphens and zero-width spaces, and odd spacing; all of these
+    make identical words tokenize differently.
+    """
+    text = unicodedata.normalize('NFC', text)
+    text = text.replace('\r\n', '\n').replace('\r', '\n')
+    text = _INVISIBLE_RE.sub('', text)
+    text = _CONTROL_RE.sub(' ', text)
+    text = _HYPHEN_BREAK_RE.sub('', text)
+    lines = [_SPACE_RE.sub(' ', line).strip() for line in text.split('\n')]
+    return _BLANK_LINES_RE.sub('\n\n', '\n'.join(lines)).strip()
+
+
+def _read_docx(path):
+    """Paragraph text of a .docx (document body only), without python-docx"""
+    try:
+        with zipfile.ZipFile(path) as archive:
+            root = ElementTree.fromstring(archive.read('word/document.xml'))
+    except (zipfile.BadZipFile, KeyError, ElementTree.ParseError) as e:
+        raise UnsupportedDocument(f"Not a readable .docx file: {str(e)}") from e
+    paragraphs = []
+    for paragraph in root.iter(f'{WORD_NS}p'):
+        parts = []
+        for node in paragraph.iter():
+            if node.tag == f'{WORD_NS}t' and node.text:
+                parts.append(node.text)
+            elif node.tag == f'{WORD_NS}tab':
+                parts.append('\t')
+            elif node.tag in (f'{WORD_NS}br', f'{WORD_NS}cr'):
+                parts.append('\n')
+        paragraphs.append(''.join(parts))
+    return '\n'.join(paragraphs)
+
+
+def _read_pdf(path):
+    try:
+        from pypdf import PdfReader
+        from pypdf.errors import PdfReadError
+    except ImportError:
+        raise UnsupportedDocument("PDF extraction needs the pypdf package")
+    try:
+        reader = PdfReader(path)
+        return '\n\n'.join(page.extract_text() or '' for page in reader.pages)
+    except (PdfReadError, ValueError, KeyError) as e:
+        raise UnsupportedDocument(f"Not a readable PDF: {str(e)}") from e
+
+
+EXTRACTORS = {'txt': read_text_file, 'md': read_text_file, 'docx': _read_docx, 'pdf': _read_pdf}
+
+
+def extract_text(path):
+    """Raw text of a document by extension; raises UnsupportedDocument otherwise"""
+    ext = path.rsplit('.', 1)[1].lower() if '.' in path else ''
+    extractor = EXTRACTORS.get(ext)
+    if extractor is None:
+        raise UnsupportedDocument(f"No local extractor for .{ext} files")
+    return extractor(path)
+
+
+def chunk_tokens(text, max_tokens=CHUNK_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS):
+    """Split text into word windows of at most max_tokens estimated tokens
+
+    Consecutive chunks share about overlap_tokens of text. A window ends early at a
+    paragraph break once it is at least half full, so chunks rarely straddle sections.
+    """
+    paragraphs = [p.split() for p in text.split('\n\n')]
+    words = []
+    for paragraph in paragraphs:
+        for i, word in enumerate(paragraph):
+            # ~4 UTF-8 bytes per token, counting the separating space
+            words.append((word, (len(word.encode('utf-8')) + 4) // 4, i == len(paragraph) - 1))
+    chunks = []
+    start = 0
+    while start < len(words):
+        end = start
+        used = 0
+        while end < len(words) and (end == start or used + words[end][1] <= max_tokens):
+            used += words[end][1]
+            end += 1
+            if words[end - 1][2] and used * 2 >= max_tokens:
+                break
+        chunks.append({'text': ' '.join(w for w, _, _ in words[start:end]), 'tokens': used})
+        if end >= len(words):
+            break
+        # Step back over ~overlap_tokens words, always moving forward by at least one
+        back = end
+        carried = 0
+        while back - 1 > start and carried + words[back - 1][1] <= overlap_tokens:
+            back -= 1
+            carried += words[back][1]
+        start = back
+    return chunks
+
+
+def process_document(path, chunk_path, max_tokens, overlap_tokens):
+    """Extract, normalize and chunk one document into chunk_path (runs in a pool process)
+
+    Returns {'chunks', 'tokens', 'characters'}. Written to a temporary name and renamed, so
+    an interrupted run never leaves a truncated chunk file behind.
+    """
+    text = normalize_text(extract_text(path))
+    chunks = chunk_tokens(text, max_tokens, overlap_tokens)
+    os.makedirs(os.path.dirname(chunk_path), exist_ok=True)
+    tmp_path = f"{chunk_path}.{os.getpid()}.tmp"
+    with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+        for chunk in chunks:
+            f.write(json.dumps(chunk, ensure_ascii=False) + '\n')
+    os.replace(tmp_path, chunk_path)
+    return {'chunks': len(chunks), 'tokens': sum(c['tokens'] for c in chunks), 'characters': len(text)}
+
+
+class ChunkStore:
+    """Chunks on disk: chunks/<aa>/<sha256>-<settings>.jsonl.gz plus manifest.json
+
+    Chunk files are addressed by content hash and chunking settings, so identical
+    documents (a knowledge base file re-uploaded under another name) share one file.
+    manifest.json maps each source path to its category, mtime, size, hash and chunk
+    file, or the extraction error. Writers hold an flock on <directory>/.lock.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.manifest_path = os.path.join(directory, 'manifest.json')
+
+    @contextmanager
+    def locked(self):
+        """Exclusive lock for a writer (one ingestion run at a time across processes)"""
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, '.lock'), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def read_manifest(self):
+        """The manifest, or an empty one"""
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'version': PIPELINE_VERSION, 'settings': None, 'files': {}}
+        except ValueError as e:
+            logger.error(f"Chunk manifest is corrupt, reprocessing everything: {str(e)}")
+            return {'version': PIPELINE_VERSION, 'settings': None, 'files': {}}
+
+    def write_manifest(self, manifest):
+        """Replace the manifest atomically"""
+        tmp_path = f"{self.manifest_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=1, ensure_ascii=False)
+        os.replace(tmp_path, self.manifest_path)
+
+    def chunk_path(self, digest, settings_key):
+        """Location of the chunk file for a content hash and chunking settings"""
+        return os.path.join(self.directory, 'chunks', digest[:2], f"{digest}-{settings_key}.jsonl.gz")
+
+    def read_chunks(self, entry):
+        """Chunks ({'text', 'tokens'}) of one manifest entry"""
+        if not entry.get('chunk_file'):
+            return []
+        with gzip.open(os.path.join(self.directory, entry['chunk_file']), 'rt', encoding='utf-8') as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def iter_chunks(self):
+        """Yield (source path, manifest entry, chunk) for every stored chunk"""
+        for path, entry in self.read_manifest()['files'].items():
+            for chunk in self.read_chunks(entry):
+                yield path, entry, chunk
+
+    def collect_garbage(self, manifest):
+        """Delete chunk files no manifest entry points at; returns how many"""
+        live = {entry['chunk_file'] for entry in manifest['files'].values() if entry.get('chunk_file')}
+        removed = 0
+        chunk_root = os.path.join(self.directory, 'chunks')
+        for dirpath, _, filenames in os.walk(chunk_root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                if os.path.relpath(path, self.directory) not in live:
+                    os.remove(path)
+                    removed += 1
+        return removed
+
+
+def scan_documents(roots, extensions=DOCUMENT_EXTENSIONS):
+    """Return {path: (category, mtime_ns, size)} for every document under the roots
+
+    roots is a list of (directory, category); category None means "use the first
+    sub-folder name" (knowledge_base/<category>/...). Hidden folders are skipped.
+    """
+    found = {}
+    for directory, category in roots:
+        if not os.path.isdir(directory):
+            continue
+        for dirpath, dirnames, filenames in os.walk(directory):
+            dirnames[:] = [d for d in dirnames if not d.startswith('.')]
+            for filename in filenames:
+                if '.' not in filename or filename.rsplit('.', 1)[1].lower() not in extensions:
+                    continue
+                path = os.path.join(dirpath, filename)
+                rel = os.path.relpath(dirpath, directory)
+                file_category = category or (rel.split(os.sep)[0] if rel != '.' else 'general')
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                found[path] = (file_category, st.st_mtime_ns, st.st_size)
+    return found
+
+
+def ingest(roots, store_dir, workers=None, max_tokens=CHUNK_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS,
+           force=False):
+    """Bring the chunk store up to date with the documents under roots
+
+    Unchanged files (same mtime and size) are skipped without reading them; a changed
+    mtime with the same content hash only updates the manifest. The rest is extracted in
+    a pool of `workers` processes (inline for a single file). Returns a summary dict.
+    """
+    store = ChunkStore(store_dir)
+    settings = {'version': PIPELINE_VERSION, 'max_tokens': max_tokens, 'overlap_tokens': overlap_tokens}
+    settings_key = hashlib.sha256(json.dumps(settings, sort_keys=True).encode()).hexdigest()[:8]
+    started = time.perf_counter()
+
+    with store.locked():
+        manifest = store.read_manifest()
+        if manifest.get('settings') != settings:
+            force = True
+        previous = {} if force else manifest['files']
+        found = scan_documents(roots)
+
+        files = {}
+        pending = {}
+        summary = {'added': 0, 'changed': 0, 'removed': 0, 'unchanged': 0, 'failed': 0}
+        summary['removed'] = sum(1 for path in manifest['files'] if path not in found)
+        for path, (category, mtime, size) in found.items():
+            entry = previous.get(path)
+            if entry and (entry['mtime_ns'], entry['size']) == (mtime, size) and entry['category'] == category:
+                files[path] = entry
+                summary['unchanged'] += 1
+                continue
+            try:
+                digest = file_sha256(path)
+            except OSError as e:
+                logger.error(f"Failed to read {path} for ingestion: {str(e)}")
+                continue
+            new_entry = {'category': category, 'mtime_ns': mtime, 'size': size, 'sha256': digest}
+            chunk_file = os.path.relpath(store.chunk_path(digest, settings_key), store_dir)
+            if entry and entry.get('sha256') == digest and entry.get('chunk_file') == chunk_file:
+                # Touched but identical - keep the chunks
+                new_entry.update({k: entry[k] for k in ('chunk_file', 'chunks', 'tokens', 'error') if k in entry})
+                files[path] = new_entry
+                summary['unchanged'] += 1
+                continue
+            summary['changed' if path in manifest['files'] else 'added'] += 1
+            new_entry['chunk_file'] = chunk_file
+            files[path] = new_entry
+            pending[path] = new_entry
+
+        results = _run_pending(store, pending, workers, max_tokens, overlap_tokens)
+        for path, (result, error) in results.items():
+            entry = pending[path]
+            if error:
+                logger.warning(f"Could not extract {path}: {error}")
+                entry.update({'chunk_file': None, 'chunks': 0, 'tokens': 0, 'error': error})
+                summary['failed'] += 1
+            else:
+                entry.update({'chunks': result['chunks'], 'tokens': result['tokens'], 'error': None})
+
+        if files != manifest['files'] or force:
+            manifest = {'version': PIPELINE_VERSION, 'settings': settings, 'updated_at': time.time(), 'files': files}
+            store.write_manifest(manifest)
+            store.collect_garbage(manifest)
+
+    summary['chunks'] = sum(entry.get('chunks') or 0 for entry in files.values())
+    summary['files'] = len(files)
+    summary['seconds'] = round(time.perf_counter() - started, 3)
+    if pending or summary['removed']:
+        logger.info(f"Chunk store updated: {summary['added']} added, {summary['changed']} changed, "
+                    f"{summary['removed']} removed, {summary['failed']} failed in {summary['seconds']}s")
+    return summary
+
+
+def _run_pending(store, pending, workers, max_tokens, overlap_tokens):
+    """Process pending documents; returns {path: (result, error message)}"""
+    jobs = {path: os.path.join(store.directory, entry['chunk_file']) for path, entry in pending.items()}
+    results = {}
+    if len(jobs) <= 1 or workers == 1:
+        for path, chunk_path in jobs.items():
+            results[path] = _process_safely(path, chunk_path, max_tokens, overlap_tokens)
+        return results
+    workers = min(workers or os.cpu_count() or 1, len(jobs))
+    # spawn, not fork: safe from a threaded process. Spawned children import the parent's main
+    # module, so servers use ingest_in_subprocess() rather than calling this directly
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        futures = {path: pool.submit(_process_safely, path, chunk_path, max_tokens, overlap_tokens)
+                   for path, chunk_path in jobs.items()}
+        for path, future in futures.items():
+            results[path] = future.result()
+    return results
+
+
+def _process_safely(path, chunk_path, max_tokens, overlap_tokens):
+    try:
+        return process_document(path, chunk_path, max_tokens, overlap_tokens), None
+    except UnsupportedDocument as e:
+        return None, str(e)
+    except Exception as e:
+        return None, f"{type(e).__name__}: {str(e)}"
+
+
+def ingest_in_subprocess(knowledge_base, uploads, store_dir, workers=None, timeout=None):
+    """Run ingest() over knowledge_base/ and uploads/ in a `python ingest.py` process; returns its summary
+
+    The extraction pool's spawned children re-import the main module of the process that
+    starts them. Started from a web server run as `python app.py`, that is the whole app,
+    whose startup would run again in every child; from here it is this module. The lock on
+    the chunk store is held by the child too, never by a server thread.
+    """
+    command = [sys.executable, os.path.abspath(__file__), '--knowledge-base', knowledge_base,
+               '--uploads', uploads, '--store', store_dir, '--json']
+    if workers:
+        command += ['--workers', str(workers)]
+    result = subprocess.run(command, capture_output=True, text=True, timeout=timeout)
+    try:
+        # Exit status 1 only means some documents could not be extracted
+        if result.returncode not in (0, 1):
+            raise ValueError(f"exit status {result.returncode}")
+        return json.loads(result.stdout)
+    except ValueError as e:
+        detail = result.stderr.strip().splitlines()[-1:] or ['no output']
+        raise RuntimeError(f"Ingestion process failed ({str(e)}): {detail[0]}") from None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Extract and chunk knowledge_base/ and uploads/ into a local chunk store")
+    parser.add_argument('--knowledge-base', default='knowledge_base', help="folder with one sub-folder per category")
+    parser.add_argument('--uploads', default=os.getenv("UPLOAD_FOLDER", "uploads"), help="uploaded documents (category 'uploads')")
+    parser.add_argument('--store', default=os.getenv("CHUNK_STORE_DIR", ".chunk_store"), help="chunk store directory")
+    parser.add_argument('--workers', type=int, default=None, help="extraction processes (default: CPU count)")
+    parser.add_argument('--max-tokens', type=int, default=CHUNK_TOKENS, help="token budget per chunk")
+    parser.add_argument('--overlap', type=int, default=CHUNK_OVERLAP_TOKENS, help="tokens shared by neighbouring chunks")
+    parser.add_argument('--force', action='store_true', help="reprocess every document")
+    parser.add_argument('--list', action='store_true', help="print the manifest entries after the run")
+    parser.add_argument('--json', action='store_true', help="print the summary as JSON")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    roots = [(args.knowledge_base, None), (args.uploads, 'uploads')]
+    summary = ingest(roots, args.store, workers=args.workers, max_tokens=args.max_tokens,
+                     overlap_tokens=args.overlap, force=args.force)
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print(f"{summary['files']} documents, {summary['chunks']} chunks: {summary['added']} added, "
+              f"{summary['changed']} changed, {summary['removed']} removed, {summary['unchanged']} unchanged, "
+              f"{summary['failed']} failed ({summary['seconds']}s)")
+    if args.list:
+        for path, entry in sorted(ChunkStore(args.store).read_manifest()['files'].items()):
+            status = entry.get('error') or f"{entry.get('chunks', 0)} chunks, {entry.get('tokens', 0)} tokens"
+            print(f"  [{entry['category']}] {path}: {status}")
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
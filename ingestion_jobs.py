@@ -0,0 +1,166 @@
+"""Background ingestion queue for uploaded documents, persisted so it survives restarts"""
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+NAMESPACE = 'ingestion_jobs'
+PENDING_STATUSES = ('queued', 'running')
+FINISHED_STATUSES = ('succeeded', 'failed')
+# Finished jobs stay visible in /jobs this long
+FINISHED_JOB_TTL = 7 * 86400
+# A pending job belongs to its owner while the owner keeps renewing the lease (every third of it)
+LEASE_SECONDS = 60
+
+
+class IngestionQueue:
+    """Bounded worker pool that runs store uploads and records job state in shared state
+
+    Jobs live in the `ingestion_jobs` namespace of a SharedState shared by every worker
+    process, so /jobs answers the same from any worker. Finished jobs expire after
+    FINISHED_JOB_TTL.
+
+    Pending jobs are leased: the owning process renews `lease_until` while it holds them,
+    and any process may claim a job whose lease has run out (its owner died or hung).
+    Owners are random per-process tokens, not PIDs, which the OS reuses. resume() runs
+    at start and on every heartbeat.
+    """
+
+    def __init__(self, state, handler, max_workers=2, lease_seconds=LEASE_SECONDS):
+        # handler(job, report) runs one job; report(**fields) records progress
+        self.state = state
+        self.handler = handler
+        self.max_workers = max_workers
+        self.lease_seconds = lease_seconds
+        self._executor = None
+        self._active = set()
+        self._owner = None
+        self._pid = None
+
+    def _update(self, job_id, **fields):
+        # Only while this process still owns the job: after losing the lease it must not overwrite the new owner
+        def apply(job):
+            if job is None or job.get('owner') != self._owner:
+                return None
+            return dict(job, **fields, updated_at=time.time())
+
+        ttl = FINISHED_JOB_TTL if fields.get('status') in FINISHED_STATUSES else None
+        return self.state.update(NAMESPACE, job_id, apply, ttl=ttl)
+
+    def _process(self):
+        # A pool inherited through fork() has no threads left; start a fresh one, under a new owner token
+        if self._pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='ingest')
+            self._active = set()
+            self._owner = uuid.uuid4().hex
+            self._pid = os.getpid()
+            threading.Thread(target=self._heartbeat, name='ingest-lease', daemon=True).start()
+        return self._executor
+
+    def _heartbeat(self):
+        """Renew the leases of this process's jobs and take over jobs whose lease ran out"""
+        while True:
+            time.sleep(self.lease_seconds / 3)
+            lease_until = time.time() + self.lease_seconds
+            for job_id in list(self._active):
+                self.state.update(NAMESPACE, job_id, lambda job: dict(job, lease_until=lease_until)
+                                  if job and job.get('owner') == self._owner else None)
+            try:
+                self.resume()
+            except Exception as e:
+                logger.error(f"Failed to resume pending ingestion jobs: {str(e)}")
+
+    def submit(self, filename, file_path, **extra):
+        """Queue a document for ingestion and return its job record"""
+        self._process()
+        now = time.time()
+        job = {
+            'id': uuid.uuid4().hex,
+            'filename': filename,
+            'path': file_path,
+            'status': 'queued',
+            'attempts': 0,
+            'error': None,
+            'progress': {},
+            'owner': self._owner,
+            'owner_pid': os.getpid(),
+            'lease_until': now + self.lease_seconds,
+            'created_at': now,
+            'updated_at': now,
+            'started_at': None,
+            'finished_at': None,
+        }
+        job.update(extra)
+        self.state.set(NAMESPACE, job['id'], job)
+        self._dispatch(job['id'])
+        return job
+
+    def _dispatch(self, job_id):
+        pool = self._process()
+        self._active.add(job_id)
+        pool.submit(self._run, job_id)
+
+    def _run(self, job_id):
+        try:
+            job = self._update(job_id, status='running', started_at=time.time(),
+                               lease_until=time.time() + self.lease_seconds)
+            if job is None:
+                return
+            job = self._update(job_id, attempts=job['attempts'] + 1)
+
+            def report(**progress):
+                merged = dict(job.get('progress') or {}, **progress)
+                job['progress'] = merged
+                self._update(job_id, progress=merged)
+
+            try:
+                self.handler(job, report)
+            except Exception as e:
+                logger.error(f"Ingestion job {job_id} ({job['filename']}) failed: {str(e)}")
+                self._update(job_id, status='failed', error=str(e), finished_at=time.time())
+                return
+            self._update(job_id, status='succeeded', error=None, finished_at=time.time())
+            logger.info(f"Ingestion job {job_id} ({job['filename']}) succeeded")
+        finally:
+            self._active.discard(job_id)
+
+    def resume(self):
+        """Claim and re-dispatch pending jobs whose owner stopped renewing their lease"""
+        self._process()
+
+        def claim(job):
+            # Re-checked inside the update so two workers never claim the same job
+            if job is None or job['status'] not in PENDING_STATUSES or job['id'] in self._active:
+                return None
+            now = time.time()
+            if job.get('owner') == self._owner or job.get('lease_until', 0) > now:
+                return None
+            return dict(job, status='queued', owner=self._owner, owner_pid=os.getpid(),
+                        lease_until=now + self.lease_seconds, updated_at=now)
+
+        claimed = [job_id for job_id, job in self.state.items(NAMESPACE)
+                   if job['status'] in PENDING_STATUSES and self.state.update(NAMESPACE, job_id, claim)]
+        for job_id in claimed:
+            self._dispatch(job_id)
+        if claimed:
+            logger.info(f"Resumed {len(claimed)} pending ingestion job(s)")
+        return len(claimed)
+
+    def get(self, job_id):
+        """Return one job record or None"""
+        return self.state.get(NAMESPACE, job_id)
+
+    def pending_digests(self):
+        """Content hashes of uploads that queued or running jobs still have to read"""
+        return {job.get('digest') for _, job in self.state.items(NAMESPACE) if job['status'] in PENDING_STATUSES} - {None}
+
+    def list(self, status=None, limit=100):
+        """Most recent jobs first, optionally filtered by status"""
+        jobs = sorted((job for _, job in self.state.items(NAMESPACE)), key=lambda j: j['created_at'], reverse=True)
+        if status:
+            jobs = [j for j in jobs if j['status'] == status]
+        return jobs[:limit]
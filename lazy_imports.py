@@ -0,0 +1,42 @@
+"""Deferred imports for modules a process does not need until its first upstream call"""
+import importlib
+import threading
+
+# One lock for every deferred import. Python's per-module import locks break cycles by
+# handing one thread a partially initialized module, and google.genai's submodules import
+# each other, so two threads making a first use at once (e.g. the readiness prober and a
+# request) could see half a module. Re-entrant: an import may trigger another deferred one.
+_import_lock = threading.RLock()
+
+
+class LazyModule:
+    """Stands in for a module and imports it on first attribute access
+
+    google.genai (its pydantic types) is most of app.py's import time, yet serving the
+    page, /livez or a cached answer needs none of it. load() imports it up front, e.g.
+    in the gunicorn master so forked workers share the pages.
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    @property
+    def loaded(self):
+        return self._module is not None
+
+    def load(self):
+        """Import the module now (no-op once imported) and return it"""
+        module = self._module
+        if module is None:
+            with _import_lock:
+                module = self._module
+                if module is None:
+                    module = self._module = importlib.import_module(self._name)
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self.load(), attr)
+
+    def __repr__(self):
+        return f"<lazy module '{self._name}'{' (loaded)' if self.loaded else ''}>"
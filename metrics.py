@@ -0,0 +1,300 @@
+"""Per-stage request timings and counters, aggregated into Prometheus metrics"""
+import atexit
+import fcntl
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 45, 90, 180, 600)
+POLL_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+
+# How often a worker writes its snapshot for the other workers' /metrics
+FLUSH_INTERVAL = 1.0
+# How often snapshots of exited workers are folded into retired.json
+PRUNE_INTERVAL = 60.0
+RETIRED_SNAPSHOT = 'retired.json'
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _add_series(merged, snapshot):
+    """Add a snapshot's series to merged ({name: {key: values}}) in place"""
+    for name, series in snapshot.items():
+        target = merged.setdefault(name, {})
+        for key, values in series.items():
+            total = target.get(key)
+            if total is None or len(total) != len(values):
+                target[key] = list(values)
+            else:
+                target[key] = [a + b for a, b in zip(total, values)]
+
+
+def _read_snapshot(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_snapshot(path, data):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _format_labels(labels, extra=None):
+    pairs = list(labels) + (list(extra.items()) if extra else [])
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+class MetricsRegistry:
+    """Histograms and counters for one worker, merged with the other workers' snapshots on render
+
+    Gunicorn workers do not share memory, so with `directory` set each worker writes its
+    series to <directory>/<pid>.json from a background thread, within FLUSH_INTERVAL of a
+    change (and at exit), and /metrics (served by any worker) adds them all up. Snapshots
+    of exited workers are folded into retired.json, so counts stay monotonic across worker
+    restarts without a file per dead PID, and a reused PID never overwrites old counts.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._metrics = {}
+        self._dirty = False
+        self._flusher_pid = None
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.histogram('request_duration_seconds', 'Request duration by endpoint, language, model and status')
+        self.histogram('stage_duration_seconds', 'Time spent in each stage of a request')
+
+    def histogram(self, name, help_text, buckets=DURATION_BUCKETS):
+        """Declare a histogram"""
+        self._metrics.setdefault(name, {'type': 'histogram', 'help': help_text,
+                                        'buckets': list(buckets), 'series': {}})
+
+    def counter(self, name, help_text):
+        """Declare a counter"""
+        self._metrics.setdefault(name, {'type': 'counter', 'help': help_text, 'series': {}})
+
+    def inc(self, name, value=1, **labels):
+        """Add to a counter series"""
+        metric = self._metrics[name]
+        key = json.dumps(sorted(labels.items()))
+        with self._lock:
+            series = metric['series'].setdefault(key, [0])
+            series[0] += value
+            self._dirty = True
+        self._ensure_flusher()
+
+    def observe(self, name, value, **labels):
+        """Add one observation to a histogram series"""
+        metric = self._metrics[name]
+        key = json.dumps(sorted(labels.items()))
+        with self._lock:
+            series = metric['series'].get(key)
+            if series is None:
+                series = metric['series'][key] = [0] * (len(metric['buckets']) + 2)
+            for i, bound in enumerate(metric['buckets']):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+            self._dirty = True
+        self._ensure_flusher()
+
+    def timer(self, endpoint):
+        """Start a StageTimer for one request or background job"""
+        return StageTimer(self, endpoint)
+
+    def _snapshot_path(self, pid=None):
+        return os.path.join(self.directory, f"{pid or os.getpid()}.json")
+
+    def _ensure_flusher(self):
+        """Start this process's flush thread (threads do not survive fork())"""
+        if not self.directory or self._flusher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+        # A snapshot under our PID was left by an exited process that had it before
+        self.prune(os.getpid())
+        atexit.register(self.flush)
+        threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True).start()
+
+    def _flush_loop(self):
+        last_prune = time.monotonic()
+        while True:
+            time.sleep(FLUSH_INTERVAL)
+            if self._dirty:
+                self.flush()
+            if time.monotonic() - last_prune >= PRUNE_INTERVAL:
+                last_prune = time.monotonic()
+                self.prune()
+
+    @contextmanager
+    def _directory_lock(self):
+        with open(os.path.join(self.directory, '.lock'), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def flush(self):
+        """Write this worker's snapshot for the other workers"""
+        if not self.directory:
+            return
+        with self._lock:
+            self._dirty = False
+            data = json.dumps({name: m['series'] for name, m in self._metrics.items()})
+        path = self._snapshot_path()
+        try:
+            _write_snapshot(path, data)
+        except OSError as e:
+            logger.warning(f"Could not write metrics snapshot {path}: {str(e)}")
+
+    def prune(self, pid=None):
+        """Fold snapshots of exited workers (or the given PID's) into retired.json; returns how many"""
+        if not self.directory:
+            return 0
+        folded = 0
+        try:
+            with self._directory_lock():
+                retired_path = os.path.join(self.directory, RETIRED_SNAPSHOT)
+                retired = _read_snapshot(retired_path) or {}
+                for path in glob.glob(os.path.join(self.directory, '*.json')):
+                    stem = os.path.basename(path)[:-len('.json')]
+                    if not stem.isdigit() or (int(stem) != pid if pid else _pid_alive(int(stem))):
+                        continue
+                    snapshot = _read_snapshot(path)
+                    if snapshot:
+                        _add_series(retired, snapshot)
+                    folded += 1
+                    if snapshot is not None:
+                        # Written before the old snapshot goes, so a crash in between cannot lose counts
+                        _write_snapshot(retired_path, json.dumps(retired))
+                    os.remove(path)
+        except OSError as e:
+            logger.warning(f"Could not prune metrics snapshots: {str(e)}")
+        if folded:
+            logger.info(f"Folded {folded} metrics snapshot(s) of exited workers into {RETIRED_SNAPSHOT}")
+        return folded
+
+    def _merged(self):
+        with self._lock:
+            merged = {name: {k: list(v) for k, v in m['series'].items()} for name, m in self._metrics.items()}
+        if not self.directory:
+            return merged
+        own = self._snapshot_path()
+        for path in glob.glob(os.path.join(self.directory, '*.json')):
+            if path == own:
+                continue
+            snapshot = _read_snapshot(path)
+            if snapshot:
+                _add_series(merged, {name: series for name, series in snapshot.items() if name in merged})
+        return merged
+
+    def series(self, name):
+        """(labels, values) of every series of one metric, summed over all workers"""
+        return [(dict(json.loads(key)), values) for key, values in self._merged()[name].items()]
+
+    def render(self):
+        """Prometheus text exposition of all workers' histograms and counters"""
+        lines = []
+        merged = self._merged()
+        for name, metric in self._metrics.items():
+            lines.append(f"# HELP {name} {metric['help']}")
+            lines.append(f"# TYPE {name} {metric['type']}")
+            for key, series in sorted(merged[name].items()):
+                labels = [tuple(pair) for pair in json.loads(key)]
+                if metric['type'] == 'counter':
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(series[0])}")
+                    continue
+                for bound, count in zip(metric['buckets'], series):
+                    lines.append(f"{name}_bucket{_format_labels(labels, {'le': _format_value(bound)})} {count}")
+                lines.append(f"{name}_bucket{_format_labels(labels, {'le': '+Inf'})} {series[-1]}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {round(series[-2], 6)}")
+                lines.append(f"{name}_count{_format_labels(labels)} {series[-1]}")
+        return "\n".join(lines) + "\n"
+
+
+class StageTimer:
+    """Collects named stage durations for one request; finish() records them as histograms"""
+
+    def __init__(self, registry, endpoint):
+        self.registry = registry
+        self.endpoint = endpoint
+        self.labels = {'language': '', 'model': ''}
+        self.stages = []
+        self.tokens = {}
+        self._start = time.perf_counter()
+
+    def label(self, **labels):
+        """Set the language/model labels once they are known"""
+        self.labels.update({k: v for k, v in labels.items() if v is not None})
+
+    @contextmanager
+    def span(self, stage):
+        """Time a block as one stage (repeated stages add up)"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages.append((stage, time.perf_counter() - start))
+
+    def add(self, stage, seconds):
+        """Record a stage measured elsewhere"""
+        self.stages.append((stage, seconds))
+
+    def add_tokens(self, counts):
+        """Add one model call's token counts to this request's totals"""
+        for kind, count in counts.items():
+            self.tokens[kind] = self.tokens.get(kind, 0) + count
+
+    def totals(self):
+        """Stage durations in first-seen order, repeated stages summed"""
+        totals = {}
+        for stage, seconds in self.stages:
+            totals[stage] = totals.get(stage, 0.0) + seconds
+        return totals
+
+    def finish(self, status=None):
+        """Record the request and stage histograms; returns the total duration"""
+        total = time.perf_counter() - self._start
+        labels = dict(self.labels, endpoint=self.endpoint)
+        self.registry.observe('request_duration_seconds', total, status=str(status or ''), **labels)
+        for stage, seconds in self.totals().items():
+            self.registry.observe('stage_duration_seconds', seconds, stage=stage, **labels)
+        return total
+
+    def server_timing(self, total=None):
+        """Server-Timing header value (milliseconds)"""
+        entries = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in self.totals().items()]
+        if total is not None:
+            entries.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(entries)
@@ -0,0 +1,134 @@
+"""Model tier routing with per-endpoint latency budgets and low-confidence escalation"""
+import logging
+import threading
+from collections import namedtuple
+
+from retrieval import tokenize
+
+logger = logging.getLogger(__name__)
+
+TIER_FAST = 'fast'
+TIER_PRO = 'pro'
+
+# Keywords per knowledge_base category (English, Hindi, Marathi)
+CATEGORY_KEYWORDS = {
+    'diseases': {'disease', 'rot', 'smut', 'wilt', 'rust', 'blight', 'fungus', 'fungal', 'virus',
+                 'mosaic', 'yellowing', 'spot', 'रोग', 'सड़न', 'बीमारी', 'कंडुआ', 'रोगाचा', 'कुज'},
+    'pest_control': {'pest', 'borer', 'insect', 'grub', 'aphid', 'termite', 'mealybug', 'whitefly',
+                     'pesticide', 'insecticide', 'कीट', 'कीड़ा', 'सुंडी', 'दीमक', 'कीड', 'अळी', 'वाळवी'},
+    'sugarcane': {'planting', 'sowing', 'variety', 'ratoon', 'irrigation', 'fertilizer', 'harvest',
+                  'spacing', 'seed', 'बुवाई', 'सिंचाई', 'खाद', 'उर्वरक', 'लागवड', 'खत', 'पाणी'},
+    'market_info': {'price', 'frp', 'rate', 'market', 'mill', 'payment', 'भाव', 'मूल्य', 'कीमत', 'दर'},
+    'government_schemes': {'scheme', 'subsidy', 'loan', 'insurance', 'pmfby', 'kisan', 'योजना',
+                           'सब्सिडी', 'अनुदान', 'विमा', 'बीमा'},
+}
+DIAGNOSTIC_CATEGORIES = {'diseases', 'pest_control'}
+
+HEDGE_PHRASES = ('not sure', 'cannot determine', 'unable to', 'not clear', 'insufficient information',
+                 'cannot identify', "can't tell", 'difficult to say')
+
+RouteDecision = namedtuple('RouteDecision', ['endpoint', 'tier', 'model', 'reasons', 'budget', 'score'])
+
+
+def question_categories(question):
+    """knowledge_base categories whose keywords appear in the question"""
+    terms = set(tokenize(question))
+    return sorted(c for c, words in CATEGORY_KEYWORDS.items() if terms & words)
+
+
+class ModelRouter:
+    """Picks a model tier from question features and escalates low-confidence cheap answers
+
+    Features: question length, matched knowledge_base categories, attached image and
+    language. A score of `pro_score` or more goes straight to the pro tier; everything else
+    is answered by the fast tier first and escalated only when that answer is empty or
+    low-confidence and the endpoint's latency budget still has room for a pro call.
+    """
+
+    def __init__(self, models, budgets, long_question_chars=400, pro_score=3, min_answer_chars=40):
+        self.models = models
+        self.budgets = budgets
+        self.long_question_chars = long_question_chars
+        self.pro_score = pro_score
+        self.min_answer_chars = min_answer_chars
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._call_latency = {}
+
+    def route(self, endpoint, question='', language='english', has_image=False):
+        """Return a RouteDecision for one request"""
+        score = 0
+        reasons = []
+        if len(question) > self.long_question_chars:
+            score += 2
+            reasons.append('long_question')
+        categories = question_categories(question)
+        if DIAGNOSTIC_CATEGORIES & set(categories):
+            score += 1
+            reasons.append('diagnostic_topic')
+        if len(categories) > 1:
+            score += 1
+            reasons.append('multi_topic')
+        if has_image:
+            score += 2
+            reasons.append('image')
+        if language != 'english':
+            score += 1
+            reasons.append('indic_language')
+
+        tier = TIER_PRO if score >= self.pro_score else TIER_FAST
+        return RouteDecision(endpoint, tier, self.models[tier], reasons, self.budgets.get(endpoint), score)
+
+    def needs_escalation(self, decision, response, elapsed):
+        """(escalate, reason) for a fast-tier response"""
+        if decision.tier != TIER_FAST:
+            return False, None
+        text = (getattr(response, 'text', None) or '').strip()
+        if not getattr(response, 'candidates', None) or not text:
+            return True, 'empty'
+
+        # Only retry a usable answer when the budget leaves room for a pro call
+        budget = decision.budget
+        expected_pro = self._call_latency.get(TIER_PRO) or (budget / 2 if budget else 0)
+        if budget and elapsed + expected_pro > budget:
+            return False, None
+
+        finish = getattr(response.candidates[0], 'finish_reason', None)
+        if finish is not None and getattr(finish, 'name', str(finish)) not in ('STOP', 'FINISH_REASON_UNSPECIFIED'):
+            return True, f"finish_{getattr(finish, 'name', finish)}".lower()
+        if len(text) < self.min_answer_chars:
+            return True, 'short_answer'
+        lowered = text.lower()
+        if any(phrase in lowered for phrase in HEDGE_PHRASES):
+            return True, 'hedged_answer'
+        return False, None
+
+    def observe(self, tier, seconds):
+        """Track a single model call's latency (moving average per tier)"""
+        with self._lock:
+            previous = self._call_latency.get(tier)
+            self._call_latency[tier] = seconds if previous is None else 0.8 * previous + 0.2 * seconds
+
+    def record(self, decision, elapsed, escalated=False, reason=None):
+        """Log the routing outcome and add it to per endpoint/tier stats"""
+        with self._lock:
+            stats = self._stats.setdefault((decision.endpoint, decision.tier),
+                                           {'requests': 0, 'escalations': 0, 'total_seconds': 0.0})
+            stats['requests'] += 1
+            stats['escalations'] += int(escalated)
+            stats['total_seconds'] += elapsed
+        logger.info(f"Model route endpoint={decision.endpoint} tier={decision.tier} model={decision.model} "
+                    f"score={decision.score} reasons={','.join(decision.reasons) or '-'} "
+                    f"escalated={escalated}{f' ({reason})' if reason else ''} elapsed_ms={elapsed * 1000:.0f}")
+
+    def stats(self):
+        """Per endpoint/tier request counts, escalations and average latency"""
+        with self._lock:
+            return [{
+                'endpoint': endpoint,
+                'tier': tier,
+                'model': self.models[tier],
+                'requests': s['requests'],
+                'escalations': s['escalations'],
+                'avg_latency_ms': round(s['total_seconds'] / s['requests'] * 1000, 1),
+            } for (endpoint, tier), s in sorted(self._stats.items())]
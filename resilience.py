@@ -0,0 +1,328 @@
+"""Deadlines, retries, hedging and a circuit breaker around upstream (Gemini) calls"""
+import asyncio
+import contextvars
+import logging
+import math
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from lazy_imports import LazyModule
+from upstream import UpstreamBusy
+
+# Only needed once a call has failed; importing them up front costs most of a cold start
+httpx = LazyModule('httpx')
+genai_errors = LazyModule('google.genai.errors')
+
+logger = logging.getLogger(__name__)
+
+# Absolute time.monotonic() by which the current request's upstream calls must finish
+_deadline = contextvars.ContextVar('upstream_deadline', default=None)
+
+
+class CircuitOpen(UpstreamBusy):
+    """The model failed too often recently; calls fail fast until the breaker half-opens"""
+
+    def __init__(self, model, retry_after):
+        super().__init__(retry_after, f"Circuit open for {model}")
+        self.model = model
+
+
+class DeadlineExceeded(UpstreamBusy):
+    """The request's upstream deadline passed before a call succeeded"""
+
+    def __init__(self, seconds, retry_after=1):
+        super().__init__(retry_after, f"No upstream answer within {seconds:.1f}s")
+
+
+@contextmanager
+def deadline(seconds):
+    """Bound every upstream call in this context to `seconds` from now (nested scopes keep the earlier one)"""
+    current = _deadline.get()
+    due = time.monotonic() + seconds
+    token = _deadline.set(due if current is None else min(current, due))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining():
+    """Seconds left before the current deadline, or None outside a deadline scope"""
+    due = _deadline.get()
+    return None if due is None else due - time.monotonic()
+
+
+def is_transient(error):
+    """True for failures worth retrying: 5xx, 429, timeouts and connection errors"""
+    if isinstance(error, genai_errors.ServerError):
+        return True
+    if isinstance(error, genai_errors.ClientError):
+        return error.code in (408, 429)
+    return isinstance(error, (asyncio.TimeoutError, httpx.TimeoutException, httpx.TransportError, ConnectionError))
+
+
+class CircuitBreaker:
+    """Rolling-window breaker for one model: closed -> open -> half-open -> closed
+
+    Opens when at least `min_calls` of the last `window` calls were made and `failure_ratio`
+    of them failed transiently. While open every call fails fast; after `open_seconds` one
+    trial call is let through and its outcome closes or re-opens the breaker (another trial
+    is allowed if that one never reports back).
+    """
+
+    def __init__(self, model, window=20, min_calls=10, failure_ratio=0.5, open_seconds=30.0):
+        self.model = model
+        self.min_calls = min_calls
+        self.failure_ratio = failure_ratio
+        self.open_seconds = open_seconds
+        self._outcomes = deque(maxlen=window)
+        self._opened_at = None
+        self._trial_at = None
+        self._lock = threading.Lock()
+        self.opened = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state(time.monotonic())
+
+    def _state(self, now):
+        if self._opened_at is None:
+            return 'closed'
+        return 'open' if now - self._opened_at < self.open_seconds else 'half_open'
+
+    def check(self):
+        """Raise CircuitOpen unless a call may go ahead now; True when this call is the half-open trial"""
+        with self._lock:
+            now = time.monotonic()
+            state = self._state(now)
+            if state == 'closed':
+                return False
+            if state == 'half_open' and (self._trial_at is None or now - self._trial_at > self.open_seconds):
+                self._trial_at = now
+                return True
+            retry_after = max(1, math.ceil(self._opened_at + self.open_seconds - now))
+        raise CircuitOpen(self.model, retry_after)
+
+    def release(self):
+        """Give back the half-open trial without an outcome (the call never reached the model)"""
+        with self._lock:
+            self._trial_at = None
+
+    def record(self, ok):
+        """Count one call outcome (only transient failures count against the model)"""
+        with self._lock:
+            if self._opened_at is not None:
+                if self._trial_at is None:
+                    return
+                # The half-open trial decides
+                self._trial_at = None
+                if ok:
+                    self._opened_at = None
+                    self._outcomes.clear()
+                    logger.info(f"Circuit for {self.model} closed again")
+                else:
+                    self._opened_at = time.monotonic()
+                return
+            self._outcomes.append(ok)
+            failures = self._outcomes.count(False)
+            if len(self._outcomes) >= self.min_calls and failures / len(self._outcomes) >= self.failure_ratio:
+                self._opened_at = time.monotonic()
+                self.opened += 1
+                logger.warning(f"Circuit for {self.model} opened: {failures} of the last "
+                               f"{len(self._outcomes)} calls failed")
+
+    def stats(self):
+        """State and recent failure ratio"""
+        with self._lock:
+            calls = len(self._outcomes)
+            return {
+                'state': self._state(time.monotonic()),
+                'recent_calls': calls,
+                'recent_failure_ratio': round(self._outcomes.count(False) / calls, 4) if calls else 0.0,
+                'opened': self.opened,
+            }
+
+
+class ResilientCaller:
+    """Runs upstream calls under a deadline with retries, optional hedging and per-model breakers
+
+    Each call gets the time left before the request's deadline (see deadline(); calls made
+    outside one get `default_deadline`). Transient failures are retried up to `retries`
+    times after a full-jitter backoff that never sleeps past the deadline. With `hedge`
+    on, a call still running after the model's recent p95 latency (at least
+    `hedge_min_delay`) gets a second, identical attempt and the first answer wins - only
+    for idempotent calls. State is per process.
+    """
+
+    def __init__(self, default_deadline=60.0, retries=2, backoff_base=0.5, backoff_max=4.0,
+                 hedge=True, hedge_min_delay=2.0, hedge_min_samples=20,
+                 breaker_window=20, breaker_min_calls=10, breaker_failure_ratio=0.5, breaker_open_seconds=30.0):
+        self.default_deadline = default_deadline
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge = hedge
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_min_samples = hedge_min_samples
+        self._breaker_options = {'window': breaker_window, 'min_calls': breaker_min_calls,
+                                 'failure_ratio': breaker_failure_ratio, 'open_seconds': breaker_open_seconds}
+        self._breakers = {}
+        self._latencies = {}
+        self._lock = threading.Lock()
+        self.counters = {'calls': 0, 'retries': 0, 'hedges': 0, 'hedge_wins': 0,
+                         'deadline_exceeded': 0, 'rejected_open': 0}
+
+    def breaker(self, model):
+        """The circuit breaker of a model"""
+        with self._lock:
+            breaker = self._breakers.get(model)
+            if breaker is None:
+                breaker = self._breakers[model] = CircuitBreaker(model, **self._breaker_options)
+            return breaker
+
+    def available(self, model):
+        """False while the model's breaker is open (no trial call is taken)"""
+        return self.breaker(model).state != 'open'
+
+    def check(self, model):
+        """Raise CircuitOpen when a call to model would be rejected (counted); True for a half-open trial"""
+        try:
+            return self.breaker(model).check()
+        except CircuitOpen:
+            self._count('rejected_open')
+            raise
+
+    def observe(self, model, seconds):
+        """Record a successful call's latency (feeds the hedging delay)"""
+        with self._lock:
+            self._latencies.setdefault(model, deque(maxlen=200)).append(seconds)
+
+    def hedge_delay(self, model):
+        """Seconds before a hedged attempt starts, or None when hedging is off or untrained"""
+        if not self.hedge:
+            return None
+        with self._lock:
+            samples = sorted(self._latencies.get(model, ()))
+        if len(samples) < self.hedge_min_samples:
+            return None
+        return max(self.hedge_min_delay, samples[int(0.95 * (len(samples) - 1))])
+
+    def _count(self, counter):
+        with self._lock:
+            self.counters[counter] += 1
+
+    def time_left(self):
+        """Seconds before the current (or default) deadline"""
+        left = remaining()
+        return self.default_deadline if left is None else left
+
+    async def call(self, model, factory, hedge=True):
+        """Await factory() (a coroutine function making one call to model) resiliently"""
+        budget = self.time_left()
+        due = time.monotonic() + budget
+        breaker = self.breaker(model)
+        self._count('calls')
+        attempt = 0
+        while True:
+            trial = self.check(model)
+            left = due - time.monotonic()
+            if left <= 0:
+                self._count('deadline_exceeded')
+                breaker.record(False)
+                raise DeadlineExceeded(budget)
+            start = time.monotonic()
+            try:
+                result = await self._attempt(model, factory, left, hedge)
+            except DeadlineExceeded:
+                self._count('deadline_exceeded')
+                breaker.record(False)
+                raise
+            except UpstreamBusy:
+                # Local backpressure says nothing about the model: no outcome either way
+                if trial:
+                    breaker.release()
+                raise
+            except Exception as e:
+                transient = is_transient(e)
+                breaker.record(not transient)
+                delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+                if not transient or attempt >= self.retries or time.monotonic() + delay >= due:
+                    raise
+                attempt += 1
+                self._count('retries')
+                logger.warning(f"Transient upstream error from {model}, retry {attempt} in {delay:.2f}s: {str(e)}")
+                await asyncio.sleep(delay)
+                continue
+            breaker.record(True)
+            self.observe(model, time.monotonic() - start)
+            return result
+
+    def stream(self, model, open_stream):
+        """Iterate open_stream(timeout) under the deadline and the model's breaker
+
+        Tokens may already be on the wire, so a stream is never retried or hedged.
+        """
+        trial = self.check(model)
+        budget = self.time_left()
+        breaker = self.breaker(model)
+        self._count('calls')
+        start = time.monotonic()
+        try:
+            yield from open_stream(budget)
+        except TimeoutError:
+            self._count('deadline_exceeded')
+            breaker.record(False)
+            raise DeadlineExceeded(budget)
+        except UpstreamBusy:
+            if trial:
+                breaker.release()
+            raise
+        except Exception as e:
+            breaker.record(not is_transient(e))
+            raise
+        breaker.record(True)
+        self.observe(model, time.monotonic() - start)
+
+    async def _attempt(self, model, factory, left, hedge):
+        """One attempt, hedged after the p95 delay; the first success wins, the rest are cancelled"""
+        end = time.monotonic() + left
+        tasks = [asyncio.ensure_future(factory())]
+        delay = self.hedge_delay(model) if hedge else None
+        error = None
+        try:
+            if delay is not None and delay < left:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                if not done:
+                    self._count('hedges')
+                    tasks.append(asyncio.ensure_future(factory()))
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=max(0, end - time.monotonic()),
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    raise DeadlineExceeded(left)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not tasks[0]:
+                            self._count('hedge_wins')
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+            for task in tasks:
+                # Retrieve losers' exceptions so asyncio does not warn about them
+                task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    def stats(self):
+        """Retry/hedge/deadline counters and every breaker's state"""
+        with self._lock:
+            counters = dict(self.counters)
+            breakers = list(self._breakers.values())
+        return dict(counters, breakers={b.model: b.stats() for b in breakers})
@@ -0,0 +1,350 @@
+"""Local hybrid (BM25 + embedding) retrieval over the knowledge base and uploads"""
+import fcntl
+import json
+import logging
+import math
+import os
+import re
+import threading
+import zlib
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Category folders under knowledge_base/
+KNOWLEDGE_BASE_CATEGORIES = ('diseases', 'pest_control', 'sugarcane', 'market_info', 'government_schemes')
+
+# Word characters plus the Indic blocks (Devanagari..Malayalam) so vowel signs stay inside words
+TOKEN_RE = re.compile(r"[\wऀ-ൿ]+")
+
+EMBEDDING_DIM = 256
+BM25_K1 = 1.2
+BM25_B = 0.75
+RRF_K = 60
+CANDIDATES = 50
+
+INDEX_FORMAT_VERSION = 2
+
+
+def tokenize(text):
+    """Lowercase word tokens, Indic-script aware"""
+    return TOKEN_RE.findall(text.lower())
+
+
+def _feature_hashes(tokens):
+    """Stable hashed features: whole tokens plus padded character trigrams"""
+    for token in tokens:
+        yield zlib.crc32(token.encode('utf-8'))
+        padded = f" {token} "
+        for i in range(len(padded) - 2):
+            yield zlib.crc32(padded[i:i + 3].encode('utf-8'))
+
+
+def embed_text(text, dim=EMBEDDING_DIM):
+    """Hashed bag-of-ngrams embedding, L2 normalized (float32)"""
+    vec = np.zeros(dim, dtype=np.float32)
+    for h in _feature_hashes(tokenize(text)):
+        vec[h % dim] += 1.0 if (h >> 16) & 1 else -1.0
+    norm = float(np.linalg.norm(vec))
+    if norm > 0:
+        vec /= norm
+    return vec
+
+
+def read_text_file(path):
+    """Read a text document, tolerating unknown encodings"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    for encoding in ('utf-8-sig', 'utf-16'):
+        try:
+            return data.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+    return data.decode('utf-8', errors='replace')
+
+
+class LocalIndex:
+    """BM25 inverted index plus a memory-mapped embedding matrix, updated incrementally
+
+    On disk (index_dir):
+      chunks.json     - file table and chunk records (text, category, term frequencies)
+      embeddings.f16  - one float16 row of EMBEDDING_DIM per chunk slot, opened with np.memmap
+
+    Chunk slots are append-only; changed or deleted files tombstone their slots and the
+    matrix is compacted once more than half of it is dead.
+
+    Documents and their chunks come from the manifest of an ingest.ChunkStore, which
+    extracts text, PDF and Word files alike.
+    """
+
+    def __init__(self, index_dir, chunk_store, dim=EMBEDDING_DIM, title_for=None):
+        self.index_dir = index_dir
+        self.dim = dim
+        self.title_for = title_for
+        self.chunk_store = chunk_store
+        self._lock = threading.RLock()
+        self._meta_path = os.path.join(index_dir, 'chunks.json')
+        self._matrix_path = os.path.join(index_dir, 'embeddings.f16')
+        self._loaded_stamp = None
+        self._reset()
+
+    def _reset(self):
+        self.files = {}
+        self.chunks = []
+        self.generation = 0
+        self.matrix = np.zeros((0, self.dim), dtype=np.float16)
+        self._postings = {}
+        self._live = 0
+        self._total_length = 0
+
+    # ------------------------------------------------------------------ persistence
+
+    def _stamp(self):
+        try:
+            st = os.stat(self._meta_path)
+            return (st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            return None
+
+    def _load(self):
+        """Load the persisted index, falling back to empty on mismatch or corruption"""
+        self._reset()
+        stamp = self._stamp()
+        self._loaded_stamp = stamp
+        if stamp is None:
+            return
+        try:
+            with open(self._meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            if meta.get('version') != INDEX_FORMAT_VERSION or meta.get('dim') != self.dim:
+                logger.warning("Retrieval index format changed, rebuilding")
+                return
+            self.files = meta['files']
+            self.chunks = meta['chunks']
+            self.generation = meta.get('generation', 0)
+            rows = len(self.chunks)
+            if rows:
+                expected = rows * self.dim * 2
+                if not os.path.exists(self._matrix_path) or os.path.getsize(self._matrix_path) < expected:
+                    logger.warning("Retrieval embedding matrix is incomplete, rebuilding")
+                    self._reset()
+                    return
+                self.matrix = np.memmap(self._matrix_path, dtype=np.float16, mode='r', shape=(rows, self.dim))
+            self._build_postings()
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f"Failed to load retrieval index, rebuilding: {str(e)}")
+            self._reset()
+
+    def _build_postings(self):
+        self._postings = {}
+        self._live = 0
+        self._total_length = 0
+        for slot, chunk in enumerate(self.chunks):
+            if chunk is not None:
+                self._add_postings(slot, chunk)
+
+    def _add_postings(self, slot, chunk):
+        for term, tf in chunk['tf'].items():
+            self._postings.setdefault(term, []).append((slot, tf))
+        self._live += 1
+        self._total_length += chunk['length']
+
+    def _write_meta(self):
+        os.makedirs(self.index_dir, exist_ok=True)
+        tmp_path = self._meta_path + f".{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'version': INDEX_FORMAT_VERSION,
+                'dim': self.dim,
+                'generation': self.generation,
+                'files': self.files,
+                'chunks': self.chunks,
+            }, f, ensure_ascii=False)
+        os.replace(tmp_path, self._meta_path)
+        self._loaded_stamp = self._stamp()
+
+    def _maybe_reload(self):
+        """Pick up changes written by another worker process"""
+        if self._stamp() != self._loaded_stamp:
+            with self._lock:
+                if self._stamp() != self._loaded_stamp:
+                    self._load()
+
+    # ------------------------------------------------------------------ indexing
+
+    def _scan(self):
+        """Return {path: (category, stamp, load)}; load() gives the file's chunk texts"""
+        found = {}
+        for path, entry in self.chunk_store.read_manifest()['files'].items():
+            if entry.get('chunk_file'):
+                found[path] = (entry['category'], entry['chunk_file'],
+                               lambda entry=entry: [c['text'] for c in self.chunk_store.read_chunks(entry)])
+        return found
+
+    def refresh(self):
+        """Re-read the chunk store manifest and index only files that were added, changed or removed"""
+        os.makedirs(self.index_dir, exist_ok=True)
+        with self._lock, open(os.path.join(self.index_dir, '.lock'), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                if self._stamp() != self._loaded_stamp:
+                    self._load()
+                return self._refresh_locked()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _refresh_locked(self):
+        found = self._scan()
+        removed = [p for p in self.files if p not in found]
+        changed = [p for p, (_, stamp, _) in found.items() if p in self.files and self.files[p]['stamp'] != stamp]
+        added = [p for p in found if p not in self.files]
+
+        if not (removed or changed or added):
+            return {'added': 0, 'changed': 0, 'removed': 0, 'chunks': self._live}
+
+        for path in removed + changed:
+            for slot in self.files.pop(path)['slots']:
+                self.chunks[slot] = None
+
+        new_rows = []
+        for path in changed + added:
+            category, stamp, load = found[path]
+            try:
+                pieces = load()
+            except (OSError, ValueError) as e:
+                logger.error(f"Failed to read {path} for indexing: {str(e)}")
+                continue
+            title = (self.title_for(path) if self.title_for else None) or os.path.basename(path)
+            slots = []
+            for piece in pieces:
+                tokens = tokenize(piece)
+                tf = {}
+                for token in tokens:
+                    tf[token] = tf.get(token, 0) + 1
+                slots.append(len(self.chunks))
+                self.chunks.append({
+                    'source': path,
+                    'title': title,
+                    'category': category,
+                    'text': piece,
+                    'length': len(tokens),
+                    'tf': tf,
+                })
+                new_rows.append(embed_text(piece, self.dim))
+            self.files[path] = {'category': category, 'stamp': stamp, 'slots': slots}
+
+        dead = sum(1 for c in self.chunks if c is None)
+        if dead and dead * 2 > len(self.chunks):
+            self._compact(new_rows)
+        else:
+            self._append_rows(new_rows)
+
+        self.generation += 1
+        self._write_meta()
+        self._build_postings()
+        logger.info(f"Retrieval index updated: {len(added)} added, {len(changed)} changed, "
+                    f"{len(removed)} removed, {self._live} live chunks")
+        return {'added': len(added), 'changed': len(changed), 'removed': len(removed), 'chunks': self._live}
+
+    def _append_rows(self, new_rows):
+        rows = len(self.chunks)
+        if new_rows:
+            offset = (rows - len(new_rows)) * self.dim * 2
+            with open(self._matrix_path, 'r+b' if os.path.exists(self._matrix_path) else 'wb') as f:
+                # Drop rows left behind by an interrupted writer before appending
+                f.truncate(offset)
+                f.seek(offset)
+                f.write(np.asarray(new_rows, dtype=np.float16).tobytes())
+        self._remap(rows)
+
+    def _compact(self, new_rows):
+        """Rewrite the matrix without tombstoned slots"""
+        old_rows = len(self.chunks) - len(new_rows)
+        old = self.matrix
+        keep_chunks = []
+        keep_rows = []
+        remap = {}
+        for slot, chunk in enumerate(self.chunks):
+            if chunk is None:
+                continue
+            remap[slot] = len(keep_chunks)
+            keep_chunks.append(chunk)
+            keep_rows.append(old[slot] if slot < old_rows else new_rows[slot - old_rows])
+        for info in self.files.values():
+            info['slots'] = [remap[s] for s in info['slots']]
+        self.chunks = keep_chunks
+        tmp_path = self._matrix_path + f".{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            if keep_rows:
+                f.write(np.asarray(keep_rows, dtype=np.float16).tobytes())
+        os.replace(tmp_path, self._matrix_path)
+        self._remap(len(self.chunks))
+
+    def _remap(self, rows):
+        if rows:
+            self.matrix = np.memmap(self._matrix_path, dtype=np.float16, mode='r', shape=(rows, self.dim))
+        else:
+            self.matrix = np.zeros((0, self.dim), dtype=np.float16)
+
+    # ------------------------------------------------------------------ search
+
+    def _bm25(self, terms, allowed):
+        scores = {}
+        n = self._live
+        avgdl = (self._total_length / n) if n else 0.0
+        for term in set(terms):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for slot, tf in postings:
+                if allowed is not None and self.chunks[slot]['category'] not in allowed:
+                    continue
+                length = self.chunks[slot]['length']
+                denom = tf + BM25_K1 * (1 - BM25_B + BM25_B * length / avgdl)
+                scores[slot] = scores.get(slot, 0.0) + idf * tf * (BM25_K1 + 1) / denom
+        return sorted(scores, key=scores.get, reverse=True)[:CANDIDATES]
+
+    def _dense(self, query, allowed):
+        if not len(self.matrix):
+            return []
+        sims = self.matrix.astype(np.float32) @ embed_text(query, self.dim)
+        order = np.argsort(-sims)
+        ranked = []
+        for slot in order:
+            slot = int(slot)
+            chunk = self.chunks[slot]
+            if chunk is None or sims[slot] <= 0:
+                continue
+            if allowed is not None and chunk['category'] not in allowed:
+                continue
+            ranked.append(slot)
+            if len(ranked) >= CANDIDATES:
+                break
+        return ranked
+
+    def search(self, query, k=4, categories=None):
+        """Return the top-k chunks fused from BM25 and embedding rankings (reciprocal rank fusion)"""
+        self._maybe_reload()
+        with self._lock:
+            if not self._live:
+                return []
+            allowed = set(categories) if categories else None
+            fused = {}
+            for ranking in (self._bm25(tokenize(query), allowed), self._dense(query, allowed)):
+                for rank, slot in enumerate(ranking):
+                    fused[slot] = fused.get(slot, 0.0) + 1.0 / (RRF_K + rank + 1)
+            best = sorted(fused, key=fused.get, reverse=True)[:k]
+            return [{
+                'text': self.chunks[slot]['text'],
+                'title': self.chunks[slot]['title'],
+                'category': self.chunks[slot]['category'],
+                'source': self.chunks[slot]['source'],
+                'score': round(fused[slot], 6),
+            } for slot in best]
+
+    def stats(self):
+        """Small summary for health/debug output"""
+        self._maybe_reload()
+        return {'files': len(self.files), 'chunks': self._live, 'generation': self.generation}
@@ -0,0 +1,193 @@
+"""Multi-turn advisory sessions: bounded history, summaries and cached prompt prefixes"""
+import fcntl
+import json
+import logging
+import math
+import os
+import re
+import time
+import uuid
+from contextlib import contextmanager
+
+from lazy_imports import LazyModule
+
+logger = logging.getLogger(__name__)
+types = LazyModule('google.genai.types')
+
+SESSION_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+
+# Refresh a cache this long before it expires rather than racing its TTL
+CACHE_EXPIRY_MARGIN = 30
+
+
+def estimate_tokens(text):
+    """Rough token count without a tokenizer call (~4 UTF-8 bytes per token)"""
+    return math.ceil(len((text or '').encode('utf-8')) / 4)
+
+
+def turn_content(turn):
+    """A stored turn as SDK content"""
+    return types.Content(role=turn['role'], parts=[types.Part(text=turn['text'])])
+
+
+class SessionStore:
+    """Per-conversation history shared by all workers, one JSON file per session
+
+    Each session keeps its turns in a sliding window of about `window_tokens`. When a new
+    turn pushes the window over, everything except the last `keep_turns` turns is handed
+    back by overflow() so the caller can fold it into the running summary. The session
+    also remembers the provider context cache (system instruction + summary + a prefix of
+    the turns) so follow-up turns only send what came after that prefix.
+    """
+
+    def __init__(self, directory, ttl_seconds=86400, window_tokens=6000, keep_turns=4):
+        self.directory = directory
+        self.ttl_seconds = ttl_seconds
+        self.window_tokens = window_tokens
+        self.keep_turns = keep_turns
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, session_id):
+        return os.path.join(self.directory, f"{session_id}.json")
+
+    @contextmanager
+    def locked(self, session_id):
+        """Serialize turns of one session across threads and workers"""
+        with open(self._path(session_id) + '.lock', 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def create(self, language):
+        """Start a new, empty session"""
+        now = time.time()
+        session = {
+            'id': uuid.uuid4().hex,
+            'language': language,
+            'created_at': now,
+            'updated_at': now,
+            'tier': None,
+            'summary': '',
+            'turns': [],
+            'cache': None,
+            'usage': {'requests': 0, 'prompt_tokens': 0, 'cached_tokens': 0},
+        }
+        self.save(session)
+        self.prune()
+        return session
+
+    def get(self, session_id):
+        """Load a session, or None if it is unknown or expired"""
+        if not session_id or not SESSION_ID_RE.match(session_id):
+            return None
+        try:
+            with open(self._path(session_id), 'r', encoding='utf-8') as f:
+                session = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if time.time() - session['updated_at'] > self.ttl_seconds:
+            self._remove(session_id)
+            return None
+        return session
+
+    def save(self, session):
+        """Persist a session"""
+        session['updated_at'] = time.time()
+        path = self._path(session['id'])
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(session, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def delete(self, session_id):
+        """Remove a session; returns it (so its remote cache can be dropped) or None
+
+        Waits for a turn in progress, which would otherwise save the session again.
+        """
+        if not session_id or not SESSION_ID_RE.match(session_id):
+            return None
+        with self.locked(session_id):
+            session = self.get(session_id)
+            if session is not None:
+                self._remove(session_id)
+        return session
+
+    def _remove(self, session_id):
+        # The .lock file stays: a waiter may already hold it open, and a new one would not
+        # exclude it. prune() deletes lock files once nobody has used them for a whole TTL.
+        try:
+            os.remove(self._path(session_id))
+        except FileNotFoundError:
+            pass
+
+    def prune(self):
+        """Delete expired session files and lock files left by sessions that are gone"""
+        cutoff = time.time() - self.ttl_seconds
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if name.endswith('.json'):
+                    if os.path.getmtime(path) < cutoff:
+                        self._remove(name[:-len('.json')])
+                elif name.endswith('.json.lock'):
+                    if os.path.getmtime(path) < cutoff and not os.path.exists(path[:-len('.lock')]):
+                        os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def append(self, session, question, answer):
+        """Add a question/answer pair to the history"""
+        session['turns'].append({'role': 'user', 'text': question, 'tokens': estimate_tokens(question)})
+        session['turns'].append({'role': 'model', 'text': answer, 'tokens': estimate_tokens(answer)})
+
+    def history_tokens(self, session):
+        """Estimated tokens of summary + turns"""
+        return estimate_tokens(session['summary']) + sum(t['tokens'] for t in session['turns'])
+
+    def overflow(self, session):
+        """Oldest turns that no longer fit the window (empty list if it still fits)"""
+        if self.history_tokens(session) <= self.window_tokens:
+            return []
+        # Keep whole question/answer pairs
+        cut = max(0, len(session['turns']) - self.keep_turns)
+        cut -= cut % 2
+        return session['turns'][:cut]
+
+    def fold(self, session, count, summary):
+        """Replace the first `count` turns by a new summary; returns the stale cache or None"""
+        session['turns'] = session['turns'][count:]
+        session['summary'] = summary
+        stale, session['cache'] = session['cache'], None
+        return stale
+
+    def live_cache(self, session, model):
+        """The session's context cache if it is for this model and not about to expire"""
+        cache = session.get('cache')
+        if not cache or cache['model'] != model:
+            return None
+        if cache['expires_at'] - CACHE_EXPIRY_MARGIN <= time.time():
+            return None
+        return cache
+
+    def record_usage(self, session, usage_metadata):
+        """Add a response's prompt and cached token counts to the session totals"""
+        usage = session['usage']
+        usage['requests'] += 1
+        if usage_metadata is not None:
+            usage['prompt_tokens'] += usage_metadata.prompt_token_count or 0
+            usage['cached_tokens'] += usage_metadata.cached_content_token_count or 0
+
+    def public(self, session):
+        """JSON-safe view of a session for the API"""
+        return {
+            'session_id': session['id'],
+            'language': session['language'],
+            'turns': len(session['turns']) // 2,
+            'summarized': bool(session['summary']),
+            'cached_prefix': bool(session.get('cache')),
+            'usage': session['usage'],
+            'created_at': session['created_at'],
+            'updated_at': session['updated_at'],
+        }
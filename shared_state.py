@@ -0,0 +1,213 @@
+"""Key/value state with TTLs shared by every worker process, kept in one SQLite file (WAL)"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Expired rows are deleted by whichever process makes this many writes
+PURGE_EVERY = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS state (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    expires_at REAL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS state_expiry ON state (expires_at) WHERE expires_at IS NOT NULL;
+"""
+
+
+class SharedState:
+    """Namespaced key/value store with optional TTLs, consistent across workers and restarts
+
+    Values are JSON. Every thread of every process has its own connection (none survives
+    fork()). Nothing is opened before first use, so a preloading master hands no connection
+    across fork(); each process creates the schema on its first connection. WAL lets readers
+    run while one writer commits, so a point read stays well under a millisecond with any
+    number of workers. Writes that must not interleave (read-modify-write, counters, claims)
+    run in one IMMEDIATE transaction.
+    """
+
+    def __init__(self, path, busy_timeout=5.0):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._schema_pid = None
+
+    def _connect(self):
+        local = self._local
+        pid = os.getpid()
+        if getattr(local, 'pid', None) == pid:
+            return local.db
+        first = self._schema_pid != pid
+        if first:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        db = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None,
+                             check_same_thread=False)
+        db.execute('PRAGMA journal_mode=WAL')
+        # A crash can lose the last commits but never corrupts the file; fine for this state
+        db.execute('PRAGMA synchronous=NORMAL')
+        if first:
+            with self._lock:
+                if self._schema_pid != pid:
+                    db.executescript(SCHEMA)
+                    self._schema_pid = pid
+        local.db, local.pid = db, pid
+        return db
+
+    @contextmanager
+    def _transaction(self):
+        db = self._connect()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            yield db
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
+        self._wrote()
+
+    def _wrote(self):
+        with self._lock:
+            self._writes += 1
+            due = self._writes % PURGE_EVERY == 0
+        if due:
+            self.purge()
+
+    @staticmethod
+    def _expiry(ttl):
+        return None if ttl is None else time.time() + ttl
+
+    def get(self, namespace, key, default=None):
+        """Value of a key, or default when it is missing or expired"""
+        row = self._connect().execute(
+            'SELECT value FROM state WHERE namespace = ? AND key = ? AND (expires_at IS NULL OR expires_at > ?)',
+            (namespace, key, time.time())
+        ).fetchone()
+        return default if row is None else json.loads(row[0])
+
+    def set(self, namespace, key, value, ttl=None):
+        """Store a value, replacing any previous one; ttl in seconds (None keeps it forever)"""
+        now = time.time()
+        with self._transaction() as db:
+            db.execute(
+                'INSERT INTO state (namespace, key, value, expires_at, updated_at) VALUES (?, ?, ?, ?, ?) '
+                'ON CONFLICT (namespace, key) DO UPDATE SET value = excluded.value, '
+                'expires_at = excluded.expires_at, updated_at = excluded.updated_at',
+                (namespace, key, json.dumps(value, ensure_ascii=False), self._expiry(ttl), now)
+            )
+
+    def add(self, namespace, key, value, ttl=None):
+        """Store a value only if the key is missing or expired; True when this call stored it"""
+        now = time.time()
+        with self._transaction() as db:
+            cursor = db.execute(
+                'INSERT INTO state (namespace, key, value, expires_at, updated_at) VALUES (?, ?, ?, ?, ?) '
+                'ON CONFLICT (namespace, key) DO UPDATE SET value = excluded.value, '
+                'expires_at = excluded.expires_at, updated_at = excluded.updated_at '
+                'WHERE state.expires_at IS NOT NULL AND state.expires_at <= ?',
+                (namespace, key, json.dumps(value, ensure_ascii=False), self._expiry(ttl), now, now)
+            )
+            return cursor.rowcount > 0
+
+    def update(self, namespace, key, fn, ttl=None):
+        """Atomically replace a value with fn(current value or None); fn returning None leaves it as is
+
+        Returns the stored value (None when fn declined). ttl=None keeps the key's current expiry.
+        """
+        now = time.time()
+        with self._transaction() as db:
+            row = db.execute(
+                'SELECT value, expires_at FROM state WHERE namespace = ? AND key = ? '
+                'AND (expires_at IS NULL OR expires_at > ?)', (namespace, key, now)
+            ).fetchone()
+            value = fn(None if row is None else json.loads(row[0]))
+            if value is None:
+                return None
+            expires_at = self._expiry(ttl) if ttl is not None or row is None else row[1]
+            db.execute(
+                'INSERT OR REPLACE INTO state (namespace, key, value, expires_at, updated_at) VALUES (?, ?, ?, ?, ?)',
+                (namespace, key, json.dumps(value, ensure_ascii=False), expires_at, now)
+            )
+            return value
+
+    def incr(self, namespace, key, amount=1, ttl=None):
+        """Add to a counter and return its new value; ttl applies when the counter starts (fixed window)"""
+        now = time.time()
+        with self._transaction() as db:
+            row = db.execute(
+                'INSERT INTO state (namespace, key, value, expires_at, updated_at) VALUES (?, ?, ?, ?, ?) '
+                'ON CONFLICT (namespace, key) DO UPDATE SET '
+                'value = CASE WHEN state.expires_at IS NOT NULL AND state.expires_at <= ? '
+                'THEN excluded.value ELSE CAST(state.value AS INTEGER) + ? END, '
+                'expires_at = CASE WHEN state.expires_at IS NOT NULL AND state.expires_at <= ? '
+                'THEN excluded.expires_at ELSE state.expires_at END, '
+                'updated_at = excluded.updated_at '
+                'RETURNING value, expires_at',
+                (namespace, key, str(amount), self._expiry(ttl), now, now, amount, now)
+            ).fetchone()
+            return int(row[0])
+
+    def expires_in(self, namespace, key):
+        """Seconds until a key expires, or None when it is missing or never expires"""
+        row = self._connect().execute(
+            'SELECT expires_at FROM state WHERE namespace = ? AND key = ?', (namespace, key)
+        ).fetchone()
+        if row is None or row[0] is None:
+            return None
+        return max(0.0, row[0] - time.time())
+
+    def delete(self, namespace, key):
+        """Remove a key; True when it existed"""
+        with self._transaction() as db:
+            return db.execute('DELETE FROM state WHERE namespace = ? AND key = ?', (namespace, key)).rowcount > 0
+
+    def items(self, namespace, prefix=None):
+        """(key, value) pairs of a namespace that have not expired, optionally under a key prefix"""
+        sql = 'SELECT key, value FROM state WHERE namespace = ? AND (expires_at IS NULL OR expires_at > ?)'
+        params = [namespace, time.time()]
+        if prefix:
+            # Range scan on the primary key instead of LIKE (keys may contain % or _)
+            sql += ' AND key >= ? AND key < ?'
+            params += [prefix, prefix + '\U0010ffff']
+        return [(key, json.loads(value)) for key, value in self._connect().execute(sql, params)]
+
+    def count(self, namespace):
+        """Number of live keys in a namespace"""
+        return self._connect().execute(
+            'SELECT COUNT(*) FROM state WHERE namespace = ? AND (expires_at IS NULL OR expires_at > ?)',
+            (namespace, time.time())
+        ).fetchone()[0]
+
+    def clear(self, namespace):
+        """Remove every key of a namespace"""
+        with self._transaction() as db:
+            db.execute('DELETE FROM state WHERE namespace = ?', (namespace,))
+
+    def purge(self):
+        """Delete expired rows; returns how many"""
+        db = self._connect()
+        removed = db.execute('DELETE FROM state WHERE expires_at IS NOT NULL AND expires_at <= ?',
+                             (time.time(),)).rowcount
+        if removed:
+            logger.info(f"Purged {removed} expired shared state entries")
+        return removed
+
+    def stats(self):
+        """Live keys per namespace and the database size"""
+        rows = self._connect().execute(
+            'SELECT namespace, COUNT(*) FROM state WHERE expires_at IS NULL OR expires_at > ? GROUP BY namespace',
+            (time.time(),)
+        ).fetchall()
+        size = sum(os.path.getsize(p) for p in (self.path, self.path + '-wal') if os.path.exists(p))
+        return {'namespaces': dict(rows), 'bytes': size}
@@ -0,0 +1,98 @@
+"""Coalescing of identical in-flight requests (one upstream call, many waiters)"""
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+logger = logging.getLogger(__name__)
+
+
+class LeaderGone(Exception):
+    """The request doing the work went away (client disconnect); a waiter takes over"""
+
+
+class SingleFlight:
+    """Runs one call per key at a time and hands its result to every concurrent caller
+
+    Callers of the same key that arrive while a call is in flight wait for it instead of
+    starting their own; its exception reaches them too. Requests run on different threads
+    and event loops, so the shared slot is a concurrent.futures.Future. A waiter gives up
+    waiting after `timeout` seconds and makes its own call; if the leader is cancelled
+    (its client disconnected) the next waiter becomes the leader. Per process only.
+    """
+
+    def __init__(self, name, timeout=60.0):
+        self.name = name
+        self.timeout = timeout
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.counters = {'leaders': 0, 'coalesced': 0, 'timeouts': 0, 'errors': 0, 'handovers': 0}
+
+    def join(self, key):
+        """Return (future, is_leader); a leader must call complete() exactly once"""
+        with self._lock:
+            future = self._flights.get(key)
+            if future is None:
+                future = self._flights[key] = Future()
+                self.counters['leaders'] += 1
+                return future, True
+            self.counters['coalesced'] += 1
+            return future, False
+
+    def complete(self, key, future, result=None, error=None):
+        """Publish the leader's result (or exception) to its waiters and free the key"""
+        with self._lock:
+            if self._flights.get(key) is future:
+                del self._flights[key]
+            if error is not None:
+                self.counters['errors'] += 1
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def wait(self, future):
+        """Block until a leader completes; raises its exception, TimeoutError or LeaderGone"""
+        try:
+            return future.result(self.timeout)
+        except FutureTimeout:
+            self._count('timeouts')
+            raise TimeoutError(f"{self.name}: in-flight duplicate did not finish within {self.timeout:g}s")
+
+    async def run(self, key, factory):
+        """Await factory() once per key across concurrent callers"""
+        while True:
+            future, leader = self.join(key)
+            if leader:
+                try:
+                    result = await factory()
+                except asyncio.CancelledError:
+                    self.complete(key, future, error=LeaderGone(self.name))
+                    raise
+                except Exception as e:
+                    self.complete(key, future, error=e)
+                    raise
+                self.complete(key, future, result=result)
+                return result
+            waiter = asyncio.wrap_future(future)
+            try:
+                return await asyncio.wait_for(asyncio.shield(waiter), self.timeout)
+            except LeaderGone:
+                self._count('handovers')
+                continue
+            except asyncio.TimeoutError:
+                # Nobody awaits the leader's outcome any more; retrieve it so asyncio does not warn
+                waiter.add_done_callback(lambda f: f.cancelled() or f.exception())
+                self._count('timeouts')
+                logger.warning(f"{self.name}: in-flight duplicate still running after {self.timeout:g}s, calling directly")
+                return await factory()
+
+    def _count(self, counter):
+        with self._lock:
+            self.counters[counter] += 1
+
+    def stats(self):
+        """Calls made vs calls saved, and how many are in flight now"""
+        with self._lock:
+            saved = self.counters['coalesced'] - self.counters['timeouts'] - self.counters['handovers']
+            return dict(self.counters, in_flight=len(self._flights), upstream_calls_saved=saved)
@@ -0,0 +1,168 @@
+"""Cold-start benchmark: import time, time to first request and per-worker memory
+
+Runs offline against the Gemini stand-in (fake_genai.py). Measures importing app.py in a
+fresh interpreter, then starts gunicorn with and without GUNICORN_PRELOAD and reports how
+long the first /livez and the first /ask took from process start, and each worker's RSS
+and PSS (PSS splits pages shared with the master, which is what preloading saves; Linux).
+
+    python startup_bench.py
+    python startup_bench.py --workers 4 --runs 5 --json startup.json
+"""
+import argparse
+import json
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+IMPORT_SCRIPT = """
+import json, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter() - start
+start = time.perf_counter()
+app.load_heavy_modules()
+print(json.dumps({"import_s": imported, "genai_s": time.perf_counter() - start}))
+"""
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def bench_env(state, **extra):
+    """Environment for a run: the Gemini stand-in and throwaway state directories"""
+    env = dict(os.environ, GENAI_FAKE="1", GENAI_FAKE_LATENCY="0.05", READINESS_INTERVAL="300")
+    for name, default in (("RETRIEVAL_INDEX_DIR", "index"), ("FILE_SEARCH_REGISTRY_PATH", "registry.json"),
+                          ("SHARED_STATE_PATH", "shared_state.db"),
+                          ("SESSION_DIR", "sessions"), ("UPLOAD_FOLDER", "uploads"),
+                          ("METRICS_DIR", "metrics"), ("CHUNK_STORE_DIR", "chunks")):
+        env[name] = os.path.join(state, default)
+    env.update(extra)
+    return env
+
+
+def measure_import(state, runs):
+    """Median seconds to import app.py, and to load google.genai afterwards"""
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", IMPORT_SCRIPT], cwd=HERE, capture_output=True, text=True,
+                             env=bench_env(state, WORKER_START_DEFERRED="1", WARMUP="0"), check=True)
+        samples.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    return {key: round(statistics.median(s[key] for s in samples), 3) for key in ("import_s", "genai_s")}
+
+
+def memory_kb(pid):
+    """(RSS, PSS) of one process in kB"""
+    rss = pss = 0
+    with open(f"/proc/{pid}/status") as f:
+        rss = next((int(line.split()[1]) for line in f if line.startswith("VmRSS:")), 0)
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            pss = next((int(line.split()[1]) for line in f if line.startswith("Pss:")), 0)
+    except OSError:
+        pass
+    return rss, pss
+
+
+def worker_pids(master_pid):
+    try:
+        with open(f"/proc/{master_pid}/task/{master_pid}/children") as f:
+            return [int(p) for p in f.read().split()]
+    except OSError:
+        return []
+
+
+def measure_server(state, preload, workers, timeout):
+    """Start gunicorn, time the first /livez and /ask, then read master and worker memory"""
+    import requests
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    env = bench_env(state, PORT=str(port), WEB_CONCURRENCY=str(workers), GUNICORN_PRELOAD="1" if preload else "0")
+    env.pop("WORKER_START_DEFERRED", None)
+    start = time.monotonic()
+    server = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app:app"],
+                              cwd=HERE, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        first_livez = None
+        while time.monotonic() - start < timeout:
+            try:
+                if requests.get(f"{base}/livez", timeout=1).status_code == 200:
+                    first_livez = time.monotonic() - start
+                    break
+            except requests.ConnectionError:
+                pass
+            if server.poll() is not None:
+                raise RuntimeError(f"gunicorn exited with {server.returncode}")
+            time.sleep(0.01)
+        if first_livez is None:
+            raise RuntimeError(f"no response within {timeout}s")
+        response = requests.post(f"{base}/ask", json={"question": "When should I plant sugarcane?",
+                                                      "language": "english"}, timeout=timeout)
+        first_ask = time.monotonic() - start
+        # Let the workers finish booting and warming up before reading their memory
+        time.sleep(1.0)
+        pids = worker_pids(server.pid)
+        memory = [memory_kb(pid) for pid in pids]
+        master_rss, master_pss = memory_kb(server.pid)
+        return {
+            "preload": preload,
+            "workers": len(pids),
+            "first_livez_s": round(first_livez, 3),
+            "first_ask_s": round(first_ask, 3),
+            "first_ask_status": response.status_code,
+            "master_rss_mb": round(master_rss / 1024, 1),
+            "master_pss_mb": round(master_pss / 1024, 1),
+            "worker_rss_mb": [round(rss / 1024, 1) for rss, _ in memory],
+            "worker_pss_mb": [round(pss / 1024, 1) for _, pss in memory],
+        }
+    finally:
+        server.send_signal(signal.SIGTERM)
+        try:
+            server.wait(10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold-start benchmark for the sugarcane advisor API")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn workers (WEB_CONCURRENCY)")
+    parser.add_argument("--runs", type=int, default=3, help="runs per measurement (medians are reported)")
+    parser.add_argument("--modes", default="preload,no-preload", help="comma-separated subset of preload,no-preload")
+    parser.add_argument("--timeout", type=float, default=60.0, help="seconds to wait for the server")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="startup-bench-") as state:
+        results = {"import": measure_import(state, args.runs), "servers": []}
+        print(f"import app.py: {results['import']['import_s']:.3f}s, "
+              f"then google.genai: {results['import']['genai_s']:.3f}s")
+        for mode in [m for m in args.modes.split(",") if m]:
+            # A fresh state directory per run: a persisted answer would make the first /ask a cache hit
+            runs = [measure_server(tempfile.mkdtemp(dir=state), mode == "preload", args.workers, args.timeout)
+                    for _ in range(args.runs)]
+            summary = dict(runs[-1])
+            for key in ("first_livez_s", "first_ask_s", "master_rss_mb", "master_pss_mb"):
+                summary[key] = round(statistics.median(r[key] for r in runs), 3)
+            results["servers"].append(summary)
+            print(f"{mode:>10}: first /livez {summary['first_livez_s']:.3f}s, first /ask {summary['first_ask_s']:.3f}s "
+                  f"(HTTP {summary['first_ask_status']}), master {summary['master_rss_mb']:.0f}MB RSS, workers "
+                  f"{', '.join(f'{r:.0f}' for r in summary['worker_rss_mb'])}MB RSS / "
+                  f"{', '.join(f'{p:.0f}' for p in summary['worker_pss_mb'])}MB PSS")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
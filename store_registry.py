@@ -0,0 +1,127 @@
+"""On-disk registry of Gemini file search stores and the documents already indexed in them"""
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+from lazy_imports import LazyModule
+
+logger = logging.getLogger(__name__)
+types = LazyModule('google.genai.types')
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def file_sha256(file_path):
+    """SHA-256 of a file, read in blocks"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class StoreRegistry:
+    """Maps a configured store display name to its remote store and indexed file hashes
+
+    The registry is a small JSON file shared by every worker process. Reads and writes
+    happen under an exclusive flock so concurrent workers never create duplicate stores.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    @contextmanager
+    def _locked(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        with open(self.path + '.lock', 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'stores': {}}
+        except ValueError as e:
+            logger.error(f"Store registry {self.path} is corrupt, starting fresh: {str(e)}")
+            return {'stores': {}}
+
+    def _write(self, data):
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def lookup(self, display_name):
+        """Return a store handle from the registry without any remote call, or None"""
+        entry = self._read()['stores'].get(display_name)
+        if not entry:
+            return None
+        return types.FileSearchStore(name=entry['name'], display_name=display_name)
+
+    def get_or_create(self, client, display_name):
+        """Reattach to the registered store, adopt a remote one with the same name, or create it"""
+        with self._locked():
+            data = self._read()
+            entry = data['stores'].get(display_name)
+            if entry:
+                return types.FileSearchStore(name=entry['name'], display_name=display_name)
+
+            store = None
+            try:
+                for existing in client.file_search_stores.list():
+                    if existing.display_name == display_name:
+                        store = existing
+                        logger.info(f"Adopted existing file search store: {store.name}")
+                        break
+            except Exception as e:
+                logger.warning(f"Could not list file search stores: {str(e)}")
+
+            if store is None:
+                store = client.file_search_stores.create(config={'display_name': display_name})
+                logger.info(f"Created new file search store: {store.name}")
+
+            data['stores'][display_name] = {
+                'name': store.name,
+                'created_at': time.time(),
+                'files': {},
+            }
+            self._write(data)
+            return store
+
+    def forget(self, display_name):
+        """Drop a store whose remote copy no longer exists"""
+        with self._locked():
+            data = self._read()
+            if data['stores'].pop(display_name, None) is not None:
+                self._write(data)
+                logger.warning(f"Removed file search store '{display_name}' from registry")
+
+    def is_indexed(self, display_name, digest):
+        """Check whether a document with this content hash is already in the store"""
+        entry = self._read()['stores'].get(display_name)
+        return bool(entry) and digest in entry['files']
+
+    def indexed_count(self, display_name):
+        """Number of documents recorded for a store"""
+        entry = self._read()['stores'].get(display_name)
+        return len(entry['files']) if entry else 0
+
+    def mark_indexed(self, display_name, digest, filename):
+        """Record a successfully uploaded document"""
+        with self._locked():
+            data = self._read()
+            entry = data['stores'].get(display_name)
+            if entry is None:
+                return
+            entry['files'][digest] = {'filename': filename, 'uploaded_at': time.time()}
+            self._write(data)
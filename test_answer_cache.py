@@ -0,0 +1,54 @@
+"""Answer cache tiers: exact, similar above the threshold, misses below it, expiry"""
+import time
+
+from answer_cache import AnswerCache, normalize_question
+
+KB = 'kb-1'
+
+
+def cached(cache, question, version=KB):
+    entry, tier = cache.get('english', question, version)
+    return (entry['answer'] if entry else None), tier
+
+
+def test_exact_hit_ignores_case_punctuation_and_spacing():
+    cache = AnswerCache()
+    cache.put('english', "When should I apply urea to ratoon cane?", 'In three splits', [], KB)
+
+    assert normalize_question("  WHEN should I apply urea,  to ratoon cane ") == \
+        'when should i apply urea to ratoon cane'
+    assert cached(cache, "when should i apply urea to ratoon cane") == ('In three splits', 'exact')
+    # Per language
+    assert cache.get('hindi', "When should I apply urea to ratoon cane?", KB) == (None, None)
+
+
+def test_similar_question_above_the_threshold_is_served():
+    cache = AnswerCache(similarity_threshold=0.8)
+    cache.put('english', "When should I apply urea to ratoon cane?", 'In three splits', [], KB)
+
+    assert cached(cache, "when to apply urea for ratoon cane") == ('In three splits', 'similar')
+    assert cache.stats()['similar_hits'] == 1
+
+
+def test_questions_below_the_threshold_or_about_other_things_miss():
+    cache = AnswerCache(similarity_threshold=0.8)
+    cache.put('english', "When should I apply urea to ratoon cane?", 'In three splits', [], KB)
+
+    assert cached(cache, "How do I control early shoot borer?") == (None, None)
+    # Close in wording, but the content words disagree
+    assert cached(cache, "When should I apply urea to plant cane?") == (None, None)
+    # Nothing but exact matches with the tier disabled
+    assert cached(AnswerCache(similarity_threshold=1), "when to apply urea for ratoon cane") == (None, None)
+    assert cache.stats()['misses'] == 2
+
+
+def test_entries_expire_after_the_ttl_and_with_the_knowledge_base():
+    cache = AnswerCache(ttl_seconds=0.1)
+    cache.put('english', "Best time to plant?", 'October', [], KB)
+    assert cached(cache, "Best time to plant?", version='kb-2') == (None, None)
+
+    cache.put('english', "Best time to plant?", 'October', [], KB)
+    assert cached(cache, "Best time to plant?") == ('October', 'exact')
+    time.sleep(0.15)
+    assert cached(cache, "Best time to plant?") == (None, None)
+    assert cache.stats()['entries'] == 0
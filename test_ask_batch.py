@@ -0,0 +1,70 @@
+"""/ask/batch: one model call per distinct question, per-item errors, NDJSON streaming"""
+import json
+
+import pytest
+
+
+def test_identical_questions_share_one_answer(client, model_calls):
+    question = "How deep should sugarcane setts be planted in black soil?"
+    response = client.post("/ask/batch", json={"items": [
+        {"id": "a", "question": question},
+        {"id": "b", "question": "  " + question.upper() + " ", "language": "English"},
+        {"id": "c", "question": "Which fungicide controls sugarcane smut in ratoons?"},
+    ]})
+
+    assert response.status_code == 200
+    body = response.get_json()
+    assert (body["items"], body["unique"]) == (3, 2)
+    assert [item["id"] for item in body["results"]] == ["a", "b", "c"]
+    assert body["results"][0]["response"] == body["results"][1]["response"]
+    assert len(model_calls) == 2
+
+
+def test_bad_items_fail_alone(client, model_calls):
+    response = client.post("/ask/batch", json={"items": [
+        {"question": "When is the best time to plant autumn sugarcane?", "language": 3},
+        ["not", "an", "object"],
+        {"question": "   "},
+        {"question": 42},
+        {"id": 7, "question": "How often should drip lines be flushed in a cane field?"},
+    ]})
+
+    assert response.status_code == 200
+    results = response.get_json()["results"]
+    assert [item.get("error") for item in results[:4]] == [
+        "Language must be a string",
+        "Item must be an object with a question",
+        "Question cannot be empty",
+        "Question must be a string",
+    ]
+    assert results[4]["id"] == 7 and "response" in results[4]
+    assert len(model_calls) == 1
+
+
+@pytest.mark.parametrize("body", [[], {"items": []}, {"items": "question"}])
+def test_requests_without_items_are_refused(client, body):
+    assert client.post("/ask/batch", json=body).status_code == 400
+
+
+@pytest.mark.parametrize("path", ["/ask", "/ask/stream"])
+@pytest.mark.parametrize("body", [["How much urea per acre?"], {"question": ["urea"]}, {"question": "urea", "language": 3}])
+def test_ask_refuses_malformed_bodies(client, path, body):
+    response = client.post(path, json=body)
+    assert response.status_code == 400
+    assert "error" in response.get_json()
+
+
+def test_stream_yields_one_line_per_item_then_done(client):
+    response = client.post("/ask/batch", json={"stream": True, "items": [
+        {"id": "bad", "question": ""},
+        {"id": "x", "question": "What spacing suits trench planting of sugarcane?"},
+        {"id": "y", "question": "What spacing suits trench planting of sugarcane?"},
+    ]})
+
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert lines[0] == {"error": "Question cannot be empty", "index": 0, "id": "bad"}
+    assert sorted(line["id"] for line in lines[1:3]) == ["x", "y"]
+    assert all("response" in line for line in lines[1:3])
+    assert lines[-1] == {"done": True, "items": 3, "unique": 1}
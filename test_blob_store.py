@@ -0,0 +1,96 @@
+"""Upload blob store: dedup by content, reference counts and quota eviction"""
+import io
+import os
+
+import pytest
+
+from blob_store import BlobStore, QuotaExceeded
+
+
+class Unseekable(io.RawIOBase):
+    """A request body that can only be read once"""
+
+    def __init__(self, data):
+        self._data = io.BytesIO(data)
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        return self._data.read(size)
+
+
+def blob_files(store):
+    return sorted(name for _, _, names in os.walk(store.blob_dir) for name in names)
+
+
+def test_identical_content_is_stored_once(tmp_path):
+    store = BlobStore(str(tmp_path))
+    digest, path, is_new = store.put('guide.pdf', io.BytesIO(b'ratoon management'))
+    again, again_path, again_new = store.put('copy.pdf', Unseekable(b'ratoon management'))
+
+    assert (is_new, again_new) == (True, False)
+    assert again == digest and again_path == path
+    assert blob_files(store) == [os.path.basename(path)]
+    assert store.usage() == {'bytes': 17, 'blobs': 1, 'names': 2, 'quota_bytes': 0}
+    assert store.title_for_path(path) in ('guide.pdf', 'copy.pdf')
+
+
+def test_references_follow_names(tmp_path):
+    store = BlobStore(str(tmp_path))
+    first, _, _ = store.put('notes.txt', io.BytesIO(b'first draft'))
+    store.put('notes.txt', io.BytesIO(b'first draft'))
+    second, _, _ = store.put('notes.txt', io.BytesIO(b'second draft'))
+
+    blobs = store._read()['blobs']
+    assert (blobs[first]['refs'], blobs[second]['refs']) == (0, 1)
+    assert store.remove('notes.txt') is True
+    assert store.remove('notes.txt') is False
+    assert store._read()['blobs'][second]['refs'] == 0
+
+
+def test_quota_evicts_only_unreferenced_blobs(tmp_path):
+    store = BlobStore(str(tmp_path), quota_bytes=250)
+    old, _, _ = store.put('old.txt', io.BytesIO(b'o' * 100))
+    kept, _, _ = store.put('kept.txt', io.BytesIO(b'k' * 100))
+    store.remove('old.txt')
+
+    new, _, _ = store.put('new.txt', io.BytesIO(b'n' * 100))
+
+    assert set(store._read()['blobs']) == {kept, new}
+    assert store._read()['names'] == {'kept.txt': kept, 'new.txt': new}
+    assert len(blob_files(store)) == 2
+
+
+def test_upload_is_refused_when_only_referenced_blobs_remain(tmp_path):
+    store = BlobStore(str(tmp_path), quota_bytes=250)
+    store.put('a.txt', io.BytesIO(b'a' * 100))
+    store.put('b.txt', io.BytesIO(b'b' * 100))
+    before = store._read()
+
+    with pytest.raises(QuotaExceeded):
+        store.put('c.txt', Unseekable(b'c' * 100))
+
+    assert store._read() == before
+    assert len(blob_files(store)) == 2
+    # A duplicate adds no bytes, so it is still accepted
+    assert store.put('a-copy.txt', io.BytesIO(b'a' * 100))[2] is False
+
+
+def test_blobs_of_pending_jobs_are_not_evicted(tmp_path):
+    pending = set()
+    store = BlobStore(str(tmp_path), quota_bytes=150, in_use=lambda: pending)
+    queued, _, _ = store.put('queued.txt', io.BytesIO(b'q' * 100))
+    store.remove('queued.txt')
+    pending.add(queued)
+
+    part = tmp_path / 'upload.part'
+    part.write_bytes(b'p' * 100)
+    with pytest.raises(QuotaExceeded):
+        store.adopt('chunked.txt', str(part), 'f' * 64, 100)
+    assert part.exists()
+
+    pending.clear()
+    digest, path, is_new = store.adopt('chunked.txt', str(part), 'f' * 64, 100)
+    assert is_new and os.path.exists(path) and not part.exists()
+    assert set(store._read()['blobs']) == {digest}
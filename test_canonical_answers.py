@@ -0,0 +1,49 @@
+"""Cross-language reuse: a question answered in English answers the same question in Hindi"""
+import time
+
+import pytest
+
+ENGLISH = "How many times should I irrigate ratoon sugarcane in summer?"
+HINDI = "गर्मी में पेड़ी गन्ने की सिंचाई कितनी बार करें?"
+HINDI_AGAIN = "गर्मियों में पेड़ी गन्ने को कितनी बार पानी दें?"
+
+
+@pytest.fixture
+def canonical(app_module, monkeypatch):
+    monkeypatch.setattr(app_module, 'CANONICAL_ANSWERS', True)
+    app_module.canonical_answers.invalidate()
+
+    # The model's job: every wording of the question maps to one short English question
+    async def canonicalize_question(user_question, language):
+        return ENGLISH if language != 'english' else user_question
+
+    monkeypatch.setattr(app_module, 'canonicalize_question', canonicalize_question)
+    yield app_module.canonical_answers
+    app_module.canonical_answers.invalidate()
+
+
+def ask(client, question, language):
+    response = client.post("/ask", json={"question": question, "language": language})
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()
+
+
+def test_hindi_question_reuses_the_english_answer(client, canonical, model_calls):
+    english = ask(client, ENGLISH, "english")
+    answer_calls = len(model_calls)
+    deadline = time.monotonic() + 10
+    while canonical.stats()['stores'] == 0:
+        assert time.monotonic() < deadline
+        time.sleep(0.02)
+
+    hindi = ask(client, HINDI, "hindi")
+    assert hindi["cached"] == "translated"
+    assert hindi["sources"] == english["sources"]
+    # One cheap translation instead of a second full answer
+    assert len(model_calls) == answer_calls + 1
+    assert model_calls[-1][1].startswith("Translate this agricultural advice")
+
+    # The translation is kept: the next Hindi wording costs no model call at all
+    again = ask(client, HINDI_AGAIN, "hindi")
+    assert (again["cached"], again["response"]) == ("canonical", hindi["response"])
+    assert len(model_calls) == answer_calls + 1
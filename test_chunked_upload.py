@@ -0,0 +1,69 @@
+"""Resumable /uploads: chunks at offsets, resuming, and finalizing into an ingestion job"""
+import hashlib
+
+DOCUMENT = ("Trash mulching after ratoon initiation conserves soil moisture and suppresses weeds. " * 40).encode()
+
+
+def start(client, data=DOCUMENT, **extra):
+    response = client.post("/uploads", json=dict({"filename": "mulching.txt", "size": len(data)}, **extra))
+    assert response.status_code == 201, response.get_json()
+    return response.get_json()
+
+
+def put(client, upload_id, offset, chunk):
+    return client.put(f"/uploads/{upload_id}", data=chunk, headers={"Upload-Offset": str(offset)})
+
+
+def test_chunked_upload_resumes_and_finalizes(client):
+    upload = start(client, sha256=hashlib.sha256(DOCUMENT).hexdigest())
+    upload_id = upload["id"]
+    assert (upload["offset"], upload["complete"]) == (0, False)
+
+    first = put(client, upload_id, 0, DOCUMENT[:1000])
+    assert first.status_code == 200
+    assert first.get_json()["offset"] == 1000
+
+    # A retried or out-of-order chunk is refused with the offset to continue from
+    stale = put(client, upload_id, 0, DOCUMENT[:1000])
+    assert stale.status_code == 409
+    assert stale.get_json()["offset"] == 1000
+    assert client.get(f"/uploads/{upload_id}").get_json()["offset"] == 1000
+
+    # Finalizing before every byte arrived
+    early = client.post(f"/uploads/{upload_id}/finalize")
+    assert early.status_code == 409
+    assert early.get_json()["offset"] == 1000
+
+    rest = put(client, upload_id, 1000, DOCUMENT[1000:])
+    assert rest.get_json()["complete"] is True
+
+    done = client.post(f"/uploads/{upload_id}/finalize")
+    assert done.status_code == 202, done.get_json()
+    body = done.get_json()
+    assert body["uploaded"] == ["mulching.txt"]
+    assert body["jobs"][0]["filename"] == "mulching.txt"
+    assert "path" not in body["jobs"][0]
+
+    # The upload is gone once finalized
+    assert client.get(f"/uploads/{upload_id}").status_code == 404
+
+
+def test_content_that_does_not_match_the_declared_digest_is_refused(client):
+    upload_id = start(client, sha256="0" * 64)["id"]
+    assert put(client, upload_id, 0, DOCUMENT).status_code == 200
+    response = client.post(f"/uploads/{upload_id}/finalize")
+    assert response.status_code == 400
+    assert "sha256" in response.get_json()["error"]
+
+
+def test_bad_starts_and_chunks_past_the_size_are_refused(client):
+    assert client.post("/uploads", json={"filename": "run.exe", "size": 10}).status_code == 400
+    # Legacy Word files have no local extractor
+    assert client.post("/uploads", json={"filename": "guide.doc", "size": 10}).status_code == 400
+    assert client.post("/uploads", json={"filename": "a.txt", "size": "ten"}).status_code == 400
+
+    upload_id = start(client, data=b"short")["id"]
+    assert put(client, upload_id, 0, b"much too long").status_code == 400
+    assert client.put(f"/uploads/{upload_id}", data=b"x").status_code == 400
+    assert client.delete(f"/uploads/{upload_id}").get_json() == {"deleted": True}
+    assert client.delete(f"/uploads/{upload_id}").status_code == 404
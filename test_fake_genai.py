@@ -0,0 +1,47 @@
+"""Offline Gemini stand-in: seeded runs repeat exactly, answers look like the real SDK's"""
+import asyncio
+
+import pytest
+from google.genai import errors as genai_errors
+
+from fake_genai import FAKE_ANSWER, FakeClient
+
+
+def outcomes(client, calls=40):
+    results = []
+    for _ in range(calls):
+        try:
+            results.append(round(client.latency.sample(), 9))
+        except genai_errors.ServerError:
+            results.append('503')
+    return results
+
+
+def test_same_seed_gives_the_same_latencies_and_failures():
+    first = outcomes(FakeClient(latency_median=0.5, failure_rate=0.3, seed=7))
+    assert first == outcomes(FakeClient(latency_median=0.5, failure_rate=0.3, seed=7))
+    assert first != outcomes(FakeClient(latency_median=0.5, failure_rate=0.3, seed=8))
+    assert '503' in first and any(isinstance(seconds, float) for seconds in first)
+
+
+def test_answers_and_usage_depend_only_on_the_prompt():
+    client = FakeClient(latency_median=0, seed=1)
+    one = client.models.generate_content(model='m', contents="How deep should I plant setts?")
+    two = asyncio.run(client.aio.models.generate_content(model='m', contents="How deep should I plant setts?"))
+
+    assert one.text == two.text == FAKE_ANSWER
+    assert one.usage_metadata.prompt_token_count == two.usage_metadata.prompt_token_count
+    assert one.candidates[0].finish_reason.name == 'STOP'
+
+
+def test_streamed_chunks_add_up_to_the_answer():
+    client = FakeClient(latency_median=0, stream_chunks=5)
+    chunks = [chunk.text for chunk in client.models.generate_content_stream(model='m', contents="q")]
+    assert len(chunks) == 5
+    assert "".join(chunks) == FAKE_ANSWER
+
+
+def test_failure_rate_one_always_fails():
+    client = FakeClient(latency_median=0, failure_rate=1.0)
+    with pytest.raises(genai_errors.ServerError):
+        client.models.generate_content(model='m', contents="q")
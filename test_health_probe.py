@@ -0,0 +1,55 @@
+"""Liveness and readiness: cached probe results, hung checks and /readyz"""
+import threading
+import time
+
+from health_probe import ReadinessProber
+
+
+def test_hung_check_is_reported_and_not_started_twice():
+    release = threading.Event()
+    calls = []
+
+    def hangs():
+        calls.append(1)
+        release.wait(5)
+
+    prober = ReadinessProber({'ok': lambda: 'fine', 'provider': hangs}, timeout=0.05)
+    try:
+        prober.run_once()
+        prober.run_once()
+        status = prober.status()
+        assert not status['ready']
+        assert (status['checks']['ok']['ok'], status['checks']['ok']['detail']) == (True, 'fine')
+        assert status['checks']['provider']['error'] == 'previous check still running'
+        assert len(calls) == 1
+    finally:
+        release.set()
+
+
+def test_results_go_stale_when_the_prober_stops():
+    prober = ReadinessProber({'ok': lambda: None}, interval=0.02)
+    assert prober.status()['ready'] is False
+    prober.run_once()
+    assert prober.status()['ready'] is True
+    time.sleep(0.1)
+    assert prober.status()['ready'] is False
+
+
+def test_readyz_turns_503_while_a_dependency_is_down(app_module, client, monkeypatch):
+    def provider_down():
+        raise ConnectionError("provider unreachable")
+
+    monkeypatch.setitem(app_module.readiness.checks, 'gemini', provider_down)
+    app_module.readiness.run_once()
+    response = client.get("/readyz")
+    assert response.status_code == 503
+    assert response.get_json()['checks']['gemini'] == {'ok': False, 'error': 'provider unreachable',
+                                                       'latency_ms': None}
+    # Liveness does not depend on the provider
+    assert client.get("/livez").status_code == 200
+
+    monkeypatch.undo()
+    app_module.readiness.run_once()
+    response = client.get("/readyz")
+    assert response.status_code == 200, response.get_json()
+    assert response.get_json()['status'] == 'ready'
@@ -0,0 +1,46 @@
+"""/analyze prompts and /analyze/batch field surveys against the offline model"""
+import io
+import json
+
+
+def prompt_texts(contents):
+    return [part.text for content in contents for part in content.parts if part.text]
+
+
+def test_farmers_question_reaches_the_vision_model(client, crop_photo, model_calls):
+    data = {"file": (io.BytesIO(crop_photo(801)), "leaf.jpg"), "language": "english",
+            "question": "Should I spray for the white woolly aphid now?"}
+    response = client.post("/analyze", data=data, content_type="multipart/form-data")
+
+    assert response.status_code == 200, response.get_json()
+    _, contents, _ = model_calls[0]
+    assert any("Should I spray for the white woolly aphid now?" in text for text in prompt_texts(contents))
+
+
+def survey(client, photos):
+    data = {"files": [(io.BytesIO(photo), f"plant{i}.jpg") for i, photo in enumerate(photos)],
+            "language": "english"}
+    response = client.post("/analyze/batch", data=data, content_type="multipart/form-data")
+    assert response.status_code == 200
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines() if line]
+
+
+def test_survey_findings_are_reused_by_analyze_and_later_surveys(client, crop_photo, model_calls):
+    photos = [crop_photo(seed) for seed in (811, 812, 813)]
+    lines = survey(client, photos)
+    findings = [line for line in lines if "finding" in line]
+    assert len(findings) == 3 and not any("cached" in line for line in findings)
+    calls = len(model_calls)
+
+    # The same photo sent to /analyze is not paid for twice
+    data = {"file": (io.BytesIO(photos[1]), "leaf.jpg"), "language": "english"}
+    single = client.post("/analyze", data=data, content_type="multipart/form-data").get_json()
+    assert single.get("cached") == "perceptual"
+    assert single["response"]
+    assert len(model_calls) == calls
+
+    # Nor is the plot's next survey: findings come back from the cache, only the summary is new
+    again = [line for line in survey(client, photos) if "finding" in line]
+    assert [line["cached"] for line in again] == ["perceptual"] * 3
+    assert [line["finding"] for line in again] == [line["finding"] for line in findings]
+    assert len(model_calls) == calls + 1
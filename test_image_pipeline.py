@@ -0,0 +1,61 @@
+"""Crop photo normalization: EXIF orientation, downscaling, re-encoding and rejects"""
+import io
+
+import pytest
+from PIL import Image
+
+from image_pipeline import InvalidImageError, normalize_image
+
+
+def photo(size, orientation=None, fmt='JPEG', mode='RGB'):
+    image = Image.new(mode, size, (40, 160, 60, 255)[:len(mode)])
+    buffer = io.BytesIO()
+    exif = Image.Exif()
+    if orientation:
+        exif[0x0112] = orientation
+        exif[0x010F] = 'PhoneMaker'
+    image.save(buffer, fmt, **({'exif': exif.tobytes()} if orientation else {}))
+    return buffer.getvalue()
+
+
+def test_exif_orientation_is_applied_and_metadata_dropped():
+    # Orientation 6: the sensor stored a landscape frame of a portrait shot
+    normalized = normalize_image(photo((400, 200), orientation=6))
+
+    assert (normalized.width, normalized.height) == (200, 400)
+    with Image.open(io.BytesIO(normalized.data)) as result:
+        assert result.size == (200, 400)
+        assert not result.getexif()
+
+
+def test_large_photos_are_downscaled_to_the_long_edge():
+    normalized = normalize_image(photo((4000, 3000)), max_edge=1600)
+
+    assert (normalized.width, normalized.height) == (1600, 1200)
+    assert normalized.mime_type == 'image/jpeg'
+    assert normalized.original_format == 'JPEG'
+    assert normalized.original_bytes > 0
+
+
+def test_small_transparent_png_is_flattened_not_upscaled():
+    normalized = normalize_image(photo((300, 100), fmt='PNG', mode='RGBA'), output_format='webp')
+
+    assert (normalized.width, normalized.height) == (300, 100)
+    assert normalized.mime_type == 'image/webp'
+    with Image.open(io.BytesIO(normalized.data)) as result:
+        assert result.mode == 'RGB'
+
+
+def test_undecodable_bytes_are_rejected():
+    with pytest.raises(InvalidImageError):
+        normalize_image(b'not an image')
+    with pytest.raises(InvalidImageError):
+        normalize_image(photo((400, 200))[:300])
+
+
+def test_images_over_the_pixel_limit_are_refused_not_only_warned_about(monkeypatch):
+    # Between one and two times the limit PIL only warns
+    monkeypatch.setattr(Image, 'MAX_IMAGE_PIXELS', 10_000)
+    with pytest.warns(Image.DecompressionBombWarning), pytest.raises(InvalidImageError, match="exceeds limit"):
+        normalize_image(photo((150, 100)))
+    assert normalize_image(photo((100, 100))).width == 100
@@ -0,0 +1,51 @@
+"""Photo quality gate: localized retake advice instead of a model call, and reject counters"""
+import io
+
+from PIL import Image, ImageFilter
+
+
+def altered(photo, change):
+    image = change(Image.open(io.BytesIO(photo)))
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=90)
+    return buffer.getvalue()
+
+
+def analyze(client, photo, language):
+    return client.post("/analyze", data={"file": (io.BytesIO(photo), "leaf.jpg"), "language": language},
+                       content_type="multipart/form-data")
+
+
+def failed(client, check):
+    return client.get("/quality/stats").get_json()["checks"][check]["failed"]
+
+
+def test_dark_and_blurred_photos_get_retake_advice_in_the_farmers_language(app_module, client, crop_photo,
+                                                                          model_calls):
+    dark_before, blurry_before = failed(client, "exposure"), failed(client, "sharpness")
+
+    dark = analyze(client, altered(crop_photo(2301), lambda image: image.point(lambda v: v // 8)), "hindi")
+    assert dark.status_code == 422
+    body = dark.get_json()
+    assert body["retake"] is True
+    assert body["failed_checks"][0] == "exposure_dark"
+    assert body["error"] == app_module.RETAKE_MESSAGES["hindi"]["exposure_dark"]
+    assert body["measures"]["brightness"] < 40
+
+    blurry = analyze(client, altered(crop_photo(2302), lambda image: image.filter(ImageFilter.GaussianBlur(6))),
+                     "marathi")
+    assert blurry.status_code == 422
+    assert blurry.get_json()["failed_checks"] == ["sharpness"]
+    assert blurry.get_json()["error"] == app_module.RETAKE_MESSAGES["marathi"]["sharpness"]
+
+    # Rejected before any model call, and counted for every worker to see
+    assert model_calls == []
+    stats = client.get("/quality/stats").get_json()
+    assert stats["enabled"] is True and stats["enforce"] is True
+    assert failed(client, "exposure") == dark_before + 1
+    assert failed(client, "sharpness") == blurry_before + 1 + ("sharpness" in body["failed_checks"])
+    assert stats["checks"]["sharpness"]["reject_rate"] > 0
+
+
+def test_good_photo_passes_the_gate(client, crop_photo):
+    assert analyze(client, crop_photo(2303), "english").status_code == 200
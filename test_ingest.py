@@ -0,0 +1,117 @@
+"""Extraction and chunking, the out-of-process ingest run, and uploads indexed by their job"""
+import io
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import requests
+
+from ingest import ChunkStore, chunk_tokens, ingest, ingest_in_subprocess, normalize_text
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def write_documents(directory, count, text="Sugarcane document {n} about red rot and irrigation."):
+    os.makedirs(directory, exist_ok=True)
+    for n in range(count):
+        with open(os.path.join(directory, f"doc{n}.txt"), 'w', encoding='utf-8') as f:
+            f.write(text.format(n=n))
+
+
+def test_normalize_text_removes_invisible_characters_and_hyphen_breaks():
+    assert normalize_text("sugar­cane  crop​\r\nirri-\ngation") == "sugarcane crop\nirrigation"
+
+
+def test_chunks_stay_within_budget_and_overlap():
+    text = " ".join(f"word{n}" for n in range(500))
+    chunks = chunk_tokens(text, max_tokens=100, overlap_tokens=20)
+    assert len(chunks) > 1
+    assert all(c['tokens'] <= 100 for c in chunks)
+    first, second = chunks[0]['text'].split(), chunks[1]['text'].split()
+    assert second[0] in first
+
+
+def test_ingest_skips_unchanged_documents(tmp_path):
+    write_documents(tmp_path / "kb" / "diseases", 2)
+    roots = [(str(tmp_path / "kb"), None)]
+    store_dir = str(tmp_path / "store")
+
+    first = ingest(roots, store_dir, workers=1)
+    assert (first['added'], first['files']) == (2, 2)
+    second = ingest(roots, store_dir, workers=1)
+    assert (second['added'], second['unchanged']) == (0, 2)
+    entry = next(iter(ChunkStore(store_dir).read_manifest()['files'].values()))
+    assert entry['category'] == 'diseases'
+
+
+def test_ingest_in_subprocess_extracts_in_a_pool(tmp_path):
+    write_documents(tmp_path / "uploads", 3)
+    summary = ingest_in_subprocess(str(tmp_path / "kb"), str(tmp_path / "uploads"), str(tmp_path / "store"), workers=2)
+    assert (summary['added'], summary['chunks'], summary['failed']) == (3, 3, 0)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def test_app_starts_while_documents_are_pending(tmp_path):
+    """python app.py with several unextracted documents must answer /livez (no extraction at import)"""
+    write_documents(tmp_path / "uploads", 3)
+    port = free_port()
+    env = dict(os.environ, PORT=str(port), EXTRACTION_WORKERS="2",
+               UPLOAD_FOLDER=str(tmp_path / "uploads"), CHUNK_STORE_DIR=str(tmp_path / "chunks"),
+               RETRIEVAL_INDEX_DIR=str(tmp_path / "index"), SHARED_STATE_PATH=str(tmp_path / "state.db"),
+               METRICS_DIR=str(tmp_path / "metrics"), SESSION_DIR=str(tmp_path / "sessions"),
+               FILE_SEARCH_REGISTRY_PATH=str(tmp_path / "registry.json"))
+    env.pop("WORKER_START_DEFERRED", None)
+    server = subprocess.Popen([sys.executable, "app.py"], cwd=HERE, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.monotonic() + 30
+        alive = extracted = False
+        while time.monotonic() < deadline and not (alive and extracted):
+            assert server.poll() is None
+            try:
+                alive = alive or requests.get(f"http://127.0.0.1:{port}/livez", timeout=1).status_code == 200
+            except requests.RequestException:
+                pass
+            extracted = len(ChunkStore(str(tmp_path / "chunks")).read_manifest()['files']) == 3
+            time.sleep(0.1)
+        assert alive and extracted
+    finally:
+        server.terminate()
+        server.wait(10)
+
+
+def wait_for_job(client, job_id, timeout=20):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = client.get(f"/jobs/{job_id}").get_json()
+        if job["status"] in ("succeeded", "failed"):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"job {job_id} did not finish: {json.dumps(job)}")
+
+
+def test_upload_is_indexed_locally_by_its_job_not_the_request(app_module, client, monkeypatch):
+    threads = []
+    refresh = app_module.refresh_local_index
+    monkeypatch.setattr(app_module, 'refresh_local_index',
+                        lambda: threads.append(threading.current_thread().name) or refresh())
+
+    data = {"files": (io.BytesIO(b"Zqxwvut borer traps work best in June."), "traps.txt")}
+    response = client.post("/upload", data=data, content_type="multipart/form-data")
+
+    assert response.status_code == 202
+    job_id = response.get_json()["jobs"][0]["id"]
+    job = wait_for_job(client, job_id)
+    assert job["status"] == "succeeded", job
+    assert job["progress"]["local_index"] == "ready"
+    assert threads and all(name.startswith("ingest") for name in threads)
+    assert any("Zqxwvut" in hit['text'] for hit in app_module.retrieval_index.search("zqxwvut borer traps"))
@@ -0,0 +1,76 @@
+"""Ingestion jobs: leases decide who runs a pending job, not whether some process has the owner's PID"""
+import os
+import threading
+import time
+
+from ingestion_jobs import IngestionQueue, NAMESPACE
+from shared_state import SharedState
+
+
+def make_queue(tmp_path, done, lease_seconds=60):
+    def handler(job, report):
+        report(stage='extracting')
+        done.append(job['id'])
+
+    return IngestionQueue(SharedState(str(tmp_path / 'state.db')), handler, lease_seconds=lease_seconds)
+
+
+def leftover_job(queue, job_id, lease_until):
+    """A job another worker left running; its PID is alive (this test's parent) and reused"""
+    queue.state.set(NAMESPACE, job_id, {
+        'id': job_id, 'filename': 'a.pdf', 'path': '/tmp/a.pdf', 'status': 'running', 'attempts': 1,
+        'error': None, 'progress': {}, 'owner': 'another-worker', 'owner_pid': os.getppid(),
+        'lease_until': lease_until, 'created_at': time.time(), 'updated_at': time.time(),
+        'started_at': time.time(), 'finished_at': None,
+    })
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.02)
+
+
+def test_expired_lease_is_claimed_although_the_owner_pid_is_alive(tmp_path):
+    done = []
+    queue = make_queue(tmp_path, done)
+    leftover_job(queue, 'stale', lease_until=time.time() - 1)
+
+    assert queue.resume() == 1
+    wait_for(lambda: queue.get('stale')['status'] == 'succeeded')
+    job = queue.get('stale')
+    assert done == ['stale']
+    assert (job['attempts'], job['owner_pid'], job['progress']) == (2, os.getpid(), {'stage': 'extracting'})
+
+
+def test_live_lease_is_left_to_its_owner_until_it_runs_out(tmp_path):
+    done = []
+    queue = make_queue(tmp_path, done, lease_seconds=0.3)
+    leftover_job(queue, 'held', lease_until=time.time() + 0.6)
+
+    assert queue.resume() == 0
+    assert queue.get('held')['status'] == 'running'
+    # No renewal comes from the other worker: the heartbeat takes the job over once the lease runs out
+    wait_for(lambda: queue.get('held')['status'] == 'succeeded')
+    assert done == ['held']
+
+
+def test_running_jobs_keep_their_lease_and_a_late_owner_cannot_overwrite(tmp_path):
+    release = threading.Event()
+    queue = IngestionQueue(SharedState(str(tmp_path / 'state.db')), lambda job, report: release.wait(5),
+                           lease_seconds=0.3)
+    job = queue.submit('a.pdf', '/tmp/a.pdf')
+    wait_for(lambda: queue.get(job['id'])['status'] == 'running')
+
+    # Renewed by the heartbeat while the handler runs, so nobody else may claim it
+    time.sleep(0.5)
+    other = IngestionQueue(queue.state, lambda job, report: None, lease_seconds=0.3)
+    assert other.resume() == 0
+
+    # A job taken over elsewhere is not overwritten when the old owner finishes
+    queue.state.update(NAMESPACE, job['id'],
+                       lambda j: dict(j, owner='new-owner', status='queued', lease_until=time.time() + 60))
+    release.set()
+    time.sleep(0.2)
+    assert queue.get(job['id'])['status'] == 'queued'
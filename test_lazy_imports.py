@@ -0,0 +1,49 @@
+"""Deferred imports: first use from many threads at once sees fully initialized modules"""
+import json
+import os
+import subprocess
+import sys
+
+from lazy_imports import LazyModule
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# google.genai is already imported in this process, so the race runs in fresh interpreters
+RACE_SCRIPT = """
+import json, threading
+from lazy_imports import LazyModule
+
+uses = [('google.genai', 'Client'), ('google.genai.types', 'Part'), ('google.genai.errors', 'APIError')] * 4
+barrier = threading.Barrier(len(uses))
+errors = []
+
+def use(name, attr):
+    module = LazyModule(name)
+    barrier.wait()
+    try:
+        getattr(module, attr)
+    except Exception as e:
+        errors.append(repr(e))
+
+threads = [threading.Thread(target=use, args=use_) for use_ in uses]
+for thread in threads:
+    thread.start()
+for thread in threads:
+    thread.join()
+print(json.dumps(errors))
+"""
+
+
+def test_module_is_imported_on_first_attribute_access():
+    module = LazyModule('colorsys')
+    assert not module.loaded
+    assert module.rgb_to_hsv(1, 0, 0) == (0, 1, 1)
+    assert module.loaded
+    assert 'loaded' in repr(module)
+
+
+def test_concurrent_first_uses_of_google_genai():
+    for _ in range(6):
+        out = subprocess.run([sys.executable, '-c', RACE_SCRIPT], cwd=HERE, capture_output=True, text=True,
+                             check=True, timeout=120)
+        assert json.loads(out.stdout.strip().splitlines()[-1]) == []
@@ -0,0 +1,69 @@
+"""Metrics snapshots shared between workers: idle flushes, exit flushes and exited workers"""
+import json
+import os
+import subprocess
+import sys
+import time
+
+from metrics import FLUSH_INTERVAL, MetricsRegistry, RETIRED_SNAPSHOT
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# One "worker": counts twice in quick succession, then idles (or exits at once with --exit)
+WORKER_SCRIPT = """
+import sys, time
+from metrics import MetricsRegistry
+registry = MetricsRegistry(sys.argv[1])
+registry.counter('jobs_total', 'Jobs')
+registry.inc('jobs_total', kind='a')
+registry.inc('jobs_total', kind='a')
+print('counted', flush=True)
+if '--exit' not in sys.argv:
+    time.sleep(30)
+"""
+
+
+def start_worker(directory, *args):
+    worker = subprocess.Popen([sys.executable, '-c', WORKER_SCRIPT, str(directory), *args], cwd=HERE,
+                              stdout=subprocess.PIPE, text=True)
+    assert worker.stdout.readline().strip() == 'counted'
+    return worker
+
+
+def total(registry, name='jobs_total'):
+    return sum(values[0] for _, values in registry.series(name))
+
+
+def reader(directory):
+    registry = MetricsRegistry(str(directory))
+    registry.counter('jobs_total', 'Jobs')
+    return registry
+
+
+def test_idle_worker_publishes_its_last_counts(tmp_path):
+    worker = start_worker(tmp_path)
+    try:
+        time.sleep(FLUSH_INTERVAL * 2)
+        assert total(reader(tmp_path)) == 2
+    finally:
+        worker.kill()
+        worker.wait()
+
+
+def test_exiting_worker_flushes(tmp_path):
+    worker = start_worker(tmp_path, '--exit')
+    assert worker.wait(10) == 0
+    assert total(reader(tmp_path)) == 2
+
+
+def test_snapshots_of_exited_workers_are_folded_into_retired(tmp_path):
+    for _ in range(2):
+        start_worker(tmp_path, '--exit').wait(10)
+    registry = reader(tmp_path)
+    assert total(registry) == 4
+
+    assert registry.prune() == 2
+    assert sorted(os.listdir(tmp_path)) == ['.lock', RETIRED_SNAPSHOT]
+    assert total(registry) == 4
+    with open(tmp_path / RETIRED_SNAPSHOT) as f:
+        assert json.load(f)['jobs_total'] == {'[["kind", "a"]]': [4]}
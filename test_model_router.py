@@ -0,0 +1,57 @@
+"""Model tier routing: which questions go to pro, and when a fast answer is escalated"""
+from types import SimpleNamespace
+
+from model_router import ModelRouter, TIER_FAST, TIER_PRO
+
+MODELS = {TIER_FAST: 'fast-model', TIER_PRO: 'pro-model'}
+
+
+def router():
+    return ModelRouter(MODELS, {'ask': 10.0, 'analyze': 20.0})
+
+
+def response(text, finish='STOP'):
+    return SimpleNamespace(text=text, candidates=[SimpleNamespace(finish_reason=SimpleNamespace(name=finish))])
+
+
+GOOD_ANSWER = "Apply 250 kg of nitrogen per hectare in three splits, at planting, tillering and grand growth."
+
+
+def test_simple_questions_go_to_the_fast_tier_and_photos_in_hindi_to_pro():
+    simple = router().route('ask', "What is the FRP price this year?")
+    assert (simple.tier, simple.model, simple.budget) == (TIER_FAST, 'fast-model', 10.0)
+
+    photo = router().route('analyze', "पत्तियों पर धब्बे", language='hindi', has_image=True)
+    assert photo.tier == TIER_PRO
+    assert {'image', 'indic_language'} <= set(photo.reasons)
+
+
+def test_weak_fast_answers_are_escalated_to_pro():
+    decision = router().route('ask', "What is the FRP price this year?")
+
+    assert router().needs_escalation(decision, response(""), elapsed=1.0) == (True, 'empty')
+    assert router().needs_escalation(decision, response("Ask your mill."), 1.0) == (True, 'short_answer')
+    assert router().needs_escalation(decision, response(GOOD_ANSWER, finish='MAX_TOKENS'), 1.0) == \
+        (True, 'finish_max_tokens')
+    hedged = "I am not sure which price applies in your district; it depends on the mill and recovery."
+    assert router().needs_escalation(decision, response(hedged), 1.0) == (True, 'hedged_answer')
+    assert router().needs_escalation(decision, response(GOOD_ANSWER), 1.0) == (False, None)
+
+
+def test_no_escalation_past_the_latency_budget_or_from_pro():
+    fast = router().route('ask', "What is the FRP price this year?")
+    # Half the 10s budget is the pro estimate before any pro call was observed
+    assert router().needs_escalation(fast, response("Ask your mill."), elapsed=6.0) == (False, None)
+
+    pro = router().route('analyze', "leaf", has_image=True, language='marathi')
+    assert router().needs_escalation(pro, response(""), elapsed=0.1) == (False, None)
+
+
+def test_stats_count_requests_and_escalations_per_tier():
+    r = router()
+    decision = r.route('ask', "What is the FRP price this year?")
+    r.record(decision, 0.5)
+    r.record(decision, 1.5, escalated=True, reason='short_answer')
+
+    assert r.stats() == [{'endpoint': 'ask', 'tier': TIER_FAST, 'model': 'fast-model', 'requests': 2,
+                          'escalations': 1, 'avg_latency_ms': 1000.0}]
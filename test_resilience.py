@@ -0,0 +1,84 @@
+"""Circuit breaker states and the pro-tier fallback while the pro model's circuit is open"""
+import asyncio
+import time
+
+import pytest
+
+from resilience import CircuitBreaker, CircuitOpen, ResilientCaller
+from upstream import UpstreamBusy
+
+
+def open_breaker(breaker):
+    for _ in range(breaker.min_calls):
+        breaker.record(False)
+    assert breaker.state == 'open'
+
+
+def test_breaker_opens_on_failures_and_rejects():
+    breaker = CircuitBreaker('model', window=10, min_calls=4, failure_ratio=0.5, open_seconds=30)
+    breaker.record(True)
+    breaker.record(False)
+    assert breaker.state == 'closed'
+    breaker.record(False)
+    breaker.record(False)
+    assert breaker.state == 'open'
+    with pytest.raises(CircuitOpen) as error:
+        breaker.check()
+    assert 1 <= error.value.retry_after <= 30
+
+
+def test_half_open_trial_closes_or_reopens():
+    breaker = CircuitBreaker('model', min_calls=2, open_seconds=0.05)
+    open_breaker(breaker)
+    time.sleep(0.06)
+    breaker.check()
+    # Only one trial at a time
+    with pytest.raises(CircuitOpen):
+        breaker.check()
+    breaker.record(False)
+    assert breaker.state == 'open'
+
+    time.sleep(0.06)
+    breaker.check()
+    breaker.record(True)
+    assert breaker.state == 'closed'
+
+
+def test_local_backpressure_on_the_trial_call_leaves_the_breaker_half_open():
+    caller = ResilientCaller(retries=0, hedge=False, breaker_min_calls=2, breaker_open_seconds=0.05)
+    breaker = caller.breaker('model')
+    open_breaker(breaker)
+    time.sleep(0.06)
+
+    async def busy():
+        raise UpstreamBusy(1)
+
+    async def answer():
+        return 'ok'
+
+    with pytest.raises(UpstreamBusy):
+        asyncio.run(caller.call('model', busy))
+    assert breaker.state == 'half_open'
+    # The trial slot was given back: the next call is the trial and decides
+    assert asyncio.run(caller.call('model', answer)) == 'ok'
+    assert breaker.state == 'closed'
+
+
+def test_long_pro_question_falls_back_to_fast_while_pro_is_open(app_module, client, monkeypatch):
+    decisions = []
+    record = app_module.model_router.record
+    monkeypatch.setattr(app_module.model_router, 'record',
+                        lambda decision, *args, **kwargs: decisions.append(decision) or record(decision, *args, **kwargs))
+    breaker = app_module.resilient.breaker(app_module.MODEL_PRO)
+    monkeypatch.setattr(breaker, '_opened_at', time.monotonic())
+
+    question = ("My sugarcane leaves show red rot spots and borer holes, what disease and pest "
+                "control should I use and when? ") * 4
+    response = client.post('/ask', json={"question": question, "language": "english"})
+
+    assert response.status_code == 200, response.get_json()
+    assert response.get_json()["response"]
+    decision = decisions[-1]
+    assert decision.tier == 'fast'
+    assert decision.model == app_module.MODEL_FAST
+    assert 'pro_unavailable' in decision.reasons
@@ -0,0 +1,58 @@
+"""Local hybrid retrieval: BM25 ranking, category filters and incremental refresh"""
+from ingest import ChunkStore, ingest
+from retrieval import LocalIndex, tokenize
+
+
+def write(path, text):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text, encoding='utf-8')
+
+
+def make_index(tmp_path):
+    docs = tmp_path / 'kb'
+    write(docs / 'diseases' / 'red_rot.txt',
+          "Red rot is a fungal disease of sugarcane. Red rot turns the inner cane red with white patches. "
+          "Remove red rot clumps and plant resistant setts.")
+    write(docs / 'diseases' / 'smut.txt',
+          "Smut shows a black whip from the cane top. Rogue out smut whips before they burst.")
+    write(docs / 'pest_control' / 'borer.txt',
+          "Early shoot borer causes dead hearts. A red rot outbreak is not caused by the borer.")
+    return reindex(tmp_path)
+
+
+def reindex(tmp_path):
+    """Bring the chunk store up to date and open an index over it"""
+    ingest([(str(tmp_path / 'kb'), None)], str(tmp_path / 'chunks'), workers=1)
+    return LocalIndex(str(tmp_path / 'index'), ChunkStore(str(tmp_path / 'chunks')))
+
+
+def test_tokenize_keeps_indic_vowel_signs_inside_words():
+    assert tokenize("Red-rot रोग गन्ना") == ['red', 'rot', 'रोग', 'गन्ना']
+
+
+def test_bm25_ranks_the_document_about_the_query_first(tmp_path):
+    index = make_index(tmp_path)
+    assert index.refresh()['added'] == 3
+
+    hits = index.search("red rot", k=3)
+    assert [hit['title'] for hit in hits][:2] == ['red_rot.txt', 'borer.txt']
+    assert hits[0]['category'] == 'diseases'
+    assert hits[0]['score'] > hits[1]['score']
+
+    assert [hit['title'] for hit in index.search("red rot", k=3, categories=['pest_control'])] == ['borer.txt']
+
+
+def test_refresh_indexes_only_changes_and_survives_a_reload(tmp_path):
+    index = make_index(tmp_path)
+    index.refresh()
+    assert index.refresh() == {'added': 0, 'changed': 0, 'removed': 0, 'chunks': 3}
+
+    (tmp_path / 'kb' / 'diseases' / 'smut.txt').unlink()
+    write(tmp_path / 'kb' / 'sugarcane' / 'wilt.txt', "Wilt dries the canes; the pith turns hollow.")
+    reindex(tmp_path)
+    result = index.refresh()
+    assert (result['added'], result['removed']) == (1, 1)
+
+    reopened = LocalIndex(str(tmp_path / 'index'), ChunkStore(str(tmp_path / 'chunks')))
+    assert reopened.search("hollow pith", k=1)[0]['title'] == 'wilt.txt'
+    assert not any(hit['title'] == 'smut.txt' for hit in reopened.search("smut whip"))
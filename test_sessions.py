@@ -0,0 +1,146 @@
+"""Multi-turn advisory sessions: storage, the history window, cached prefixes and /ask turns"""
+import json
+import threading
+import time
+
+from sessions import SessionStore
+
+
+def test_session_round_trip_and_delete(tmp_path):
+    store = SessionStore(str(tmp_path))
+    session = store.create('hindi')
+    store.append(session, "Leaves are yellow", "Check for iron deficiency")
+    store.save(session)
+
+    loaded = SessionStore(str(tmp_path)).get(session['id'])
+    assert [turn['text'] for turn in loaded['turns']] == ["Leaves are yellow", "Check for iron deficiency"]
+    assert store.public(loaded)['turns'] == 1
+
+    assert store.delete(session['id'])['id'] == session['id']
+    assert store.get(session['id']) is None
+    assert store.delete(session['id']) is None
+
+
+def test_unknown_malformed_and_expired_ids_are_not_found(tmp_path):
+    store = SessionStore(str(tmp_path), ttl_seconds=0.1)
+    assert store.get('0' * 32) is None
+    assert store.get('../../etc/passwd') is None
+
+    session = store.create('english')
+    time.sleep(0.15)
+    assert store.get(session['id']) is None
+
+
+def test_overflowing_history_keeps_the_last_turns_and_drops_the_cache(tmp_path):
+    store = SessionStore(str(tmp_path), window_tokens=50, keep_turns=2)
+    session = store.create('english')
+    store.append(session, "q1", "a1")
+    assert store.overflow(session) == []
+
+    for n in range(2, 5):
+        store.append(session, f"question {n} " * 5, f"answer {n} " * 5)
+    overflow = store.overflow(session)
+    assert len(overflow) == 6
+    assert overflow[0]['text'] == "q1"
+
+    cache = session['cache'] = {'name': 'cachedContents/1', 'model': 'm', 'expires_at': time.time() + 600}
+    # The old prefix no longer matches the history; it is handed back for deletion
+    assert store.fold(session, len(overflow), "Farmer asked about q1..q3") == cache
+    assert [turn['role'] for turn in session['turns']] == ['user', 'model']
+    assert session['summary'] == "Farmer asked about q1..q3"
+    assert session['cache'] is None
+
+
+def test_cached_prefix_is_used_only_for_its_model_and_before_it_expires(tmp_path):
+    store = SessionStore(str(tmp_path))
+    session = store.create('english')
+    session['cache'] = {'name': 'cachedContents/1', 'model': 'fast', 'expires_at': time.time() + 600}
+
+    assert store.live_cache(session, 'fast')['name'] == 'cachedContents/1'
+    assert store.live_cache(session, 'pro') is None
+    session['cache']['expires_at'] = time.time() + 10
+    assert store.live_cache(session, 'fast') is None
+
+
+def ask(client, **body):
+    response = client.post("/ask", json=dict(body, language="english"))
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()
+
+
+def texts(contents):
+    return " ".join(part.text for content in contents for part in content.parts if part.text)
+
+
+def test_session_continues_by_id_until_deleted(client, model_calls):
+    first = ask(client, question="My ratoon crop in black soil has yellowing leaves", session=True)
+    session_id = first["session_id"]
+    assert first["response"]
+
+    follow_up = ask(client, question="How much potash should I add?", session_id=session_id)
+    assert follow_up["session_id"] == session_id
+    # The follow-up is answered with the first turn in context
+    _, contents, config = model_calls[-1]
+    assert config.cached_content or "ratoon crop in black soil" in texts(contents)
+    assert "How much potash should I add?" in texts(contents)
+
+    session = client.get(f"/sessions/{session_id}").get_json()
+    assert (session["session_id"], session["turns"], session["language"]) == (session_id, 2, "english")
+
+    assert client.delete(f"/sessions/{session_id}").get_json() == {"deleted": session_id}
+    assert client.get(f"/sessions/{session_id}").status_code == 404
+    assert client.delete(f"/sessions/{session_id}").status_code == 404
+
+
+def test_streamed_turn_joins_the_session(client):
+    session_id = ask(client, question="Best planting season for sugarcane in Maharashtra?", session=True)["session_id"]
+
+    response = client.post("/ask/stream", json={"question": "And for the ratoon?", "language": "english",
+                                                "session_id": session_id})
+    assert response.mimetype == "text/event-stream"
+    done = response.get_data(as_text=True).strip().split("\n\n")[-1]
+    assert done.startswith("event: done")
+    assert json.loads(done.split("data: ", 1)[1])["session_id"] == session_id
+    assert client.get(f"/sessions/{session_id}").get_json()["turns"] == 2
+
+
+def test_unknown_session_id_starts_a_new_session(client):
+    answer = ask(client, question="Which fungicide for smut?", session_id="no-such-session")
+    assert answer["session_id"] != "no-such-session"
+    assert client.get(f"/sessions/{answer['session_id']}").get_json()["turns"] == 1
+
+
+def test_delete_waits_for_a_turn_in_progress_and_keeps_the_lock_file(tmp_path):
+    store = SessionStore(str(tmp_path), ttl_seconds=0.1)
+    session = store.create('english')
+    deleted = []
+    with store.locked(session['id']):
+        thread = threading.Thread(target=lambda: deleted.append(store.delete(session['id'])))
+        thread.start()
+        thread.join(0.2)
+        assert thread.is_alive() and deleted == []
+        store.save(dict(session, summary="saved by the turn"))
+    thread.join(5)
+
+    assert deleted[0]['summary'] == "saved by the turn"
+    assert store.get(session['id']) is None
+    lock_path = tmp_path / f"{session['id']}.json.lock"
+    assert lock_path.exists()
+
+    time.sleep(0.15)
+    store.prune()
+    assert not lock_path.exists()
+
+
+def test_escalated_turn_caches_the_prefix_for_the_pro_model(app_module, client, model_calls, monkeypatch):
+    monkeypatch.setitem(app_module.SESSION_CACHE_MIN_TOKENS, app_module.MODEL_FAST, 0)
+    monkeypatch.setitem(app_module.SESSION_CACHE_MIN_TOKENS, app_module.MODEL_PRO, 0)
+    monkeypatch.setattr(app_module.model_router, 'needs_escalation',
+                        lambda decision, response, elapsed: (decision.tier == 'fast', 'test'))
+
+    session_id = ask(client, question="Why are the leaf tips of my cane drying?", session=True)["session_id"]
+
+    assert [model for model, _, _ in model_calls] == [app_module.MODEL_FAST, app_module.MODEL_PRO]
+    session = app_module.session_store.get(session_id)
+    assert session['cache']['model'] == app_module.MODEL_PRO
+    assert session['tier'] == 'pro'
@@ -0,0 +1,95 @@
+"""Shared state: TTL semantics of add/update/incr and connections that stay per process"""
+import os
+import time
+
+import pytest
+
+from shared_state import SharedState
+
+
+@pytest.fixture
+def state(tmp_path):
+    return SharedState(str(tmp_path / 'state' / 'shared.db'))
+
+
+def test_nothing_is_opened_before_first_use(tmp_path):
+    path = tmp_path / 'state' / 'shared.db'
+    state = SharedState(str(path))
+    assert not path.exists()
+
+    state.set('ns', 'key', {'a': 1})
+    assert path.exists()
+    assert state.get('ns', 'key') == {'a': 1}
+
+
+def test_set_with_ttl_expires(state):
+    state.set('ns', 'short', 'value', ttl=0.05)
+    state.set('ns', 'forever', 'value')
+    assert 0 < state.expires_in('ns', 'short') <= 0.05
+    assert state.expires_in('ns', 'forever') is None
+
+    time.sleep(0.1)
+    assert state.get('ns', 'short', 'gone') == 'gone'
+    assert state.items('ns') == [('forever', 'value')]
+
+
+def test_add_only_stores_missing_or_expired_keys(state):
+    assert state.add('locks', 'job', 'first', ttl=0.05) is True
+    assert state.add('locks', 'job', 'second', ttl=0.05) is False
+    assert state.get('locks', 'job') == 'first'
+
+    time.sleep(0.1)
+    assert state.add('locks', 'job', 'third') is True
+    assert state.get('locks', 'job') == 'third'
+    # Without a TTL the key never expires, so it is never replaced
+    assert state.add('locks', 'job', 'fourth') is False
+
+
+def test_update_keeps_the_expiry_unless_given_a_ttl(state):
+    assert state.update('jobs', 'a', lambda job: {'n': 1}, ttl=10) == {'n': 1}
+    assert state.update('jobs', 'a', lambda job: dict(job, n=job['n'] + 1)) == {'n': 2}
+    assert 9 < state.expires_in('jobs', 'a') <= 10
+
+    state.update('jobs', 'a', lambda job: job, ttl=100)
+    assert state.expires_in('jobs', 'a') > 99
+
+    # fn returning None leaves the value and its expiry alone
+    assert state.update('jobs', 'a', lambda job: None, ttl=1) is None
+    assert state.get('jobs', 'a') == {'n': 2}
+    assert state.expires_in('jobs', 'a') > 99
+
+
+def test_update_sees_expired_values_as_missing(state):
+    state.set('jobs', 'a', {'n': 5}, ttl=0.05)
+    time.sleep(0.1)
+    seen = []
+    state.update('jobs', 'a', lambda job: seen.append(job) or {'n': 0})
+    assert seen == [None]
+    assert state.expires_in('jobs', 'a') is None
+
+
+def test_incr_counts_in_a_fixed_window(state):
+    assert state.incr('rate', 'client', ttl=0.2) == 1
+    first_expiry = state.expires_in('rate', 'client')
+    time.sleep(0.05)
+    assert state.incr('rate', 'client', amount=2, ttl=0.2) == 3
+    # Later increments do not push the window out
+    assert state.expires_in('rate', 'client') < first_expiry
+
+    time.sleep(0.25)
+    assert state.incr('rate', 'client', ttl=0.2) == 1
+
+
+def test_forked_child_opens_its_own_connection(state):
+    state.set('ns', 'parent', 1)
+    pid = os.fork()
+    if pid == 0:
+        ok = False
+        try:
+            ok = state.get('ns', 'parent') == 1 and state.incr('ns', 'child') == 1
+        finally:
+            os._exit(0 if ok else 1)
+    _, status = os.waitpid(pid, 0)
+
+    assert os.WEXITSTATUS(status) == 0
+    assert state.get('ns', 'child') == 1
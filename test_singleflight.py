@@ -0,0 +1,88 @@
+"""Coalescing of identical in-flight calls, and /analyze keys shared by the flight and the image cache"""
+import asyncio
+import io
+
+from singleflight import SingleFlight
+
+
+def test_concurrent_calls_of_one_key_share_one_call():
+    flights = SingleFlight('test')
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return 'answer'
+
+    async def main():
+        return await asyncio.gather(*(flights.run('key', work) for _ in range(5)), flights.run('other', work))
+
+    assert asyncio.run(main()) == ['answer'] * 6
+    assert len(calls) == 2
+    stats = flights.stats()
+    assert (stats['leaders'], stats['coalesced'], stats['in_flight']) == (2, 4, 0)
+
+
+def test_leader_error_reaches_waiters():
+    flights = SingleFlight('test')
+
+    async def fail():
+        await asyncio.sleep(0.05)
+        raise ValueError('upstream broke')
+
+    async def main():
+        return await asyncio.gather(*(flights.run('key', fail) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert all(isinstance(r, ValueError) for r in results)
+
+
+def test_waiter_takes_over_from_a_cancelled_leader():
+    flights = SingleFlight('test')
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.1)
+        return 'answer'
+
+    async def main():
+        leader = asyncio.ensure_future(flights.run('key', work))
+        await asyncio.sleep(0.01)
+        waiter = asyncio.ensure_future(flights.run('key', work))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        return await waiter
+
+    assert asyncio.run(main()) == 'answer'
+    assert len(calls) == 2
+    assert flights.stats()['handovers'] == 1
+
+
+def analyze(client, photo, question=None):
+    data = {"file": (io.BytesIO(photo), "leaf.jpg"), "language": "english"}
+    if question is not None:
+        data["question"] = question
+    return client.post("/analyze", data=data, content_type="multipart/form-data")
+
+
+def test_analysis_is_reused_only_for_the_same_question(client, crop_photo, model_calls):
+    photo = crop_photo(1901)
+
+    first = analyze(client, photo, "Why are the leaves yellow?")
+    assert first.status_code == 200, first.get_json()
+    assert "cached" not in first.get_json()
+
+    # Same photo, same question (normalized): served from the image cache
+    again = analyze(client, photo, "why are the leaves  yellow")
+    assert again.get_json().get("cached") == "perceptual"
+    assert len(model_calls) == 1
+
+    # Same photo, a different question: analyzed again, not served the first question's answer
+    other = analyze(client, photo, "Is this red rot or smut? The field has borer holes too and wilting canes")
+    assert "cached" not in other.get_json()
+    assert len(model_calls) == 2
+
+    without = analyze(client, photo)
+    assert "cached" not in without.get_json()
+    assert len(model_calls) == 3
@@ -0,0 +1,60 @@
+"""File search store registry: one store per display name, and which document contents it already has"""
+from types import SimpleNamespace
+
+from store_registry import StoreRegistry, file_sha256
+
+
+class StoreClient:
+    """Just the file_search_stores calls the registry makes, counted"""
+
+    def __init__(self, existing=()):
+        self.existing = list(existing)
+        self.created = []
+        self.file_search_stores = self
+
+    def list(self):
+        return self.existing
+
+    def create(self, config):
+        store = SimpleNamespace(name=f"fileSearchStores/new-{len(self.created)}", display_name=config['display_name'])
+        self.created.append(store)
+        return store
+
+
+def test_store_is_created_once_and_reattached_from_disk(tmp_path):
+    path = str(tmp_path / 'registry.json')
+    client = StoreClient()
+    store = StoreRegistry(path).get_or_create(client, 'kb')
+    assert len(client.created) == 1
+
+    # Another worker (or a restart) reattaches without creating a second store
+    again = StoreRegistry(path)
+    assert again.get_or_create(client, 'kb').name == store.name
+    assert again.lookup('kb').name == store.name
+    assert len(client.created) == 1
+
+
+def test_remote_store_with_the_same_name_is_adopted(tmp_path):
+    remote = SimpleNamespace(name='fileSearchStores/old', display_name='kb')
+    client = StoreClient([SimpleNamespace(name='fileSearchStores/other', display_name='x'), remote])
+    assert StoreRegistry(str(tmp_path / 'registry.json')).get_or_create(client, 'kb').name == 'fileSearchStores/old'
+    assert client.created == []
+
+
+def test_changed_document_content_is_not_taken_as_indexed(tmp_path):
+    registry = StoreRegistry(str(tmp_path / 'registry.json'))
+    registry.get_or_create(StoreClient(), 'kb')
+    document = tmp_path / 'guide.txt'
+    document.write_text("Plant setts 90 cm apart.")
+    digest = file_sha256(str(document))
+    assert not registry.is_indexed('kb', digest)
+
+    registry.mark_indexed('kb', digest, 'guide.txt')
+    assert registry.is_indexed('kb', digest)
+
+    document.write_text("Plant setts 120 cm apart.")
+    assert not registry.is_indexed('kb', file_sha256(str(document)))
+
+    registry.forget('kb')
+    assert registry.lookup('kb') is None
+    assert not registry.is_indexed('kb', digest)
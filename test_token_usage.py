@@ -0,0 +1,36 @@
+"""Token accounting: per-response X-Token-Usage and the /usage ledger"""
+import io
+
+
+def usage_header(response):
+    return dict(item.split("=") for item in response.headers["X-Token-Usage"].split(", "))
+
+
+def calls_and_prompt_tokens(client, endpoint):
+    report = client.get("/usage").get_json()
+    totals = report["endpoints"].get(endpoint, {"calls": 0, "prompt_tokens": 0})
+    return totals["calls"], totals["prompt_tokens"]
+
+
+def test_ask_reports_its_tokens_and_adds_them_to_the_ledger(client):
+    before = calls_and_prompt_tokens(client, "ask")
+    response = client.post("/ask", json={"question": "Which gap filling method suits ratoon fields?",
+                                         "language": "english"})
+
+    assert response.status_code == 200
+    usage = usage_header(response)
+    assert int(usage["prompt"]) > 0 and int(usage["output"]) > 0
+    calls, prompt_tokens = calls_and_prompt_tokens(client, "ask")
+    assert calls >= before[0] + 1
+    assert prompt_tokens >= before[1] + int(usage["prompt"])
+
+
+def test_analyze_reports_its_tokens(client, crop_photo):
+    before = calls_and_prompt_tokens(client, "analyze_crop_image")
+    response = client.post("/analyze", data={"file": (io.BytesIO(crop_photo(2101)), "leaf.jpg"),
+                                             "language": "marathi"}, content_type="multipart/form-data")
+
+    assert response.status_code == 200, response.get_json()
+    assert int(usage_header(response)["prompt"]) > 0
+    assert calls_and_prompt_tokens(client, "analyze_crop_image")[0] >= before[0] + 1
+    assert client.get("/usage").get_json()["languages"]["marathi"]["calls"] >= 1
@@ -0,0 +1,82 @@
+"""One upstream loop for every request: bounded concurrency, backpressure and streamed answers"""
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+from upstream import UpstreamBusy, UpstreamExecutor
+
+
+def test_calls_from_many_request_loops_are_bounded():
+    executor = UpstreamExecutor(max_concurrent=3, max_waiting=100, queue_timeout=10)
+    peak = []
+
+    async def call():
+        peak.append(executor.in_flight)
+        await asyncio.sleep(0.02)
+        return 'ok'
+
+    # Each Flask async view runs its own event loop; here each thread is one request
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(asyncio.run(executor.run(call)))) for _ in range(12)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == ['ok'] * 12
+    assert max(peak) == 3
+    assert executor.in_flight == executor.waiting == 0
+
+
+def test_full_queue_rejects_at_once():
+    executor = UpstreamExecutor(max_concurrent=1, max_waiting=0, queue_timeout=10)
+    release = threading.Event()
+
+    async def hold():
+        await asyncio.get_running_loop().run_in_executor(None, release.wait, 5)
+
+    held = threading.Thread(target=executor.run_sync, args=(hold,))
+    held.start()
+    try:
+        while executor.in_flight == 0:
+            time.sleep(0.01)
+        with pytest.raises(UpstreamBusy) as error:
+            executor.run_sync(hold)
+        assert error.value.retry_after >= 1
+        assert executor.rejected == 1
+    finally:
+        release.set()
+    held.join(5)
+
+
+@pytest.mark.parametrize("path, body", [
+    ("/ask", {"question": "How much urea per acre for ratoon sugarcane?", "language": "english"}),
+    ("/ask", {"question": "When should I earth up sugarcane?", "language": "english", "stream": True}),
+])
+def test_busy_upstream_answers_503_with_retry_after(app_module, client, monkeypatch, path, body):
+    # Starting the loop resets the counters, so start it before filling them
+    app_module.upstream._ensure_loop()
+    monkeypatch.setattr(app_module.upstream, "in_flight", app_module.upstream.max_concurrent)
+    monkeypatch.setattr(app_module.upstream, "waiting", app_module.upstream.max_waiting)
+
+    response = client.post(path, json=body)
+
+    assert response.status_code == 503
+    assert int(response.headers["Retry-After"]) >= 1
+    assert response.get_json()["retry_after"] >= 1
+
+
+def test_stream_flag_on_ask_returns_server_sent_events(client):
+    response = client.post("/ask", json={"question": "Which sugarcane varieties suit waterlogged fields?",
+                                         "language": "english", "stream": True})
+
+    assert response.status_code == 200
+    assert response.mimetype == "text/event-stream"
+    events = [block.split("\n") for block in response.get_data(as_text=True).strip().split("\n\n")]
+    names = [line[len("event: "):] for event in events for line in event if line.startswith("event: ")]
+    assert names[0] == "token" and names[-1] == "done"
+    done = json.loads(next(line[len("data: "):] for line in events[-1] if line.startswith("data: ")))
+    assert "sources" in done
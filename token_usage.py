@@ -0,0 +1,70 @@
+"""Token accounting for model calls, aggregated per endpoint, language and model"""
+KINDS = ('prompt', 'cached', 'output', 'thoughts')
+
+
+def usage_counts(usage_metadata):
+    """Token counts of one response's usage_metadata, or None when the response has none"""
+    if usage_metadata is None:
+        return None
+    return {
+        'prompt': usage_metadata.prompt_token_count or 0,
+        'cached': usage_metadata.cached_content_token_count or 0,
+        'output': usage_metadata.candidates_token_count or 0,
+        'thoughts': getattr(usage_metadata, 'thoughts_token_count', None) or 0,
+    }
+
+
+def _add(overall, groups, labels, field, value):
+    for totals in (overall,
+                   groups['endpoints'].setdefault(labels['endpoint'] or 'unknown', {}),
+                   groups['languages'].setdefault(labels['language'] or 'unknown', {}),
+                   groups['models'].setdefault(labels['model'] or 'unknown', {})):
+        totals[field] = totals.get(field, 0) + value
+
+
+def _summary(totals):
+    calls = totals.get('calls', 0)
+    summary = {'calls': calls}
+    for kind in KINDS:
+        summary[f'{kind}_tokens'] = totals.get(kind, 0)
+        summary[f'{kind}_tokens_per_call'] = round(totals.get(kind, 0) / calls, 1) if calls else 0.0
+    return summary
+
+
+class TokenLedger:
+    """Model calls and tokens as counters in the metrics registry, so every worker adds up
+
+    `prompt` includes `cached` (the part of the prompt served from a context cache);
+    `thoughts` are thinking tokens, billed as output on top of `output`.
+    """
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+        metrics.counter('model_calls_total', 'Model calls by endpoint, language and model')
+        metrics.counter('model_tokens_total', 'Model tokens by endpoint, language, model and kind')
+
+    def record(self, endpoint, language, model, usage_metadata):
+        """Count one call; returns its token counts (None when the response reported no usage)"""
+        labels = {'endpoint': endpoint, 'language': language, 'model': model}
+        self.metrics.inc('model_calls_total', **labels)
+        counts = usage_counts(usage_metadata)
+        if counts is not None:
+            for kind in KINDS:
+                if counts[kind]:
+                    self.metrics.inc('model_tokens_total', counts[kind], kind=kind, **labels)
+        return counts
+
+    def report(self):
+        """Totals overall and per endpoint, language and model, with tokens per call"""
+        overall = {}
+        groups = {'endpoints': {}, 'languages': {}, 'models': {}}
+        for labels, (calls,) in self.metrics.series('model_calls_total'):
+            _add(overall, groups, labels, 'calls', calls)
+        for labels, (count,) in self.metrics.series('model_tokens_total'):
+            _add(overall, groups, labels, labels['kind'], count)
+
+        report = {'total': _summary(overall)}
+        for group, entries in groups.items():
+            report[group] = {key: _summary(totals) for key, totals in sorted(entries.items())}
+        return report
+
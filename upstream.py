@@ -0,0 +1,165 @@
+"""Shared event loop and concurrency limit for upstream (Gemini) calls"""
+import asyncio
+import logging
+import math
+import os
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_STREAM_END = object()
+
+
+class UpstreamBusy(Exception):
+    """Raised when the upstream queue is full; carries a Retry-After hint in seconds"""
+
+    def __init__(self, retry_after, message="Upstream queue is full"):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class UpstreamExecutor:
+    """Runs async SDK calls on one background event loop per worker process
+
+    Request handlers (each Flask async view runs in its own short-lived loop) hand their
+    coroutines to this loop, so the SDK's async HTTP client and its connection pool live
+    in one place and hundreds of waiting requests cost only coroutines. At most
+    `max_concurrent` calls are in flight; up to `max_waiting` more may queue for
+    `queue_timeout` seconds, beyond that callers get UpstreamBusy straight away.
+    """
+
+    def __init__(self, max_concurrent=32, max_waiting=256, queue_timeout=10.0):
+        self.max_concurrent = max_concurrent
+        self.max_waiting = max_waiting
+        self.queue_timeout = queue_timeout
+        self._loop = None
+        self._pid = None
+        self._semaphore = None
+        self._start_lock = threading.Lock()
+        self.in_flight = 0
+        self.waiting = 0
+        self.rejected = 0
+        self._avg_seconds = 2.0
+
+    def _ensure_loop(self):
+        # Started lazily and again after fork - threads and loops do not survive fork()
+        if self._loop is not None and self._pid == os.getpid():
+            return self._loop
+        with self._start_lock:
+            if self._loop is None or self._pid != os.getpid():
+                loop = asyncio.new_event_loop()
+                ready = threading.Event()
+
+                def run():
+                    asyncio.set_event_loop(loop)
+                    self._semaphore = asyncio.Semaphore(self.max_concurrent)
+                    ready.set()
+                    loop.run_forever()
+
+                threading.Thread(target=run, name='upstream-loop', daemon=True).start()
+                ready.wait()
+                self.in_flight = self.waiting = 0
+                self._loop, self._pid = loop, os.getpid()
+        return self._loop
+
+    def retry_after(self):
+        """Seconds until a queued request would likely get a slot"""
+        backlog = self.waiting + 1
+        return max(1, math.ceil(self._avg_seconds * backlog / self.max_concurrent))
+
+    def check_capacity(self):
+        """Raise UpstreamBusy now if a new call would be rejected"""
+        if self.in_flight >= self.max_concurrent and self.waiting >= self.max_waiting:
+            self.rejected += 1
+            raise UpstreamBusy(self.retry_after())
+
+    async def _acquire(self):
+        self.check_capacity()
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise UpstreamBusy(self.retry_after(), "Timed out waiting for an upstream slot")
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+
+    def _release(self, seconds):
+        self.in_flight -= 1
+        self._semaphore.release()
+        self._avg_seconds = 0.9 * self._avg_seconds + 0.1 * seconds
+
+    async def _guarded(self, factory):
+        await self._acquire()
+        start = self._loop.time()
+        try:
+            return await factory()
+        finally:
+            self._release(self._loop.time() - start)
+
+    async def run(self, factory):
+        """Await factory() (a coroutine function) on the upstream loop from any event loop"""
+        future = asyncio.run_coroutine_threadsafe(self._guarded(factory), self._ensure_loop())
+        return await asyncio.wrap_future(future)
+
+    def run_sync(self, factory, timeout=None):
+        """Blocking variant of run() for synchronous code"""
+        future = asyncio.run_coroutine_threadsafe(self._guarded(factory), self._ensure_loop())
+        return future.result(timeout)
+
+    def submit(self, factory):
+        """Start factory() on the upstream loop without waiting; returns a concurrent Future"""
+        return asyncio.run_coroutine_threadsafe(self._guarded(factory), self._ensure_loop())
+
+    def iterate(self, factory, timeout=None):
+        """Consume an async iterator returned by `await factory()` from synchronous code
+
+        With `timeout` (seconds for the whole stream) the call is cancelled and TimeoutError
+        raised once it runs out; closing the iterator early cancels the call too.
+        """
+        items = queue.Queue()
+
+        async def pump():
+            try:
+                await self._acquire()
+            except BaseException as e:
+                items.put(e)
+                return
+            start = self._loop.time()
+            try:
+                async for item in await factory():
+                    items.put(item)
+                items.put(_STREAM_END)
+            except BaseException as e:
+                items.put(e)
+            finally:
+                self._release(self._loop.time() - start)
+
+        future = asyncio.run_coroutine_threadsafe(pump(), self._ensure_loop())
+        end = None if timeout is None else time.monotonic() + timeout
+        try:
+            while True:
+                try:
+                    item = items.get(timeout=None if end is None else max(0, end - time.monotonic()))
+                except queue.Empty:
+                    raise TimeoutError(f"Upstream stream did not finish within {timeout:g}s")
+                if item is _STREAM_END:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            future.cancel()
+
+    def stats(self):
+        """Current in-flight/waiting counts and rejections"""
+        return {
+            'in_flight': self.in_flight,
+            'waiting': self.waiting,
+            'rejected': self.rejected,
+            'max_concurrent': self.max_concurrent,
+            'max_waiting': self.max_waiting,
+        }